@@ -5,30 +5,73 @@ A portfolio-style data analysis script for retail sales data.
 This script performs comprehensive analysis of superstore sales data,
 answering key business questions about sales trends, product performance,
 regional analysis, customer segments, and profitability.
+
+The report is text only, so matplotlib and seaborn are not imported unless
+use_plot_style() is called. --summary prints just the executive summary from
+four columns, for cron jobs where import time outweighs the work.
+--customers prints the customer analysis (RFM segments, cohort retention,
+basket sizes) from an order index (see superstore/customers.py).
 """
 
+import argparse
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import warnings
 
+from superstore.aggregate import AggregationPlan
+from superstore.customers import build_order_index
+from superstore.engines import ENGINES, available_engines, check_parity, run_aggregations, spec_columns
+from superstore.filters import add_filter_arguments, describe_filters, filters_from_args
+from superstore.loader import load_orders
+
 # Configuration
 warnings.filterwarnings('ignore')
-plt.style.use('seaborn-v0_8-darkgrid')
-sns.set_palette('husl')
 
 # Constants
 DATA_PATH = 'data/superstore_sales.csv'
 
+# Every summary the report sections need, as (group keys, measure, reducer).
+# They are computed together in one pass so that no section rescans the data.
+REPORT_AGGREGATIONS = {
+    'yearly_sales': (['Year'], 'Sales', 'sum'),
+    'category_sales': (['Category'], 'Sales', 'sum'),
+    'category_profit': (['Category'], 'Profit', 'sum'),
+    'subcategory_sales': (['Sub-Category'], 'Sales', 'sum'),
+    'subcategory_profit': (['Sub-Category'], 'Profit', 'sum'),
+    'regional_sales': (['Region'], 'Sales', 'sum'),
+    'state_sales': (['State'], 'Sales', 'sum'),
+    'segment_sales': (['Segment'], 'Sales', 'sum'),
+    'segment_avg': (['Segment'], 'Sales', 'mean'),
+    'total_sales': ([], 'Sales', 'sum'),
+    'total_profit': ([], 'Profit', 'sum'),
+    'num_orders': ([], 'Order ID', 'nunique'),
+    'num_customers': ([], 'Customer ID', 'nunique'),
+}
+
+# The report reads only the columns its summaries use (plus Ship Date for the
+# delay column), never the wide name columns
+REPORT_COLUMNS = spec_columns(REPORT_AGGREGATIONS) + ['Ship Date']
+
+# The executive summary needs only these
+SUMMARY_COLUMNS = ['Order ID', 'Customer ID', 'Sales', 'Profit']
+
+
+def use_plot_style():
+    """Apply the report's chart style; imports matplotlib and seaborn on first use."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.style.use('seaborn-v0_8-darkgrid')
+    sns.set_palette('husl')
 
-def load_and_prepare_data(filepath):
-    """Load and prepare the sales data."""
+
+def load_and_prepare_data(filepath, workers=1, columns=None, filters=None):
+    """Load and prepare the sales data, optionally only some columns and matching rows."""
     print("Loading data...")
-    df = pd.read_csv(filepath)
-    
-    # Convert dates with error handling for mixed formats
-    df['Order Date'] = pd.to_datetime(df['Order Date'], format='mixed', errors='coerce')
-    df['Ship Date'] = pd.to_datetime(df['Ship Date'], format='mixed', errors='coerce')
+    # The shared loader applies the column schema and parses the date columns,
+    # reusing a cached snapshot when the file has not changed
+    df = load_orders(filepath, workers=workers, columns=columns, filters=filters)
     
     # Extract date components
     df['Year'] = df['Order Date'].dt.year
@@ -37,7 +80,8 @@ def load_and_prepare_data(filepath):
     
     # Calculate shipping delay in days with edge case handling
     # This handles: missing dates (NaT), mixed formats, and negative values
-    df['shipping_delay_days'] = (df['Ship Date'] - df['Order Date']).dt.days
+    if 'Ship Date' in df.columns:
+        df['shipping_delay_days'] = (df['Ship Date'] - df['Order Date']).dt.days
     
     print(f"✓ Data loaded: {df.shape[0]} rows, {df.shape[1]} columns")
     print(f"✓ Date range: {df['Order Date'].min()} to {df['Order Date'].max()}")
@@ -45,14 +89,40 @@ def load_and_prepare_data(filepath):
     return df
 
 
-def analyze_sales_trends(df):
+def compute_report_aggregations(df):
+    """Compute every summary in REPORT_AGGREGATIONS in a single pass."""
+    plan = AggregationPlan(df)
+    for name, (keys, measure, reducer) in REPORT_AGGREGATIONS.items():
+        plan.add(name, keys, measure, reducer)
+    return plan.run()
+
+
+def compute_report_aggregations_with(engine, filepath, workers=1, filters=None):
+    """Compute REPORT_AGGREGATIONS straight from the file on another engine (see superstore/engines.py)."""
+    print(f"Computing report summaries with {engine}...")
+    return run_aggregations(REPORT_AGGREGATIONS, filepath, engine=engine, workers=workers, filters=filters)
+
+
+def compute_summary_metrics(df):
+    """The totals generate_summary_report needs, from plain NumPy reductions."""
+    return {
+        'total_sales': float(np.nansum(df['Sales'].to_numpy(dtype=np.float64, na_value=np.nan))),
+        'total_profit': float(np.nansum(df['Profit'].to_numpy(dtype=np.float64, na_value=np.nan))),
+        'num_orders': int(df['Order ID'].nunique()),
+        'num_customers': int(df['Customer ID'].nunique()),
+    }
+
+
+def analyze_sales_trends(df, results=None):
     """Analyze sales trends over time."""
+    if results is None:
+        results = compute_report_aggregations(df)
     print("\n" + "="*50)
     print("SALES TRENDS ANALYSIS")
     print("="*50)
     
     # Yearly sales
-    yearly_sales = df.groupby('Year')['Sales'].sum().round(2)
+    yearly_sales = results['yearly_sales'].round(2)
     print("\nTotal Sales by Year:")
     for year, sales in yearly_sales.items():
         print(f"  {year}: ${sales:,.2f}")
@@ -66,14 +136,16 @@ def analyze_sales_trends(df):
     return yearly_sales
 
 
-def analyze_product_performance(df):
+def analyze_product_performance(df, results=None):
     """Analyze product category performance."""
+    if results is None:
+        results = compute_report_aggregations(df)
     print("\n" + "="*50)
     print("PRODUCT PERFORMANCE ANALYSIS")
     print("="*50)
     
     # Category sales
-    category_sales = df.groupby('Category')['Sales'].sum().sort_values(ascending=False).round(2)
+    category_sales = results['category_sales'].sort_values(ascending=False).round(2)
     total_sales = category_sales.sum()
     
     print("\nSales by Category:")
@@ -82,7 +154,7 @@ def analyze_product_performance(df):
         print(f"  {category}: ${sales:,.2f} ({pct:.1f}%)")
     
     # Top sub-categories
-    subcategory_sales = df.groupby('Sub-Category')['Sales'].sum().sort_values(ascending=False).head(5).round(2)
+    subcategory_sales = results['subcategory_sales'].sort_values(ascending=False).head(5).round(2)
     print("\nTop 5 Sub-Categories:")
     for i, (subcat, sales) in enumerate(subcategory_sales.items(), 1):
         print(f"  {i}. {subcat}: ${sales:,.2f}")
@@ -90,14 +162,16 @@ def analyze_product_performance(df):
     return category_sales
 
 
-def analyze_regional_performance(df):
+def analyze_regional_performance(df, results=None):
     """Analyze sales by region."""
+    if results is None:
+        results = compute_report_aggregations(df)
     print("\n" + "="*50)
     print("REGIONAL PERFORMANCE ANALYSIS")
     print("="*50)
     
     # Regional sales
-    regional_sales = df.groupby('Region')['Sales'].sum().sort_values(ascending=False).round(2)
+    regional_sales = results['regional_sales'].sort_values(ascending=False).round(2)
     total_sales = regional_sales.sum()
     
     print("\nSales by Region:")
@@ -106,7 +180,7 @@ def analyze_regional_performance(df):
         print(f"  {region}: ${sales:,.2f} ({pct:.1f}%)")
     
     # Top states
-    state_sales = df.groupby('State')['Sales'].sum().sort_values(ascending=False).head(5).round(2)
+    state_sales = results['state_sales'].sort_values(ascending=False).head(5).round(2)
     print("\nTop 5 States:")
     for i, (state, sales) in enumerate(state_sales.items(), 1):
         print(f"  {i}. {state}: ${sales:,.2f}")
@@ -114,14 +188,16 @@ def analyze_regional_performance(df):
     return regional_sales
 
 
-def analyze_customer_segments(df):
+def analyze_customer_segments(df, results=None):
     """Analyze customer segment performance."""
+    if results is None:
+        results = compute_report_aggregations(df)
     print("\n" + "="*50)
     print("CUSTOMER SEGMENT ANALYSIS")
     print("="*50)
     
     # Segment sales
-    segment_sales = df.groupby('Segment')['Sales'].sum().sort_values(ascending=False).round(2)
+    segment_sales = results['segment_sales'].sort_values(ascending=False).round(2)
     total_sales = segment_sales.sum()
     
     print("\nSales by Customer Segment:")
@@ -130,7 +206,7 @@ def analyze_customer_segments(df):
         print(f"  {segment}: ${sales:,.2f} ({pct:.1f}%)")
     
     # Average order value
-    segment_avg = df.groupby('Segment')['Sales'].mean().sort_values(ascending=False).round(2)
+    segment_avg = results['segment_avg'].sort_values(ascending=False).round(2)
     print("\nAverage Order Value by Segment:")
     for segment, avg in segment_avg.items():
         print(f"  {segment}: ${avg:,.2f}")
@@ -138,16 +214,18 @@ def analyze_customer_segments(df):
     return segment_sales
 
 
-def analyze_profitability(df):
+def analyze_profitability(df, results=None):
     """Analyze profitability across categories."""
+    if results is None:
+        results = compute_report_aggregations(df)
     print("\n" + "="*50)
     print("PROFITABILITY ANALYSIS")
     print("="*50)
     
     # Category profit and margin
-    category_metrics = df.groupby('Category').agg({
-        'Sales': 'sum',
-        'Profit': 'sum'
+    category_metrics = pd.DataFrame({
+        'Sales': results['category_sales'],
+        'Profit': results['category_profit']
     })
     category_metrics['Profit Margin %'] = (
         category_metrics['Profit'] / category_metrics['Sales'] * 100
@@ -161,9 +239,9 @@ def analyze_profitability(df):
         print(f"  {category}: ${profit:,.2f} (margin: {margin:.1f}%)")
     
     # Top profitable sub-categories
-    subcat_profit = df.groupby('Sub-Category').agg({
-        'Sales': 'sum',
-        'Profit': 'sum'
+    subcat_profit = pd.DataFrame({
+        'Sales': results['subcategory_sales'],
+        'Profit': results['subcategory_profit']
     })
     subcat_profit['Profit Margin %'] = (
         subcat_profit['Profit'] / subcat_profit['Sales'] * 100
@@ -179,18 +257,53 @@ def analyze_profitability(df):
     return category_metrics
 
 
-def generate_summary_report(df):
+def analyze_customers(index):
+    """Analyze customer value, retention and basket sizes from an OrderIndex."""
+    print("\n" + "="*50)
+    print("CUSTOMER ANALYSIS")
+    print("="*50)
+
+    summary = index.customer_summary()
+    print(f"\nCustomers: {index.n_customers:,} ({len(index):,} orders)")
+    print(f"  Orders per Customer: {summary['Orders'].mean():.2f}")
+    print(f"  Repeat Customers: {(summary['Orders'] > 1).mean() * 100:.1f}%")
+    print(f"  Average Spend per Customer: ${summary['Sales'].mean():,.2f}")
+
+    rfm = index.rfm()
+    print("\nTop RFM Segments (recency, frequency, monetary; 5 = best):")
+    for code, customers in rfm['RFM'].value_counts().head(5).items():
+        share = rfm.loc[rfm['RFM'] == code, 'Monetary'].sum() / rfm['Monetary'].sum() * 100
+        print(f"  {code}: {customers:,} customers, {share:.1f}% of sales")
+
+    retention = index.retention()
+    print("\nAverage Monthly Cohort Retention:")
+    for months in (1, 3, 6, 12):
+        if months in retention.columns and retention[months].notna().any():
+            print(f"  Month {months}: {retention[months].mean() * 100:.1f}%")
+
+    baskets = index.basket_sizes()
+    print("\nBasket Size (lines per order):")
+    for size, row in baskets.head(5).iterrows():
+        print(f"  {size}: {int(row['Orders']):,} orders ({row['Share'] * 100:.1f}%)")
+    print(f"  Mean: {index.lines.mean():.2f} lines, ${index.sales.mean():,.2f}")
+
+
+def generate_summary_report(df, results=None):
     """Generate overall summary report."""
+    if results is None:
+        results = compute_report_aggregations(df)
     print("\n" + "="*50)
     print("EXECUTIVE SUMMARY")
     print("="*50)
     
-    total_sales = df['Sales'].sum()
-    total_profit = df['Profit'].sum()
+    total_sales = results['total_sales']
+    total_profit = results['total_profit']
     overall_margin = (total_profit / total_sales * 100)
-    num_orders = df['Order ID'].nunique()
-    num_customers = df['Customer ID'].nunique()
-    avg_order_value = df.groupby('Order ID')['Sales'].sum().mean()
+    num_orders = results['num_orders']
+    num_customers = results['num_customers']
+    # Mean of per-order totals is total sales over the number of orders,
+    # so there is no need to group by Order ID a second time
+    avg_order_value = total_sales / num_orders
     
     print(f"\nKey Metrics:")
     print(f"  Total Sales: ${total_sales:,.2f}")
@@ -216,21 +329,61 @@ def generate_summary_report(df):
 
 def main():
     """Main execution function."""
+    parser = argparse.ArgumentParser(description="Superstore sales analysis report.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes used to parse the data file")
+    parser.add_argument('--engine', choices=ENGINES, default='pandas',
+                        help="compute engine for the report summaries")
+    parser.add_argument('--check-parity', action='store_true',
+                        help="check that every installed engine gives the same summaries, then exit")
+    parser.add_argument('--summary', action='store_true',
+                        help="print only the executive summary (reads four columns, no report summaries)")
+    parser.add_argument('--customers', action='store_true',
+                        help="print only the customer analysis (RFM, cohort retention, basket sizes)")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+    filters = filters_from_args(args)
+
+    if args.summary:
+        df = load_orders(DATA_PATH, workers=args.workers, columns=SUMMARY_COLUMNS, filters=filters)
+        print(f"Rows: {describe_filters(filters)} ({len(df):,} order lines)")
+        generate_summary_report(df, compute_summary_metrics(df))
+        return
+
+    if args.customers:
+        index = build_order_index(DATA_PATH, workers=args.workers, filters=filters)
+        print(f"Rows: {describe_filters(filters)}")
+        analyze_customers(index)
+        return
+
+    if args.check_parity:
+        engines = available_engines()
+        problems = check_parity(REPORT_AGGREGATIONS, DATA_PATH, engines, filters=filters)
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        print(f"{'Engines disagree' if problems else 'Engines agree to the cent'}: {', '.join(engines)}")
+        raise SystemExit(1 if problems else 0)
+
     print("="*50)
     print("SUPERSTORE SALES ANALYSIS")
     print("Portfolio Project - Data Analysis")
+    print(f"Rows: {describe_filters(filters)}")
     print("="*50)
     
-    # Load data
-    df = load_and_prepare_data(DATA_PATH)
-    
-    # Perform analyses
-    analyze_sales_trends(df)
-    analyze_product_performance(df)
-    analyze_regional_performance(df)
-    analyze_customer_segments(df)
-    analyze_profitability(df)
-    generate_summary_report(df)
+    # Compute all report summaries in one pass, then format each section.
+    # Other engines read the file themselves; the sections only use results.
+    if args.engine == 'pandas':
+        df = load_and_prepare_data(DATA_PATH, workers=args.workers, columns=REPORT_COLUMNS, filters=filters)
+        results = compute_report_aggregations(df)
+    else:
+        df = None
+        results = compute_report_aggregations_with(args.engine, DATA_PATH, workers=args.workers, filters=filters)
+    analyze_sales_trends(df, results)
+    analyze_product_performance(df, results)
+    analyze_regional_performance(df, results)
+    analyze_customer_segments(df, results)
+    analyze_profitability(df, results)
+    generate_summary_report(df, results)
     
     print("\n" + "="*50)
     print("Analysis Complete!")
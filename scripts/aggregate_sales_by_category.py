@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 """Aggregate sales by Category from data/raw/superstore.csv
 Writes CSV to visuals/sales_by_category.csv and a short summary to visuals/summary.txt
+
+Pass --max-memory-mb (or --chunksize) to stream the input in chunks instead of
+loading it all at once. --workers N parses the input with N processes.
+--years / --region / --segment / --category restrict the rows; only the
+Category and Sales columns (plus any filtered ones) are read either way.
 """
 from pathlib import Path
+import argparse
 import sys
 import csv
 
@@ -11,14 +17,48 @@ INPUT = ROOT / "data" / "raw" / "superstore.csv"
 OUT_CSV = ROOT / "visuals" / "sales_by_category.csv"
 OUT_SUM = ROOT / "visuals" / "summary.txt"
 
-def run_pandas():
-    import pandas as pd
-    df = pd.read_csv(INPUT)
+def run_pandas(workers=1, filters=None):
+    sys.path.insert(0, str(ROOT))
+    from superstore.loader import load_orders
+    df = load_orders(INPUT, workers=workers, columns=['Category', 'Sales'], filters=filters)
     if 'Category' not in df.columns or 'Sales' not in df.columns:
         raise SystemExit("Input CSV missing required 'Category' or 'Sales' columns")
-    # ensure Sales numeric
-    df['Sales'] = pd.to_numeric(df['Sales'], errors='coerce').fillna(0.0)
-    agg = df.groupby('Category', dropna=False)['Sales'].sum().reset_index()
+    # Sales is already float64 from the loader schema; only blanks need filling
+    df['Sales'] = df['Sales'].fillna(0.0)
+    agg = df.groupby('Category', dropna=False, observed=True)['Sales'].sum().reset_index()
+    agg = agg.sort_values('Sales', ascending=False)
+    OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
+    agg.to_csv(OUT_CSV, index=False)
+    lines = [f"{row['Category']}: {row['Sales']:.2f}" for _, row in agg.iterrows()]
+    return '\n'.join(lines)
+
+def category_totals(chunk):
+    from superstore.streaming import GroupedStats
+    return GroupedStats(['Category'], 'Sales').update(chunk)
+
+def run_streaming(chunksize=None, max_memory_mb=None, workers=1, filters=None):
+    sys.path.insert(0, str(ROOT))
+    from superstore.parallel import map_partitions, partition_bytes_for_budget
+    from superstore.streaming import DEFAULT_MEMORY_MB, GroupedStats, iter_order_chunks
+    # Only the two columns we need are parsed, one bounded chunk at a time
+    max_memory_mb = max_memory_mb or DEFAULT_MEMORY_MB
+    totals = GroupedStats(['Category'], 'Sales')
+    if workers > 1:
+        # Workers total their own slice of the file; merged here in file order
+        parts = map_partitions(
+            INPUT, category_totals, workers=workers, columns=['Category', 'Sales'],
+            partition_bytes=partition_bytes_for_budget(max_memory_mb, workers), filters=filters,
+        )
+        for part in parts:
+            totals.merge(part)
+    else:
+        chunks = iter_order_chunks(
+            INPUT, chunksize=chunksize, max_memory_mb=max_memory_mb, columns=['Category', 'Sales'],
+            filters=filters,
+        )
+        for chunk in chunks:
+            totals.update(chunk)
+    agg = totals.result()['sum'].rename('Sales').rename_axis('Category').reset_index()
     agg = agg.sort_values('Sales', ascending=False)
     OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
     agg.to_csv(OUT_CSV, index=False)
@@ -26,16 +66,27 @@ def run_pandas():
     return '\n'.join(lines)
 
 def run_csv():
+    # Fallback for machines without pandas. A plain csv.reader with column
+    # positions avoids building a dict per row, and the '$'/',' cleanup only
+    # runs for the rare value that float() cannot read directly.
     totals = {}
     with open(INPUT, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader)
+        cat_pos = header.index('Category')
+        sales_pos = header.index('Sales')
         for r in reader:
-            cat = (r.get('Category') or '').strip()
-            sales_raw = (r.get('Sales') or '0').replace('$','').replace(',','')
+            if len(r) <= max(cat_pos, sales_pos):
+                continue
+            cat = r[cat_pos].strip()
+            sales_raw = r[sales_pos]
             try:
                 s = float(sales_raw)
-            except Exception:
-                s = 0.0
+            except ValueError:
+                try:
+                    s = float(sales_raw.replace('$', '').replace(',', '') or 0)
+                except ValueError:
+                    s = 0.0
             totals[cat] = totals.get(cat, 0.0) + s
     rows = sorted(totals.items(), key=lambda x: -x[1])
     OUT_CSV.parent.mkdir(parents=True, exist_ok=True)
@@ -47,15 +98,39 @@ def run_csv():
     return '\n'.join(f"{cat}: {s:.2f}" for cat, s in rows)
 
 def main():
+    parser = argparse.ArgumentParser(description='Aggregate sales by Category.')
+    parser.add_argument('--chunksize', type=int, help='rows per chunk when streaming')
+    parser.add_argument('--max-memory-mb', type=int, help='stream the input within this memory budget')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to parse the input')
+    sys.path.insert(0, str(ROOT))
+    try:
+        from superstore.filters import add_filter_arguments, describe_filters, filters_from_args
+    except ImportError:
+        # No pandas: only the unfiltered csv fallback can run
+        filters_from_args = None
+    else:
+        add_filter_arguments(parser)
+    args = parser.parse_args()
+    filters = filters_from_args(args) if filters_from_args else []
+
     if not INPUT.exists():
         print(f"Input file not found: {INPUT}", file=sys.stderr)
         raise SystemExit(1)
+    streaming = args.chunksize is not None or args.max_memory_mb is not None
     try:
-        out = run_pandas()
+        if streaming:
+            out = run_streaming(args.chunksize, args.max_memory_mb, args.workers, filters)
+        else:
+            out = run_pandas(args.workers, filters)
     except Exception:
+        # The plain csv fallback cannot filter rows
+        if filters:
+            raise
         out = run_csv()
     with open(OUT_SUM, 'w', encoding='utf-8') as f:
         f.write('Sales by Category (aggregated)\n')
+        if filters:
+            f.write(f"Rows: {describe_filters(filters)}\n")
         f.write(out)
         f.write('\n')
     print(out)
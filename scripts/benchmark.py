@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Time the pipeline stages on synthetic data of growing size.
+
+For every size a synthetic extract in the data/superstore_sales.csv layout is
+generated once (see superstore/synthetic.py) and kept under
+data/cache/bench/. Each engine then runs its stages on it in a fresh process,
+so one run's memory does not inflate the next run's peak:
+
+    pandas     load (one process), clean, aggregate (analysis.py summaries), shipping KPIs
+    parallel   the same, with the CSV parsed by --workers processes
+    streaming  shipping KPIs computed chunk by chunk within --max-memory-mb
+    polars     aggregate (analysis.py summaries) on a lazy Polars scan of the CSV
+    duckdb     aggregate (analysis.py summaries) in an in-process DuckDB
+
+The polars and duckdb engines only run when those packages are installed.
+
+Stage timings, peak memory and throughput (rows/s) go to a CSV or JSON
+scaling report, and a rows/s table is printed per stage.
+
+The report also has the startup time of each entry point (engine
+"startup"): the wall time of ``<script> --help`` in a fresh interpreter,
+which is the import cost every cron run pays before reading any data.
+
+Run from repository root:
+    python scripts/benchmark.py
+    python scripts/benchmark.py --sizes 10k 1M 10M --engines pandas streaming --repeat 3
+    python scripts/benchmark.py --sizes 1M 10M --engines pandas polars duckdb
+    python scripts/benchmark.py --out data/cache/bench/report.json
+    python scripts/benchmark.py --sizes 10k --startup-repeat 10
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+from superstore.engines import available_engines
+from superstore.loader import CACHE_DIR
+from superstore.pipeline import Stage, run_stages, write_profile
+from superstore.synthetic import parse_row_count, write_orders
+
+BENCH_DIR = CACHE_DIR / 'bench'
+DEFAULT_SIZES = ['10k', '100k', '1M']
+PANDAS_ENGINES = ['pandas', 'parallel', 'streaming']
+ENGINES = PANDAS_ENGINES + ['polars', 'duckdb']
+DEFAULT_STREAMING_MEMORY_MB = 256
+
+# Entry points whose startup is timed; --help exits right after the imports
+STARTUP_SCRIPTS = {
+    'analysis': ROOT / 'analysis.py',
+    'shipping': ROOT / 'scripts' / 'run_shipping_analysis.py',
+    'notebooks': ROOT / 'scripts' / 'run_notebooks.py',
+    'pipeline': ROOT / 'scripts' / 'run_pipeline.py',
+    'serve': ROOT / 'scripts' / 'serve.py',
+}
+
+
+def dataset_path(rows, seed, dirty_rate):
+    return BENCH_DIR / f"orders_{rows}_seed{seed}_dirty{dirty_rate:g}.csv"
+
+
+def engine_stages(engine, path, rows, workers, max_memory_mb):
+    # Imported here so that only the benchmark processes pay for them
+    import analysis
+    import run_shipping_analysis as shipping
+    from superstore.engines import run_aggregations
+    from superstore.loader import load_orders
+
+    def load():
+        return load_orders(path, use_cache=False, workers=workers if engine == 'parallel' else 1)
+
+    def clean(df):
+        df['Year'] = df['Order Date'].dt.year
+        df['Month'] = df['Order Date'].dt.month
+        df['Quarter'] = df['Order Date'].dt.quarter
+        return shipping.add_delay_columns(df)
+
+    def shipping_kpis(df):
+        return shipping.compute_kpis(df)
+
+    def streaming_kpis():
+        return shipping.compute_kpis_streaming(path, max_memory_mb=max_memory_mb)
+
+    def engine_aggregate():
+        return run_aggregations(analysis.REPORT_AGGREGATIONS, path, engine=engine, workers=workers)
+
+    if engine == 'streaming':
+        return [Stage('shipping', streaming_kpis, rows=lambda kpis: kpis['total_records'])]
+    if engine in ('polars', 'duckdb'):
+        # These read the file themselves, so the stage covers load and aggregate
+        return [Stage('aggregate', engine_aggregate, rows=lambda results: rows)]
+    return [
+        Stage('load', load),
+        Stage('clean', clean, deps=['load']),
+        Stage('aggregate', analysis.compute_report_aggregations, deps=['clean']),
+        Stage('shipping', shipping_kpis, deps=['clean'], rows=lambda kpis: kpis['total_records']),
+    ]
+
+
+def run_engine(engine, path, rows, workers, max_memory_mb):
+    _, profile = run_stages(engine_stages(engine, path, rows, workers, max_memory_mb))
+    return profile
+
+
+def benchmark(sizes, engines, repeat, workers, max_memory_mb, seed, dirty_rate):
+    records = []
+    # A fresh interpreter per run keeps peak memory and warm caches separate
+    context = multiprocessing.get_context('spawn')
+    for rows in sizes:
+        path = dataset_path(rows, seed, dirty_rate)
+        if not path.exists():
+            start = time.perf_counter()
+            write_orders(path, rows, seed=seed, layout='sales', dirty_rate=dirty_rate)
+            print(f"Generated {rows:,} rows in {time.perf_counter() - start:.1f}s: {path}")
+        for engine in engines:
+            best = {}
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    profile = pool.submit(run_engine, engine, path, rows, workers, max_memory_mb).result()
+                # Keep each stage's fastest run
+                for record in profile:
+                    if record['stage'] not in best or record['wall_seconds'] < best[record['stage']]['wall_seconds']:
+                        best[record['stage']] = record
+            for record in best.values():
+                processed = record['rows_in'] if record['rows_in'] is not None else record['rows_out']
+                records.append({
+                    'rows': rows,
+                    'engine': engine,
+                    **record,
+                    'rows_per_second': round(processed / record['wall_seconds']) if record['wall_seconds'] else None,
+                })
+                print(f"{rows:>12,} {engine:<10} {record['stage']:<10} {record['wall_seconds']:>8.3f}s "
+                      f"{record['peak_rss_mb']:>8.1f} MB")
+    return records
+
+
+def measure_startup(repeat):
+    """The fastest of ``repeat`` ``--help`` runs of each entry point, as report records."""
+    records = []
+    for name, script in STARTUP_SCRIPTS.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, str(script), '--help'], cwd=ROOT, check=True,
+                           stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        records.append({'rows': 0, 'engine': 'startup', 'stage': name, 'wall_seconds': round(min(timings), 4)})
+    return records
+
+
+def scaling_table(records):
+    """Rows per second for each engine and stage (rows) at each size (columns)."""
+    report = pd.DataFrame([record for record in records if record['engine'] != 'startup'])
+    table = report.pivot_table(index=['engine', 'stage'], columns='rows', values='rows_per_second', sort=False)
+    table.columns = [f"{rows:,}" for rows in table.columns]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic data.')
+    parser.add_argument('--sizes', nargs='+', type=parse_row_count, default=[parse_row_count(size) for size in DEFAULT_SIZES],
+                        help='dataset sizes in rows, e.g. 10k 1M 100M')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES,
+                        default=[engine for engine in ENGINES if engine in PANDAS_ENGINES + available_engines()],
+                        help='engines to run (default: all installed)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per size and engine; the fastest is kept')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes used by the parallel engine')
+    parser.add_argument('--max-memory-mb', type=int, default=DEFAULT_STREAMING_MEMORY_MB,
+                        help='memory budget of the streaming engine')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic datasets')
+    parser.add_argument('--dirty-rate', type=float, default=0.01, help='share of injected bad records')
+    parser.add_argument('--startup-repeat', type=int, default=3,
+                        help='runs per entry point when timing startup; 0 skips it')
+    parser.add_argument('--out', type=Path, default=BENCH_DIR / 'report.csv',
+                        help='scaling report (.csv or .json)')
+    args = parser.parse_args()
+
+    missing = [engine for engine in args.engines if engine not in PANDAS_ENGINES + available_engines()]
+    if missing:
+        parser.error(f"not installed: {', '.join(missing)}")
+    records = benchmark(args.sizes, args.engines, args.repeat, args.workers, args.max_memory_mb,
+                        args.seed, args.dirty_rate)
+    startup = measure_startup(args.startup_repeat) if args.startup_repeat else []
+    # Startup records have fewer fields, so they go last for the CSV header
+    write_profile(records + startup, args.out)
+    print()
+    print('Rows per second:')
+    print(scaling_table(records).to_string(float_format=lambda value: f"{value:,.0f}"))
+    if startup:
+        print()
+        print('Startup (seconds to import and parse arguments):')
+        for record in startup:
+            print(f"  {record['stage']:<10} {record['wall_seconds']:.3f}")
+    print('Report written to', args.out)
+
+
+if __name__ == '__main__':
+    main()
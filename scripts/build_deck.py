@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Build the shipping charts and slide deck, rebuilding only what changed.
+
+The artifacts form a graph:
+
+    data/raw/superstore.csv
+      -> stats (KPIs, summary.txt, delay/sales points)
+        -> shipping_delay_hist.png, shipping_delay_boxplot.png, sales_vs_delay.png
+          -> slide_01.png, slide_02.png
+            -> slides.pdf
+
+Every artifact is content-hashed (see superstore/build.py). After a change to
+the data or to a chart's code only the affected artifacts are regenerated,
+with independent ones rendered in parallel.
+
+Run from repository root:
+    python scripts/build_deck.py                 # everything that is stale
+    python scripts/build_deck.py slides.pdf      # one target and its inputs
+    python scripts/build_deck.py --force --workers 4
+"""
+from pathlib import Path
+import argparse
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+import make_slides
+import run_shipping_analysis as shipping
+from superstore.build import BuildGraph
+from superstore.loader import CACHE_DIR, load_orders
+
+DATA = ROOT / 'data' / 'raw' / 'superstore.csv'
+VIS = ROOT / 'visuals'
+BUILD_DIR = CACHE_DIR / 'build'
+
+
+def build_stats(data_path, kpis_path, summary_path, points_path):
+    df = shipping.add_delay_columns(load_orders(data_path))
+    kpis = shipping.compute_kpis(df)
+    shipping.write_summary(kpis, summary_path)
+    with open(kpis_path, 'wb') as f:
+        pickle.dump(kpis, f)
+    # The scatter only needs these two columns, not the whole order table
+    np.savez(points_path, delay=df[shipping.DELAY].to_numpy(dtype=np.float64, na_value=np.nan),
+             sales=df['Sales'].to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def build_histogram(kpis_path, out_path):
+    shipping.draw_histogram(_load_kpis(kpis_path), out_path)
+
+
+def build_boxplot(kpis_path, out_path):
+    shipping.draw_boxplot(_load_kpis(kpis_path), out_path)
+
+
+def build_scatter(points_path, out_path):
+    with np.load(points_path) as points:
+        df = pd.DataFrame({shipping.DELAY: points['delay'], 'Sales': points['sales']})
+    shipping.draw_scatter(df, out_path)
+
+
+def _load_kpis(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def deck_graph():
+    kpis = BUILD_DIR / 'shipping_kpis.pkl'
+    points = BUILD_DIR / 'shipping_points.npz'
+    graph = BuildGraph(BUILD_DIR / 'state.json')
+    graph.add('stats', build_stats, inputs=[DATA], outputs=[kpis, VIS / 'summary.txt', points])
+    graph.add('shipping_delay_hist.png', build_histogram, inputs=[kpis], outputs=[VIS / 'shipping_delay_hist.png'])
+    graph.add('shipping_delay_boxplot.png', build_boxplot, inputs=[kpis], outputs=[VIS / 'shipping_delay_boxplot.png'])
+    graph.add('sales_vs_delay.png', build_scatter, inputs=[points], outputs=[VIS / 'sales_vs_delay.png'])
+    graph.add('slide_01.png', make_slides.make_slide_1,
+              inputs=[VIS / 'shipping_delay_hist.png', VIS / 'shipping_delay_boxplot.png'],
+              outputs=[VIS / 'slide_01.png'])
+    graph.add('slide_02.png', make_slides.make_slide_2,
+              inputs=[VIS / 'sales_vs_delay.png', VIS / 'summary.txt'],
+              outputs=[VIS / 'slide_02.png'])
+    graph.add('slides.pdf', build_pdf, inputs=[VIS / 'slide_01.png', VIS / 'slide_02.png'],
+              outputs=[VIS / 'slides.pdf'])
+    return graph
+
+
+def build_pdf(slide_1, slide_2, out_path):
+    make_slides.make_pdf([slide_1, slide_2], out_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the shipping charts and slides.')
+    parser.add_argument('targets', nargs='*', help='targets to build (default: all)')
+    parser.add_argument('--workers', type=int, help='processes used to render targets (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='rebuild even if nothing changed')
+    args = parser.parse_args()
+
+    results = deck_graph().build(args.targets or None, workers=args.workers, force=args.force)
+    for result in results:
+        timing = f" in {result.seconds:.2f}s" if result.status == 'built' else ''
+        print(f"{result.name}: {result.status}{timing}")
+
+
+if __name__ == '__main__':
+    main()
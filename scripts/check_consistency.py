@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Check that the summary layers agree with the order table they are built from.
+
+The checks run on the shipped extracts and on synthetic extracts (see
+superstore/synthetic.py) in both layouts, generated clean, with --dirty-rate
+bad records, and with --blank-rate of the cube's dimension values (Ship Mode,
+Segment, Region, ...) left blank:
+
+    cube     SalesCube row count and Sales / Profit / Quantity totals, as
+             built and after a save and load, against load_orders
+    engines  the analysis.py report summaries plus monthly and quarterly
+             sales on every installed engine (superstore/engines.py),
+             which must agree to the cent
+
+Every mismatch is printed and the exit status is 1 if there was any.
+
+Run from repository root:
+    python scripts/check_consistency.py
+    python scripts/check_consistency.py --rows 100k --dirty-rate 0.05
+"""
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from analysis import REPORT_AGGREGATIONS
+from superstore.cube import CUBE_DIMENSIONS, SalesCube, check_totals
+from superstore.engines import available_engines, check_parity, spec_columns
+from superstore.loader import RAW_DATA_PATH, load_orders, read_header
+from superstore.synthetic import LAYOUTS, default_template, generate_orders, parse_row_count, write_orders
+
+# The report summaries plus the derived date keys they do not group by
+PARITY_AGGREGATIONS = {
+    **REPORT_AGGREGATIONS,
+    'monthly_sales': (['Year', 'Month'], 'Sales', 'sum'),
+    'quarterly_rows': (['Year', 'Quarter'], None, 'count'),
+}
+
+SHIPPED_EXTRACTS = {
+    'raw extract': RAW_DATA_PATH,
+    'sales extract': ROOT / 'data' / 'superstore_sales.csv',
+}
+
+
+def synthetic_extracts(directory, rows, seed, dirty_rate, blank_rate):
+    """Write the synthetic extracts to ``directory`` and return their paths by name."""
+    template = default_template()
+    extracts = {}
+    for layout in LAYOUTS:
+        for name, rate in [('clean', 0.0), ('dirty', dirty_rate)]:
+            path = directory / f"{layout}_{name}.csv"
+            write_orders(path, rows, seed=seed, layout=layout, template=template, dirty_rate=rate)
+            extracts[f"synthetic {layout}, {name}"] = path
+
+        df = generate_orders(rows, seed=seed, layout=layout, template=template, dirty_rate=dirty_rate)
+        rng = np.random.default_rng(seed)
+        for column in CUBE_DIMENSIONS:
+            if column in df.columns:
+                df.loc[rng.random(len(df)) < blank_rate, column] = np.nan
+        path = directory / f"{layout}_blank.csv"
+        df.to_csv(path, index=False)
+        extracts[f"synthetic {layout}, blank dimensions"] = path
+    return extracts
+
+
+def check_cube(path, directory):
+    """Problems of the cube of ``path``, as built and as read back from disk."""
+    df = load_orders(path, use_cache=False)
+    cube = SalesCube.build(df)
+    cube_dir = directory / f"cube-{Path(path).stem}"
+    cube.save(cube_dir)
+    problems = check_totals(cube, df)
+    problems += [f"saved cube: {problem}" for problem in check_totals(SalesCube.load(cube_dir), df)]
+    return problems
+
+
+def check_engines(path, engines):
+    """Differences between the engines on the summaries whose columns ``path`` has."""
+    header = set(read_header(path))
+    specs = {
+        name: spec for name, spec in PARITY_AGGREGATIONS.items()
+        if set(spec_columns({name: spec})) <= header
+    }
+    return check_parity(specs, path, engines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=parse_row_count, default=parse_row_count('20k'),
+                        help='rows per synthetic extract, e.g. 20k or 1M')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic extracts')
+    parser.add_argument('--dirty-rate', type=float, default=0.01, help='share of injected bad records')
+    parser.add_argument('--blank-rate', type=float, default=0.01,
+                        help='share of blanked values in each cube dimension')
+    args = parser.parse_args()
+
+    engines = available_engines()
+    if len(engines) < 2:
+        print(f"engines  skipped: only {', '.join(engines)} is installed")
+    failed = False
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        extracts = {name: path for name, path in SHIPPED_EXTRACTS.items() if Path(path).exists()}
+        extracts.update(synthetic_extracts(scratch, args.rows, args.seed, args.dirty_rate, args.blank_rate))
+        for name, path in extracts.items():
+            problems = check_cube(path, scratch)
+            print(f"cube     {name:<40} {'ok' if not problems else 'FAILED'}")
+            for problem in problems:
+                print(f"    {problem}")
+            failed |= bool(problems)
+        if len(engines) > 1:
+            for name, path in extracts.items():
+                problems = check_engines(path, engines)
+                print(f"engines  {name:<40} {'ok' if not problems else 'FAILED'}")
+                for problem in problems:
+                    print(f"    {problem}")
+                failed |= bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Write a synthetic Superstore order extract of any size.
+
+Rows follow the layout and distributions of the real raw extract (see
+superstore/synthetic.py). They are generated a chunk at a time, so the output
+can be much larger than memory.
+
+Run from repository root:
+    python scripts/generate_orders.py 1M
+    python scripts/generate_orders.py 100M --out data/cache/bench/orders_100M.csv --dirty-rate 0.01
+    python scripts/generate_orders.py 50k --layout sales --customers 2000 --products 500
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from superstore.loader import CACHE_DIR
+from superstore.synthetic import DEFAULT_CHUNK_ROWS, LAYOUTS, parse_row_count, write_orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic Superstore order extract.')
+    parser.add_argument('rows', type=parse_row_count, help='number of order lines, e.g. 10k, 1M, 100M')
+    parser.add_argument('--out', type=Path, help='output CSV (default: data/cache/synthetic/orders_<rows>.csv)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='raw',
+                        help="'raw' like data/raw/superstore.csv, 'sales' like data/superstore_sales.csv")
+    parser.add_argument('--customers', type=parse_row_count, help='number of distinct customers')
+    parser.add_argument('--products', type=parse_row_count, help='number of distinct products')
+    parser.add_argument('--dirty-rate', type=float, default=0.0,
+                        help='share of rows turned into bad records (bad dates, missing values, ...)')
+    parser.add_argument('--chunk-rows', type=parse_row_count, default=DEFAULT_CHUNK_ROWS,
+                        help='rows generated per chunk')
+    args = parser.parse_args()
+
+    out = args.out or CACHE_DIR / 'synthetic' / f"orders_{args.rows}.csv"
+    start = time.perf_counter()
+    dirty = write_orders(
+        out, args.rows, seed=args.seed, chunk_rows=args.chunk_rows, layout=args.layout,
+        n_customers=args.customers, n_products=args.products, dirty_rate=args.dirty_rate,
+    )
+    print(f"Wrote {args.rows:,} rows to {out} in {time.perf_counter() - start:.1f}s")
+    if args.dirty_rate:
+        print('Dirty records:', ', '.join(f"{kind}={count}" for kind, count in dirty.items()))
+
+
+if __name__ == '__main__':
+    main()
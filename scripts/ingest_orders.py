@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Convert an order extract into a dataset partitioned by order year and month.
+
+The dataset (see superstore/partitions.py) has one year=YYYY/month=MM
+directory per order month and an index.json with the row count and min/max
+statistics of every partition. Any loader given the dataset directory
+instead of the CSV skips the partitions its filters rule out, e.g.
+
+    python scripts/run_notebooks.py --dataset data/partitioned/superstore --months 2017-01 2017-03 --out-dir data/processed/q1_2017
+
+The dataset is only rebuilt when the extract has changed (or with --force).
+
+Run from repository root:
+    python scripts/ingest_orders.py
+    python scripts/ingest_orders.py data/cache/bench/orders_10000000.csv --out data/partitioned/orders_10M --workers 4
+"""
+from pathlib import Path
+import argparse
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from superstore.loader import RAW_DATA_PATH
+from superstore.partitions import default_dataset_dir, ingest, partition_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write an order extract as a year/month partitioned dataset.')
+    parser.add_argument('source', nargs='?', type=Path, default=RAW_DATA_PATH, help='order extract (CSV)')
+    parser.add_argument('--out', type=Path, help='dataset directory (default: data/partitioned/<file name>)')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to parse the extract')
+    parser.add_argument('--force', action='store_true', help='rebuild even if the extract has not changed')
+    args = parser.parse_args()
+
+    out = args.out or default_dataset_dir(args.source)
+    start = time.perf_counter()
+    index = ingest(args.source, out, workers=args.workers, force=args.force)
+    summary = partition_summary(index)
+    print(summary.to_string(index=False))
+    print(f"{index['rows']:,} rows in {len(summary)} partitions at {out} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
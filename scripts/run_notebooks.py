@@ -9,60 +9,245 @@ Produces:
 
 Run from repository root:
     python scripts/run_notebooks.py
+
+Nightly refreshes can pass --incremental to parse only the rows appended to
+the raw file since the previous incremental run. --max-memory-mb streams the
+raw file in chunks that fit the given memory budget instead. --workers N
+spreads the parsing over N processes.
+
+--dataset reads a year/month partitioned dataset (scripts/ingest_orders.py)
+instead of the raw file. --months / --years and the other filter options
+restrict the exports to matching orders; with a dataset only the partitions
+of those months are read. Filtered exports go to --out-dir so that the full
+exports are not overwritten.
+
+--execute runs the notebooks themselves headless, all at once in separate
+kernels, with --start / --end injected as their date range. The data they
+read is prepared once beforehand (snapshot and partial sums), the executed
+copies go to --executed-dir and the wall time of each notebook is printed
+and written to timings.csv there:
+    python scripts/run_notebooks.py --execute
+    python scripts/run_notebooks.py --execute 03_monthly_sales_trends --start 2017-01-01 --end 2017-12-31
+
+--trends FREQ also writes the trend tables of the dashboards (totals,
+rolling 3- and 12-month sums, growth, YoY and running totals per day, week,
+month or quarter; see superstore/timeseries.py) overall and per Category,
+Segment and Region. On the raw file the daily series behind them is kept
+between runs and only extended with the rows appended since:
+    python scripts/run_notebooks.py --trends day
 """
+import argparse
 import os
+import sys
+
 import pandas as pd
 
 repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+from superstore.cube import load_cube
+from superstore.filters import add_filter_arguments, describe_filters, filters_from_args
+from superstore.incremental import merge_partials, partial_sums, refresh_partials
+from superstore.loader import CACHE_DIR, load_orders
+from superstore.notebooks import DEFAULT_CELL_TIMEOUT, NOTEBOOKS, run_notebooks
+from superstore.parallel import map_partitions, partition_bytes_for_budget
+from superstore.pipeline import write_profile
+from superstore.streaming import iter_order_chunks
+from superstore.timeseries import DEFAULT_DIMENSIONS, FREQUENCIES, SalesTimeSeries, refresh_timeseries
+
 raw_path = os.path.join(repo_root, 'data', 'raw', 'superstore.csv')
 out_dir = os.path.join(repo_root, 'data', 'processed')
+partial_columns = ['Order Date', 'Segment', 'Category', 'Sales']
+notebook_cache_dir = os.path.join(CACHE_DIR, 'notebooks')
+
+
+def load_partials(args, filters=None):
+    # Every export below is a roll-up of Sales by month, segment and category, so
+    # they are all built from one small table of partial sums instead of
+    # rescanning the order rows. Rows without a parsed Order Date or a Sales value
+    # never reach the totals.
+    if args.dataset or filters:
+        # Only the four partial columns are read, and from a dataset only the
+        # partitions whose months can match the filters
+        df = load_orders(args.dataset or raw_path, workers=args.workers, columns=partial_columns, filters=filters)
+        if 'partitions_read' in df.attrs:
+            print(f"Partitions read: {df.attrs['partitions_read']} of {df.attrs['partitions_total']}")
+        return partial_sums(df)
+
+    if args.incremental:
+        partials, info = refresh_partials(raw_path, workers=args.workers)
+        print(f"Refresh mode: {info['mode']} ({info['new_rows']} new rows)")
+        if info['mode'] == 'incremental':
+            print('Months updated:', ', '.join(info['affected_months']))
+        return partials
+
+    if args.max_memory_mb and args.workers > 1:
+        # Each worker sums its own slice of the file; the slices are merged in file order
+        chunk_partials = map_partitions(
+            raw_path, partial_sums, workers=args.workers, columns=partial_columns,
+            partition_bytes=partition_bytes_for_budget(args.max_memory_mb, args.workers),
+        )
+    elif args.max_memory_mb:
+        chunk_partials = (
+            partial_sums(chunk)
+            for chunk in iter_order_chunks(raw_path, max_memory_mb=args.max_memory_mb, columns=partial_columns)
+        )
+    else:
+        return cube_partials(load_cube(raw_path, workers=args.workers))
+
+    partials = None
+    for chunk_sums in chunk_partials:
+        partials = chunk_sums if partials is None else merge_partials(partials, chunk_sums)
+    return partials
+
+
+def cube_partials(cube):
+    """Sales sums per Year x Month x Segment x Category rolled up from the cube."""
+    partial_keys = [key for key in ['Year', 'Month', 'Segment', 'Category'] if key in cube.dimensions]
+    partials = cube.query(by=partial_keys, measures=['Sales'])
+    # The cube keeps rows without an Order Date in a missing month, which the
+    # exports leave out; a missing Segment or Category still counts towards
+    # the monthly totals
+    return partials.dropna(subset=['Year', 'Month']).reset_index(drop=True)
+
+
+def write_exports(partials, out_dir=out_dir):
+    """Write the notebook CSVs from a table of Year/Month/Segment/Category sales sums."""
+    os.makedirs(out_dir, exist_ok=True)
+    exports = {}
+
+    # First-of-month date for each partial, used as the Month column in exports
+    partials['Month Start'] = pd.to_datetime(pd.DataFrame({
+        'year': partials['Year'].astype(int),
+        'month': partials['Month'].astype(int),
+        'day': 1,
+    }))
 
-os.makedirs(out_dir, exist_ok=True)
-
-print('Reading:', raw_path)
-if not os.path.exists(raw_path):
-    raise FileNotFoundError(f"Raw data not found at {raw_path}")
-
-# Load with parsing if possible
-try:
-    df = pd.read_csv(raw_path, parse_dates=['Order Date'], low_memory=False)
-except Exception:
-    df = pd.read_csv(raw_path, low_memory=False)
-    df['Order Date'] = pd.to_datetime(df.get('Order Date'), errors='coerce')
-
-# Basic cleaning
-df['Sales'] = pd.to_numeric(df['Sales'], errors='coerce')
-df = df.dropna(subset=['Order Date', 'Sales'])
-
-# Monthly aggregation
-df['Month'] = df['Order Date'].dt.to_period('M').dt.to_timestamp()
-monthly = df.groupby('Month', dropna=False)['Sales'].sum().reset_index()
-monthly.to_csv(os.path.join(out_dir, 'monthly_sales.csv'), index=False)
-print('Wrote:', os.path.join(out_dir, 'monthly_sales.csv'))
-
-# Sales by segment
-if 'Segment' in df.columns:
-    seg = df.groupby('Segment')['Sales'].sum().reset_index().sort_values('Sales', ascending=False)
-    seg.to_csv(os.path.join(out_dir, 'sales_by_segment.csv'), index=False)
-    print('Wrote:', os.path.join(out_dir, 'sales_by_segment.csv'))
-else:
-    print('Warning: no Segment column found')
-
-# Sales by category
-if 'Category' in df.columns:
-    cat = df.groupby('Category')['Sales'].sum().reset_index().sort_values('Sales', ascending=False)
-    cat.to_csv(os.path.join(out_dir, 'sales_by_category.csv'), index=False)
-    print('Wrote:', os.path.join(out_dir, 'sales_by_category.csv'))
-
-    # Monthly x Category pivot
-    monthly_cat = (
-        df.groupby([df['Order Date'].dt.to_period('M').dt.to_timestamp(), 'Category'])['Sales']
-        .sum().reset_index().pivot(index=0, columns=1, values='Sales').fillna(0)
+    # Monthly aggregation
+    monthly = partials.groupby('Month Start')['Sales'].sum().reset_index()
+    monthly = monthly.rename(columns={'Month Start': 'Month'})
+    exports['monthly_sales'] = monthly
+    monthly.to_csv(os.path.join(out_dir, 'monthly_sales.csv'), index=False)
+    print('Wrote:', os.path.join(out_dir, 'monthly_sales.csv'))
+
+    # Sales by segment
+    if 'Segment' in partials.columns:
+        seg = partials.groupby('Segment')['Sales'].sum().reset_index().sort_values('Sales', ascending=False)
+        exports['sales_by_segment'] = seg
+        seg.to_csv(os.path.join(out_dir, 'sales_by_segment.csv'), index=False)
+        print('Wrote:', os.path.join(out_dir, 'sales_by_segment.csv'))
+    else:
+        print('Warning: no Segment column found')
+
+    # Sales by category
+    if 'Category' in partials.columns:
+        cat = partials.groupby('Category')['Sales'].sum().reset_index().sort_values('Sales', ascending=False)
+        exports['sales_by_category'] = cat
+        cat.to_csv(os.path.join(out_dir, 'sales_by_category.csv'), index=False)
+        print('Wrote:', os.path.join(out_dir, 'sales_by_category.csv'))
+
+        # Monthly x Category pivot
+        monthly_cat = (
+            partials.groupby(['Month Start', 'Category'])['Sales']
+            .sum().reset_index().pivot(index='Month Start', columns='Category', values='Sales').fillna(0)
+        )
+        monthly_cat.index.name = 'Month'
+        monthly_cat.columns.name = None
+        exports['monthly_sales_by_category'] = monthly_cat
+        monthly_cat.to_csv(os.path.join(out_dir, 'monthly_sales_by_category.csv'))
+        print('Wrote:', os.path.join(out_dir, 'monthly_sales_by_category.csv'))
+    else:
+        print('Warning: no Category column found')
+
+    return exports
+
+
+def write_trends(args, filters=None, out_dir=out_dir):
+    """Write the trend tables at ``args.trends`` granularity, overall and per dimension."""
+    if args.dataset or filters:
+        columns = ['Order Date', 'Sales'] + DEFAULT_DIMENSIONS
+        series = SalesTimeSeries().update(
+            load_orders(args.dataset or raw_path, workers=args.workers, columns=columns, filters=filters)
+        )
+    else:
+        series, info = refresh_timeseries(raw_path, workers=args.workers)
+        print(f"Daily series: {info['mode']} ({info['new_rows']} new rows)")
+
+    os.makedirs(out_dir, exist_ok=True)
+    for dimension in [None] + DEFAULT_DIMENSIONS:
+        suffix = '' if dimension is None else f"_by_{dimension.lower()}"
+        path = os.path.join(out_dir, f"sales_trends_{args.trends}{suffix}.csv")
+        series.trends(args.trends, dimension=dimension).to_csv(path, index=False)
+        print('Wrote:', path)
+
+
+def execute_notebooks(args):
+    """Run the selected notebooks side by side and report how long each took."""
+    names = args.execute or NOTEBOOKS
+    executed_dir = args.executed_dir or os.path.join(notebook_cache_dir, 'executed')
+    print(f"Executing {len(names)} notebooks ({args.parallel or len(names)} at a time)")
+    records = run_notebooks(
+        names, executed_dir, notebook_cache_dir, start=args.start, end=args.end,
+        parallel=args.parallel, timeout=args.timeout,
     )
-    monthly_cat.index.name = 'Month'
-    monthly_cat.to_csv(os.path.join(out_dir, 'monthly_sales_by_category.csv'))
-    print('Wrote:', os.path.join(out_dir, 'monthly_sales_by_category.csv'))
-else:
-    print('Warning: no Category column found')
+    for record in records:
+        line = f"  {record['notebook']:<35} {record['wall_seconds']:>8.2f}s  {record['status']}"
+        print(line + (f" ({record['error']})" if record['error'] else ''))
+    timings_path = os.path.join(executed_dir, 'timings.csv')
+    write_profile(records, timings_path)
+    print('Timings written to', timings_path)
+    return all(record['status'] == 'ok' for record in records)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='only process rows appended since the last incremental run')
+    arg_parser.add_argument('--max-memory-mb', type=int,
+                            help='stream the raw file in chunks that fit this memory budget')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='number of processes used to parse the raw file')
+    arg_parser.add_argument('--dataset',
+                            help='read this partitioned dataset (scripts/ingest_orders.py) instead of the raw file')
+    arg_parser.add_argument('--out-dir', help='where the exports are written (default: data/processed)')
+    arg_parser.add_argument('--execute', nargs='*', choices=NOTEBOOKS, metavar='NOTEBOOK',
+                            help='execute these notebooks (default: all) instead of writing the exports')
+    arg_parser.add_argument('--parallel', type=int,
+                            help='notebooks executed at the same time (default: all of them)')
+    arg_parser.add_argument('--start', help='first order date the executed notebooks look at (YYYY-MM-DD)')
+    arg_parser.add_argument('--end', help='last order date the executed notebooks look at (YYYY-MM-DD)')
+    arg_parser.add_argument('--executed-dir', help='where executed notebooks and timings.csv are written')
+    arg_parser.add_argument('--timeout', type=int, default=DEFAULT_CELL_TIMEOUT,
+                            help='seconds a notebook cell may run')
+    arg_parser.add_argument('--trends', choices=FREQUENCIES,
+                            help='also write the sales trend tables at this granularity')
+    add_filter_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    filters = filters_from_args(args)
+    if args.execute is not None:
+        if not execute_notebooks(args):
+            sys.exit(1)
+        return
+    if filters and not args.out_dir:
+        arg_parser.error('filtered exports need --out-dir so that the full exports are not overwritten')
+    if args.incremental and (filters or args.dataset):
+        arg_parser.error('--incremental reads the raw file; it cannot be combined with --dataset or filters')
+
+    source = args.dataset or raw_path
+    print('Reading:', source)
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Raw data not found at {source}")
+    if filters:
+        print('Rows:', describe_filters(filters))
+
+    partials = load_partials(args, filters)
+
+    write_exports(partials, args.out_dir or out_dir)
+    if args.trends:
+        write_trends(args, filters, args.out_dir or out_dir)
+
+    print('Done.')
+
 
-print('Done.')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Run the whole nightly pipeline and profile every stage.
+
+The stages and what they read:
+
+    load       raw order file
+    clean      load       (parsed dates, shipping delay columns)
+    aggregate  clean      (sales cube)
+    shipping   clean      (shipping KPIs, summary.txt)
+    export     aggregate  (data/processed/*.csv)
+    charts     clean, shipping
+    slides     charts, shipping
+
+For each stage the runner records wall time, CPU time, peak resident memory
+and rows in/out (see superstore/pipeline.py), prints them as a table and can
+write them as JSON or CSV. --profile-stage runs a stage under cProfile (or
+pyinstrument with --profiler pyinstrument) and keeps the dump.
+
+Run from repository root:
+    python scripts/run_pipeline.py
+    python scripts/run_pipeline.py export --workers 4
+    python scripts/run_pipeline.py --profile-out data/cache/profile.json --profile-stage shipping
+"""
+from pathlib import Path
+import argparse
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+import run_notebooks
+import run_shipping_analysis as shipping
+from superstore.cube import SalesCube
+from superstore.loader import CACHE_DIR, load_orders
+from superstore.pipeline import PROFILERS, Stage, format_profile, run_stages, write_profile
+
+DATA = ROOT / 'data' / 'raw' / 'superstore.csv'
+VIS = ROOT / 'visuals'
+PROFILE_DIR = CACHE_DIR / 'profiles'
+
+
+def pipeline_stages(args):
+    def load():
+        return load_orders(DATA, workers=args.workers)
+
+    def clean(df):
+        return shipping.add_delay_columns(df, args.long_delay_days)
+
+    def aggregate(df):
+        return SalesCube.build(df)
+
+    def shipping_kpis(df):
+        kpis = shipping.compute_kpis(df, args.long_delay_days)
+        shipping.write_summary(kpis, VIS / 'summary.txt')
+        return kpis
+
+    def export(cube):
+        return run_notebooks.write_exports(run_notebooks.cube_partials(cube))
+
+    def charts(df, kpis):
+        shipping.draw_charts(kpis, df)
+        return [VIS / 'shipping_delay_hist.png', VIS / 'shipping_delay_boxplot.png', VIS / 'sales_vs_delay.png']
+
+    def slides(chart_paths, kpis):
+        # Pillow is only needed by this stage
+        import make_slides
+
+        hist, box, scatter = chart_paths
+        make_slides.make_slide_1(hist, box, VIS / 'slide_01.png')
+        make_slides.make_slide_2(scatter, VIS / 'summary.txt', VIS / 'slide_02.png')
+        make_slides.make_pdf([VIS / 'slide_01.png', VIS / 'slide_02.png'], VIS / 'slides.pdf')
+        return VIS / 'slides.pdf'
+
+    return [
+        Stage('load', load),
+        Stage('clean', clean, deps=['load']),
+        Stage('aggregate', aggregate, deps=['clean'], rows=lambda cube: cube.n_cells),
+        Stage('shipping', shipping_kpis, deps=['clean'],
+              rows=lambda kpis: sum(len(table) for table in kpis['breakdowns'].values())),
+        Stage('export', export, deps=['aggregate']),
+        Stage('charts', charts, deps=['clean', 'shipping'], rows=len),
+        Stage('slides', slides, deps=['charts', 'shipping'], rows=lambda path: 1),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the pipeline stages and profile each one.')
+    parser.add_argument('stages', nargs='*', help='stages to run, with their inputs (default: all)')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to parse the raw file')
+    parser.add_argument('--long-delay-days', type=int, default=shipping.DEFAULT_LONG_DELAY_DAYS,
+                        help='delays above this many days count as long')
+    parser.add_argument('--profile-out', type=Path,
+                        help='write the stage profile to this .json or .csv file')
+    parser.add_argument('--profile-stage', action='append', default=[],
+                        help='run this stage under a profiler (repeatable)')
+    parser.add_argument('--profiler', choices=PROFILERS, default='cprofile',
+                        help='profiler used by --profile-stage')
+    parser.add_argument('--profile-dir', type=Path, default=PROFILE_DIR,
+                        help='where --profile-stage dumps are written')
+    args = parser.parse_args()
+
+    _, profile = run_stages(
+        pipeline_stages(args), only=args.stages or None,
+        profile_stages=args.profile_stage, profile_dir=args.profile_dir, profiler=args.profiler,
+    )
+    print()
+    print(format_profile(profile))
+    if args.profile_out:
+        write_profile(profile, args.profile_out)
+        print('Profile written to', args.profile_out)
+    for name in args.profile_stage:
+        print(f"Profiler output for {name} in", args.profile_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,139 +6,385 @@ Outputs:
 - visuals/shipping_delay_boxplot.png
 - visuals/sales_vs_delay.png
 - visuals/summary.txt
+
+Charts are drawn from pre-aggregated summaries (binned counts, quartiles), so
+their cost does not grow with the number of orders.
+
+With --max-memory-mb (or --chunksize) the KPIs are computed by streaming the
+raw file in bounded chunks. The scatter chart and the Spearman correlation
+need every row at once, so they are skipped in that mode. --workers N parses the input with
+N processes in either mode. --approximate streams with mergeable KLL quantile
+and HyperLogLog distinct-count sketches, so memory stays bounded even for the
+per-mode quantiles.
+
+--years / --region / --segment / --category restrict the analysis to matching
+orders; only the shipping columns are read.
 """
+from functools import partial
 from pathlib import Path
+import argparse
+import sys
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from dateutil import parser
-from scipy.stats import spearmanr
 
 ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from superstore.correlation import DEFAULT_BOOTSTRAP_SAMPLES, bootstrap_spearman, spearman, suspicious_rows
+from superstore.dates import format_report
+from superstore.filters import add_filter_arguments, filters_from_args
+from superstore.loader import load_orders
+from superstore.parallel import map_partitions, partition_bytes_for_budget
+from superstore.plotting import binned_histogram, box_stats_from_kpis, density_scatter, use_headless
+from superstore.shipping import DEFAULT_LONG_DELAY_DAYS, DELAY, KPI_DIMENSIONS, delay_kpis
+from superstore.sketches import DEFAULT_PRECISION, k_for_rank_error
+from superstore.streaming import (
+    DEFAULT_MEMORY_MB, DistinctCounts, GroupedStats, QuantileSketches, ValueCounts, iter_order_chunks,
+)
+
 DATA = ROOT / 'data' / 'raw' / 'superstore.csv'
 OUT = ROOT / 'visuals'
 OUT.mkdir(parents=True, exist_ok=True)
 
+SHIPPING_COLUMNS = ['Order ID', 'Order Date', 'Ship Date', 'Ship Mode', 'Customer ID', 'Region', 'Segment', 'Sales']
 
-def safe_parse_dates(series: pd.Series) -> pd.Series:
-    s = pd.to_datetime(series, errors='coerce', infer_datetime_format=True)
-    mask = s.isna()
-    if mask.any():
-        def _try_parse(x):
-            try:
-                return parser.parse(str(x))
-            except Exception:
-                return pd.NaT
-        s.loc[mask] = series[mask].apply(_try_parse)
-    return pd.to_datetime(s, errors='coerce')
+# Default normalised rank error of the approximate quantiles (--rank-error)
+DEFAULT_RANK_ERROR = 0.01
 
+# Records more than this many standard deviations above the median delay are
+# flagged as suspicious (--suspicious-std)
+DEFAULT_SUSPICIOUS_STD = 3
 
-def main():
-    sns.set(style='whitegrid')
-    df = pd.read_csv(DATA)
 
-    # robust parsing
-    df['Order Date Parsed'] = safe_parse_dates(df['Order Date'])
-    df['Ship Date Parsed'] = safe_parse_dates(df['Ship Date'])
+def add_delay_columns(df, long_delay_days=DEFAULT_LONG_DELAY_DAYS):
+    # dates arrive parsed from the shared loader; unparseable values are NaT
+    df['Order Date Parsed'] = df['Order Date']
+    df['Ship Date Parsed'] = df['Ship Date']
     df['Order Date Invalid'] = df['Order Date Parsed'].isna()
     df['Ship Date Invalid'] = df['Ship Date Parsed'].isna()
-    df['Shipping Delay (Days)'] = (df['Ship Date Parsed'] - df['Order Date Parsed']).dt.days
-
-    # overall stats
-    delay = df['Shipping Delay (Days)']
-    desc = delay.describe(percentiles=[0.25, 0.5, 0.75])
-    iqr = desc['75%'] - desc['25%'] if '75%' in desc else None
-
-    overall_stats = dict(
-        count=int(desc['count']) if not pd.isna(desc['count']) else 0,
-        mean=float(desc['mean']) if not pd.isna(desc['mean']) else None,
-        median=float(desc['50%']) if not pd.isna(desc['50%']) else None,
-        std=float(desc['std']) if not pd.isna(desc['std']) else None,
-        min=float(desc['min']) if not pd.isna(desc['min']) else None,
-        max=float(desc['max']) if not pd.isna(desc['max']) else None,
-        iqr_days=float(iqr) if iqr is not None else None,
+    df[DELAY] = (df['Ship Date Parsed'] - df['Order Date Parsed']).dt.days
+    df['Negative Delay'] = df[DELAY] < 0
+    df['Long Delay'] = df[DELAY] > long_delay_days
+    return df
+
+
+def overall_stats_from(kpi_row):
+    """The overall-delay block of the summary from the 'All' row of a KPI table."""
+    def value_or_none(value):
+        return None if pd.isna(value) else float(value)
+
+    return dict(
+        count=int(kpi_row['count']),
+        mean=value_or_none(kpi_row['mean']),
+        median=value_or_none(kpi_row['median']),
+        std=value_or_none(kpi_row['std']),
+        min=value_or_none(kpi_row['min']),
+        max=value_or_none(kpi_row['max']),
+        iqr_days=value_or_none(kpi_row['IQR']),
     )
 
-    # ship mode stats
-    valid = df[~df['Shipping Delay (Days)'].isna()]
-    group = valid.groupby('Ship Mode')['Shipping Delay (Days)']
-    ship_stats = group.agg(['count', 'median', 'mean', 'std', 'min', 'max'])
-    q1 = group.quantile(0.25)
-    q3 = group.quantile(0.75)
-    ship_stats['IQR'] = (q3 - q1)
-    ship_stats['neg_rate'] = df.groupby('Ship Mode').apply(lambda g: (g['Shipping Delay (Days)'] < 0).sum() / max(g.shape[0], 1))
-    ship_stats['long_rate_gt7d'] = df.groupby('Ship Mode').apply(lambda g: (g['Shipping Delay (Days)'] > 7).sum() / max(g.shape[0], 1))
-
-    # suspicious records
-    med = df['Shipping Delay (Days)'].median()
-    stdv = df['Shipping Delay (Days)'].std()
-    threshold = med + 3 * stdv if pd.notna(stdv) else (med + 30 if pd.notna(med) else 30)
-    suspicious = df[(df['Shipping Delay (Days)'] < 0) | (df['Shipping Delay (Days)'] > threshold)]
+
+def suspicious_threshold(overall_stats, suspicious_std=DEFAULT_SUSPICIOUS_STD):
+    med = overall_stats['median']
+    stdv = overall_stats['std']
+    return med + suspicious_std * stdv if stdv is not None else (med + 30 if med is not None else 30)
+
+
+def compute_kpis(df, long_delay_days=DEFAULT_LONG_DELAY_DAYS, suspicious_std=DEFAULT_SUSPICIOUS_STD,
+                 bootstrap_samples=0, sample_size=None):
+    """Shipping KPIs from a fully loaded order table.
+
+    With ``bootstrap_samples`` the correlation also gets a 95% confidence
+    interval from that many resamples of ``sample_size`` rows.
+    """
+    # every per-group statistic comes from one vectorized pass over the delays
+    breakdowns = delay_kpis(df, by=KPI_DIMENSIONS, long_delay_days=long_delay_days)
+    overall_stats = overall_stats_from(breakdowns.pop('All').iloc[0])
+
+    # suspicious records, as row positions rather than a copy of the rows
+    delay = df[DELAY].to_numpy(dtype=np.float64, na_value=np.nan)
+    suspicious, threshold = suspicious_rows(delay, suspicious_std)
 
     # correlation sales vs delay
-    mask = df['Shipping Delay (Days)'].notna() & df['Sales'].notna()
-    if mask.sum() > 0:
-        corr, pval = spearmanr(df.loc[mask, 'Sales'], df.loc[mask, 'Shipping Delay (Days)'])
+    sales = df['Sales'].to_numpy(dtype=np.float64, na_value=np.nan)
+    corr_ci = None
+    if bootstrap_samples:
+        corr, corr_ci = bootstrap_spearman(sales, delay, bootstrap_samples, sample_size)
+        _, pval = spearman(sales, delay)
+    else:
+        corr, pval = spearman(sales, delay)
+
+    return dict(
+        total_records=len(df),
+        order_date_invalid=int(df['Order Date Invalid'].sum()),
+        ship_date_invalid=int(df['Ship Date Invalid'].sum()),
+        date_reports=df.attrs.get('date_reports', []),
+        overall_stats=overall_stats,
+        breakdowns=breakdowns,
+        long_delay_days=long_delay_days,
+        suspicious_count=len(suspicious),
+        threshold=threshold,
+        corr=corr,
+        pval=pval,
+        corr_ci=corr_ci,
+        delay_counts=df[DELAY].value_counts().sort_index(),
+        distinct_orders=int(df['Order ID'].nunique()),
+        distinct_customers=int(df['Customer ID'].nunique()),
+        rank_error=None,
+    )
+
+
+def shipping_aggregators(approximate=False, rank_error=DEFAULT_RANK_ERROR,
+                         long_delay_days=DEFAULT_LONG_DELAY_DAYS, chunk=None):
+    """Mergeable aggregators for the shipping KPIs, filled from ``chunk`` when given.
+
+    Exact mode counts every distinct delay and keeps every distinct ID;
+    approximate mode keeps KLL quantile sketches and HyperLogLog sketches
+    instead, whose size does not grow with the data.
+    """
+    k = k_for_rank_error(rank_error)
+    precision = DEFAULT_PRECISION if approximate else None
+    aggregators = dict(
+        order_invalid=GroupedStats([], 'Order Date Invalid'),
+        ship_invalid=GroupedStats([], 'Ship Date Invalid'),
+        orders=DistinctCounts([], 'Order ID', precision),
+        customers=DistinctCounts([], 'Customer ID', precision),
+    )
+    for dimension in ['All'] + KPI_DIMENSIONS:
+        keys = [] if dimension == 'All' else [dimension]
+        aggregators[dimension, 'stats'] = GroupedStats(keys, DELAY)
+        aggregators[dimension, 'quantiles'] = QuantileSketches(keys, DELAY, k) if approximate else ValueCounts(keys, DELAY)
+        aggregators[dimension, 'negative'] = GroupedStats(keys, 'Negative Delay')
+        aggregators[dimension, 'long'] = GroupedStats(keys, 'Long Delay')
+    if chunk is not None:
+        add_delay_columns(chunk, long_delay_days)
+        for aggregator in aggregators.values():
+            aggregator.update(chunk)
+    return aggregators
+
+
+def kpi_table(aggregators, dimension):
+    """A ``delay_kpis``-style table for one dimension from merged aggregators."""
+    stats = aggregators[dimension, 'stats'].result()
+    quartiles = aggregators[dimension, 'quantiles'].quantiles([0.25, 0.5, 0.75])
+    table = stats[['count', 'mean', 'std', 'min', 'max']].copy()
+    table['q1'] = quartiles[0.25]
+    table['median'] = quartiles[0.5]
+    table['q3'] = quartiles[0.75]
+    table['IQR'] = table['q3'] - table['q1']
+    # Rates are over every row of a group, including rows without a delay
+    table['neg_rate'] = aggregators[dimension, 'negative'].result()['mean']
+    table['long_rate'] = aggregators[dimension, 'long'].result()['mean']
+    return table
+
+
+def compute_kpis_streaming(path, chunksize=None, max_memory_mb=DEFAULT_MEMORY_MB, workers=1,
+                           approximate=False, rank_error=DEFAULT_RANK_ERROR,
+                           long_delay_days=DEFAULT_LONG_DELAY_DAYS, suspicious_std=DEFAULT_SUSPICIOUS_STD,
+                           filters=None):
+    """The same KPIs, computed chunk by chunk with bounded memory.
+
+    Shipping delays are whole days, so exact per-value counts give exact
+    medians and quartiles without keeping the rows themselves. With several
+    workers each process fills aggregators for its own slice of the file and
+    they are merged here in file order.
+    """
+    make_aggregators = partial(shipping_aggregators, approximate, rank_error, long_delay_days)
+    if workers > 1:
+        parts = map_partitions(
+            path, make_aggregators, workers=workers, columns=SHIPPING_COLUMNS,
+            partition_bytes=partition_bytes_for_budget(max_memory_mb, workers), filters=filters,
+        )
     else:
-        corr, pval = None, None
-
-    # charts
-    plt.figure(figsize=(8, 4))
-    sns.histplot(df['Shipping Delay (Days)'].dropna().clip(lower=-5, upper=30), bins=35, kde=False)
-    plt.title('Histogram: Shipping Delay (Days) (clipped -5 to 30)')
-    plt.xlabel('Shipping Delay (Days)')
-    plt.ylabel('Count')
-    plt.tight_layout()
-    plt.savefig(OUT / 'shipping_delay_hist.png')
-    plt.close()
-
-    plt.figure(figsize=(8, 5))
-    order = df.groupby('Ship Mode')['Shipping Delay (Days)'].median().sort_values().index
-    sns.boxplot(x='Ship Mode', y='Shipping Delay (Days)', data=df, order=order)
-    plt.title('Shipping Delay by Ship Mode')
-    plt.ylabel('Delay (Days)')
-    plt.tight_layout()
-    plt.savefig(OUT / 'shipping_delay_boxplot.png')
-    plt.close()
-
-    plt.figure(figsize=(7, 5))
-    m = mask
-    sns.scatterplot(x=df.loc[m, 'Shipping Delay (Days)'], y=df.loc[m, 'Sales'])
-    plt.yscale('log')
-    plt.xlabel('Shipping Delay (Days)')
-    plt.ylabel('Sales (log scale)')
-    plt.title('Sales vs Shipping Delay')
-    plt.tight_layout()
-    plt.savefig(OUT / 'sales_vs_delay.png')
-    plt.close()
-
-    # concise summary
+        chunks = iter_order_chunks(
+            path, chunksize=chunksize, max_memory_mb=max_memory_mb, columns=SHIPPING_COLUMNS, filters=filters,
+        )
+        parts = (make_aggregators(chunk=chunk) for chunk in chunks)
+
+    aggregators = make_aggregators()
+    for part in parts:
+        for name, aggregator in aggregators.items():
+            aggregator.merge(part[name])
+    order_invalid = aggregators['order_invalid'].result()
+    ship_invalid = aggregators['ship_invalid'].result()
+
+    overall = kpi_table(aggregators, 'All')
+    if len(overall):
+        overall_stats = overall_stats_from(overall.iloc[0])
+    else:
+        overall_stats = dict(count=0, mean=None, median=None, std=None, min=None, max=None, iqr_days=None)
+    breakdowns = {dimension: kpi_table(aggregators, dimension) for dimension in KPI_DIMENSIONS}
+
+    threshold = suspicious_threshold(overall_stats, suspicious_std)
+    quantiles = aggregators['All', 'quantiles']
+    negative = int(aggregators['All', 'negative'].result()['sum'].sum())
+    if approximate:
+        above = quantiles.ranks(threshold)
+        suspicious_count = negative + (int(round(overall_stats['count'] * (1 - above.iloc[0]))) if len(above) else 0)
+    else:
+        suspicious_count = 0
+        for _, counts in quantiles.groups():
+            suspicious_count = int(counts[(counts.index < 0) | (counts.index > threshold)].sum())
+
+    return dict(
+        total_records=int(order_invalid['count'].sum()),
+        order_date_invalid=int(order_invalid['sum'].sum()),
+        ship_date_invalid=int(ship_invalid['sum'].sum()),
+        date_reports=[],
+        overall_stats=overall_stats,
+        breakdowns=breakdowns,
+        long_delay_days=long_delay_days,
+        suspicious_count=suspicious_count,
+        threshold=threshold,
+        corr=None,
+        pval=None,
+        corr_ci=None,
+        delay_counts=None if approximate else next((counts for _, counts in quantiles.groups()), None),
+        distinct_orders=int(aggregators['orders'].result().sum()),
+        distinct_customers=int(aggregators['customers'].result().sum()),
+        rank_error=rank_error if approximate else None,
+    )
+
+
+def draw_charts(kpis, df=None):
+    """Draw the charts from the KPI summaries; the scatter also needs ``df``."""
+    if kpis['delay_counts'] is not None and len(kpis['delay_counts']):
+        draw_histogram(kpis, OUT / 'shipping_delay_hist.png')
+    draw_boxplot(kpis, OUT / 'shipping_delay_boxplot.png')
+    if df is not None:
+        draw_scatter(df, OUT / 'sales_vs_delay.png')
+
+
+def _pyplot():
+    # Charts are only written to files, so skip any GUI backend
+    use_headless()
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    sns.set(style='whitegrid')
+    return plt
+
+
+def draw_histogram(kpis, path):
+    plt = _pyplot()
+    counts = kpis['delay_counts']
+    clipped = counts.groupby(counts.index.to_numpy().clip(-5, 30)).sum()
+    edges = np.arange(clipped.index.min() - 0.5, clipped.index.max() + 1.5)
+    binned = clipped.reindex(np.arange(clipped.index.min(), clipped.index.max() + 1), fill_value=0)
+    fig, ax = plt.subplots(figsize=(8, 4))
+    binned_histogram(ax, edges, binned.to_numpy())
+    ax.set_title('Histogram: Shipping Delay (Days) (clipped -5 to 30)')
+    ax.set_xlabel('Shipping Delay (Days)')
+    ax.set_ylabel('Count')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def draw_boxplot(kpis, path):
+    plt = _pyplot()
+    ship_stats = kpis['breakdowns']['Ship Mode'].dropna(subset=['median'])
+    fig, ax = plt.subplots(figsize=(8, 5))
+    order = ship_stats.sort_values('median').index
+    ax.bxp(box_stats_from_kpis(ship_stats, order, integer=True), showfliers=False)
+    ax.set_title('Shipping Delay by Ship Mode')
+    ax.set_xlabel('Ship Mode')
+    ax.set_ylabel('Delay (Days)')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def draw_scatter(df, path):
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(7, 5))
+    mesh = density_scatter(ax, df[DELAY], df['Sales'], log_y=True)
+    if mesh is not None:
+        fig.colorbar(mesh, ax=ax, label='Orders')
+    ax.set_xlabel('Shipping Delay (Days)')
+    ax.set_ylabel('Sales (log scale)')
+    ax.set_title('Sales vs Shipping Delay')
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def write_summary(kpis, path=OUT / 'summary.txt'):
     lines = []
     lines.append('Concise Shipping Analysis Summary')
     lines.append('--------------------------------')
-    lines.append(f"Total records: {len(df)}")
-    lines.append(f"Order date invalid: {int(df['Order Date Invalid'].sum())}")
-    lines.append(f"Ship date invalid: {int(df['Ship Date Invalid'].sum())}")
+    lines.append(f"Total records: {kpis['total_records']}")
+    lines.append(f"Order date invalid: {kpis['order_date_invalid']}")
+    lines.append(f"Ship date invalid: {kpis['ship_date_invalid']}")
+    for report in kpis['date_reports']:
+        lines.append(f"- {format_report(report)}")
+    approx = '~' if kpis['rank_error'] is not None else ''
+    lines.append(f"Distinct orders: {approx}{kpis['distinct_orders']}")
+    lines.append(f"Distinct customers: {approx}{kpis['distinct_customers']}")
+    if kpis['rank_error'] is not None:
+        lines.append(f"Quantiles are approximate (rank error about {kpis['rank_error']:.1%})")
     lines.append('')
     lines.append('Overall shipping delay (days):')
-    for k, v in overall_stats.items():
+    for k, v in kpis['overall_stats'].items():
         lines.append(f"- {k}: {v}")
     lines.append('')
-    lines.append('Ship Mode summary (median, IQR, neg_rate, long_rate_gt7d):')
-    for idx, row in ship_stats.sort_values('median').iterrows():
-        lines.append(f"- {idx}: median={row['median']:.1f}, IQR={row.get('IQR', float('nan')):.1f}, neg_rate={row.get('neg_rate',0):.3f}, long_rate_gt7d={row.get('long_rate_gt7d',0):.3f}")
-    lines.append('')
-    lines.append(f"Suspicious records flagged: {len(suspicious)} (threshold > {threshold:.1f} days)")
+    long_label = f"long_rate_gt{kpis['long_delay_days']}d"
+    for dimension, table in kpis['breakdowns'].items():
+        lines.append(f"{dimension} summary (median, IQR, neg_rate, {long_label}):")
+        for idx, row in table.sort_values('median').iterrows():
+            lines.append(f"- {idx}: median={row['median']:.1f}, IQR={row['IQR']:.1f}, neg_rate={row['neg_rate']:.3f}, {long_label}={row['long_rate']:.3f}")
+        lines.append('')
+    lines.append(f"Suspicious records flagged: {kpis['suspicious_count']} (threshold > {kpis['threshold']:.1f} days)")
     lines.append('')
     lines.append('Spearman correlation (Sales vs Delay):')
-    lines.append(f"- correlation: {corr}, p-value: {pval}")
+    lines.append(f"- correlation: {kpis['corr']}, p-value: {kpis['pval']}")
+    if kpis['corr_ci'] is not None:
+        low, high = kpis['corr_ci']
+        lines.append(f"- 95% bootstrap interval: [{low:.4f}, {high:.4f}]")
     lines.append('')
     lines.append('Recommended next steps:')
     lines.append('- Investigate negative-delay records and fix date-entry or ETL issues')
-    lines.append('- Review high-variability ship modes and long-tail delays (>7 days)')
+    lines.append(f"- Review high-variability ship modes and long-tail delays (>{kpis['long_delay_days']} days)")
     lines.append('- Consider prioritizing high-sales orders for faster fulfillment if correlation shows longer delays for larger orders')
 
-    (OUT / 'summary.txt').write_text('\n'.join(lines))
+    Path(path).write_text('\n'.join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shipping KPI analysis.')
+    parser.add_argument('--chunksize', type=int, help='rows per chunk when streaming')
+    parser.add_argument('--max-memory-mb', type=int, help='stream the input within this memory budget')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to parse the input')
+    parser.add_argument('--approximate', action='store_true',
+                        help='stream with quantile and distinct-count sketches instead of exact counts')
+    parser.add_argument('--rank-error', type=float, default=DEFAULT_RANK_ERROR,
+                        help='target rank error of the approximate quantiles')
+    parser.add_argument('--long-delay-days', type=int, default=DEFAULT_LONG_DELAY_DAYS,
+                        help='delays above this many days count as long')
+    parser.add_argument('--suspicious-std', type=float, default=DEFAULT_SUSPICIOUS_STD,
+                        help='flag delays more than this many standard deviations above the median')
+    parser.add_argument('--bootstrap', type=int, nargs='?', const=DEFAULT_BOOTSTRAP_SAMPLES, default=0,
+                        help='add a bootstrap confidence interval to the Sales/Delay correlation')
+    parser.add_argument('--sample-size', type=int,
+                        help='rows drawn per bootstrap sample (default: all rows)')
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+    filters = filters_from_args(args)
+
+    if args.chunksize is not None or args.max_memory_mb is not None or args.approximate:
+        kpis = compute_kpis_streaming(
+            DATA, args.chunksize, args.max_memory_mb or DEFAULT_MEMORY_MB, args.workers,
+            approximate=args.approximate, rank_error=args.rank_error,
+            long_delay_days=args.long_delay_days, suspicious_std=args.suspicious_std, filters=filters,
+        )
+        print('Streaming mode: scatter chart and Spearman correlation skipped')
+        draw_charts(kpis)
+    else:
+        df = load_orders(DATA, workers=args.workers, columns=SHIPPING_COLUMNS, filters=filters)
+        df = add_delay_columns(df, args.long_delay_days)
+        kpis = compute_kpis(df, args.long_delay_days, args.suspicious_std, args.bootstrap, args.sample_size)
+        draw_charts(kpis, df)
+    write_summary(kpis)
 
 
 if __name__ == '__main__':
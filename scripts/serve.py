@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Serve the report summaries and shipping KPIs from a warm in-memory table.
+
+The order file is loaded once; notebooks and dashboards then ask for results
+over HTTP instead of starting a Python process per analysis. Results are
+cached per query, parameters and data version, and the file is reloaded when
+it changes (see superstore/service.py).
+
+Queries:
+
+    /report      every summary of analysis.REPORT_AGGREGATIONS (?only=yearly_sales,segment_sales)
+    /shipping    the shipping KPIs of run_shipping_analysis.py (?long_delay_days=7&suspicious_std=3)
+    /overview    rows, date range, orders and customers
+    /trends      sales per period with rolling sums, growth, YoY and running totals
+                 (?freq=day|week|month|quarter&dimension=Category)
+
+Each takes the filters of the report scripts: ?years=2016,2017&region=West.
+
+Run from repository root:
+    python scripts/serve.py
+    python scripts/serve.py --unix-socket /tmp/superstore.sock
+    curl 'http://127.0.0.1:8765/report?years=2017&only=category_sales'
+"""
+from pathlib import Path
+import argparse
+import asyncio
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+import run_shipping_analysis as shipping
+from analysis import DATA_PATH, REPORT_AGGREGATIONS
+from superstore.aggregate import AggregationPlan
+from superstore.loader import load_orders
+from superstore.service import (
+    DEFAULT_CACHE_SIZE, DEFAULT_HOST, DEFAULT_PORT, QueryError, QueryService, serve,
+)
+from superstore.timeseries import DEFAULT_DIMENSIONS, FREQUENCIES, SalesTimeSeries
+
+DATA = ROOT / DATA_PATH
+
+
+def load_table(path, workers=1):
+    """The order table with the calendar and delay columns every query uses."""
+    df = load_orders(path, workers=workers)
+    df['Year'] = df['Order Date'].dt.year
+    df['Month'] = df['Order Date'].dt.month
+    df['Quarter'] = df['Order Date'].dt.quarter
+    return shipping.add_delay_columns(df)
+
+
+def report(df, only=None):
+    names = only.split(',') if only else list(REPORT_AGGREGATIONS)
+    unknown = [name for name in names if name not in REPORT_AGGREGATIONS]
+    if unknown:
+        raise QueryError(400, f"Unknown summaries: {', '.join(unknown)}")
+    # An extract without some column (the raw file has no Profit) still
+    # serves every summary that does not need it
+    missing = {name: _missing_columns(df, name) for name in names}
+    if only and any(missing.values()):
+        raise QueryError(400, '; '.join(f"{name} needs {', '.join(columns)}, which the data does not have"
+                                        for name, columns in missing.items() if columns))
+    plan = AggregationPlan(df)
+    for name in names:
+        if not missing[name]:
+            keys, measure, reducer = REPORT_AGGREGATIONS[name]
+            plan.add(name, keys, measure, reducer)
+    return plan.run()
+
+
+def _missing_columns(df, name):
+    keys, measure, _ = REPORT_AGGREGATIONS[name]
+    return [column for column in keys + ([measure] if measure else []) if column not in df.columns]
+
+
+def shipping_kpis(df, long_delay_days=shipping.DEFAULT_LONG_DELAY_DAYS,
+                  suspicious_std=shipping.DEFAULT_SUSPICIOUS_STD):
+    try:
+        long_delay_days, suspicious_std = int(long_delay_days), float(suspicious_std)
+    except ValueError as error:
+        raise QueryError(400, str(error)) from None
+    return shipping.compute_kpis(df, long_delay_days, suspicious_std)
+
+
+def overview(df):
+    return {
+        'rows': len(df),
+        'first_order': df['Order Date'].min(),
+        'last_order': df['Order Date'].max(),
+        'orders': df['Order ID'].nunique(),
+        'customers': df['Customer ID'].nunique(),
+    }
+
+
+def trends(df, freq='month', dimension=None):
+    if freq not in FREQUENCIES:
+        raise QueryError(400, f"freq must be one of {', '.join(FREQUENCIES)}")
+    if dimension is not None and dimension not in DEFAULT_DIMENSIONS:
+        raise QueryError(400, f"dimension must be one of {', '.join(DEFAULT_DIMENSIONS)}")
+    return SalesTimeSeries().update(df).trends(freq, dimension=dimension)
+
+
+QUERIES = {'report': report, 'shipping': shipping_kpis, 'overview': overview, 'trends': trends}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve report queries from a warm in-memory table.')
+    parser.add_argument('--data', type=Path, default=DATA, help='order file to serve')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port to listen on')
+    parser.add_argument('--unix-socket', help='listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help='number of query results kept in the LRU cache')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes used to parse the file')
+    args = parser.parse_args()
+    if not args.data.exists():
+        raise FileNotFoundError(f"Data not found at {args.data}")
+
+    service = QueryService(
+        lambda: load_table(args.data, args.workers), QUERIES, source=args.data, cache_size=args.cache_size,
+    )
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Serving {args.data} on {where} (queries: {', '.join(QUERIES)})")
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        print('Stopped.')
+
+
+if __name__ == '__main__':
+    main()
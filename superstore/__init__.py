@@ -0,0 +1 @@
+"""Shared building blocks for the Superstore analysis scripts and notebooks."""
@@ -0,0 +1,239 @@
+"""
+Single-pass multi-aggregation over factorized group keys.
+
+A report usually asks for many small summaries of the same table: sales by
+category, profit by category, sales by sub-category, distinct orders, and so
+on. Running a separate ``groupby`` for each one re-hashes the key column every
+time. ``AggregationPlan`` collects all of the requested summaries first, turns
+each key column into integer codes once, and then computes every summary with
+``np.bincount`` (or ``np.minimum.at`` / ``np.maximum.at``) on those codes.
+
+Example::
+
+    plan = AggregationPlan(df)
+    plan.add('category_sales', ['Category'], 'Sales', 'sum')
+    plan.add('category_profit', ['Category'], 'Profit', 'sum')
+    plan.add('num_orders', [], 'Order ID', 'nunique')
+    results = plan.run()
+    results['category_sales']   # Series indexed by Category
+    results['num_orders']       # plain number for an empty key list
+"""
+
+import numpy as np
+import pandas as pd
+
+REDUCERS = ('sum', 'count', 'mean', 'min', 'max', 'nunique')
+
+
+class AggregationPlan:
+    """
+    Collect (keys, measure, reducer) specs and compute them together.
+
+    Rows with a missing key are left out unless ``dropna=False``, in which
+    case a missing key is a group of its own, as in ``groupby(dropna=False)``.
+    """
+
+    def __init__(self, df, dropna=True):
+        self.df = df
+        self.dropna = dropna
+        self.specs = {}
+        self._key_codes = {}
+        self._groupings = {}
+        self._partials = {}
+
+    def add(self, name, keys, measure=None, reducer='sum'):
+        """
+        Register one aggregation under ``name``.
+
+        ``keys`` is a list of columns to group by (empty for a grand total),
+        ``measure`` the column to reduce (only optional for ``'count'``) and
+        ``reducer`` one of ``REDUCERS``.
+        """
+        if reducer not in REDUCERS:
+            raise ValueError(f"Unknown reducer {reducer!r}; expected one of {REDUCERS}")
+        if measure is None and reducer != 'count':
+            raise ValueError(f"Reducer {reducer!r} needs a measure column")
+        if isinstance(keys, str):
+            keys = [keys]
+        self.specs[name] = (tuple(keys), measure, reducer)
+        return self
+
+    def run(self):
+        """Compute every registered aggregation and return them by name."""
+        results = {}
+        for name, (keys, measure, reducer) in self.specs.items():
+            results[name] = self._compute(keys, measure, reducer)
+        return results
+
+    def row_groups(self, keys):
+        """
+        Return the group of every row for ``keys`` and the matching index.
+
+        The group positions line up with the index returned alongside them
+        (the same index ``run`` uses for a spec with these keys); rows with a
+        missing key get -1 unless the plan keeps missing keys. This lets callers attach their own per-group
+        state, such as sketches, to the plan's groups.
+        """
+        keys = tuple([keys] if isinstance(keys, str) else keys)
+        grouping = self._grouping(keys)
+        position = np.full(grouping['n_groups'], -1, dtype=np.int64)
+        position[grouping['observed']] = np.arange(len(grouping['observed']))
+        row_positions = np.full(len(self.df), -1, dtype=np.int64)
+        if grouping['row_mask'] is None:
+            row_positions[:] = position[grouping['group_ids']]
+        else:
+            row_positions[grouping['row_mask']] = position[grouping['group_ids']]
+        return row_positions, self._index(grouping)
+
+    # -- key handling -----------------------------------------------------
+
+    def _codes(self, column, keep_missing=False):
+        # Each column is turned into codes at most once per plan, whether it
+        # is used as a key or as the measure of a distinct count. With
+        # ``keep_missing`` a missing value gets the last code instead of -1.
+        if (column, keep_missing) not in self._key_codes:
+            series = self.df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy().astype(np.int64)
+                labels = pd.Index(series.cat.categories)
+                if keep_missing and (codes < 0).any():
+                    codes[codes < 0] = len(labels)
+                    labels = labels.insert(len(labels), np.nan)
+            else:
+                codes, labels = pd.factorize(series, sort=True, use_na_sentinel=not keep_missing)
+                codes = codes.astype(np.int64)
+            self._key_codes[column, keep_missing] = (codes, pd.Index(labels, name=column))
+        return self._key_codes[column, keep_missing]
+
+    def _grouping(self, keys):
+        # A grouping maps every usable row to a dense group id. Rows with a
+        # missing key are left out, matching pandas' default dropna=True,
+        # unless the plan keeps them as groups of their own.
+        if keys in self._groupings:
+            return self._groupings[keys]
+
+        n_rows = len(self.df)
+        flat_ids = np.zeros(n_rows, dtype=np.int64)
+        valid = np.ones(n_rows, dtype=bool)
+        shape = []
+        for column in keys:
+            codes, labels = self._codes(column, keep_missing=not self.dropna)
+            flat_ids = flat_ids * len(labels) + codes
+            valid &= codes >= 0
+            shape.append(len(labels))
+
+        row_mask = None if valid.all() else valid
+        if row_mask is not None:
+            flat_ids = flat_ids[row_mask]
+
+        n_cells = int(np.prod(shape)) if shape else 1
+        if n_cells <= max(4 * n_rows, 1024):
+            # The full key space is small enough to index directly
+            group_ids = flat_ids
+            cell_ids = np.arange(n_cells, dtype=np.int64)
+        else:
+            # Too many key combinations for dense arrays: keep only the
+            # combinations that actually occur (one sort instead of a hash)
+            cell_ids, group_ids = np.unique(flat_ids, return_inverse=True)
+
+        sizes = np.bincount(group_ids, minlength=len(cell_ids))
+        observed = np.flatnonzero(sizes)
+        grouping = {
+            'keys': keys,
+            'shape': shape,
+            'row_mask': row_mask,
+            'group_ids': group_ids,
+            'n_groups': len(cell_ids),
+            'cell_ids': cell_ids,
+            'sizes': sizes,
+            'observed': observed,
+        }
+        self._groupings[keys] = grouping
+        return grouping
+
+    def _index(self, grouping):
+        keys = grouping['keys']
+        cells = grouping['cell_ids'][grouping['observed']]
+        positions = np.unravel_index(cells, grouping['shape'])
+        levels = [self._codes(column, keep_missing=not self.dropna)[1] for column in keys]
+        if len(keys) == 1:
+            return levels[0].take(positions[0])
+        return pd.MultiIndex.from_arrays(
+            [level.take(pos) for level, pos in zip(levels, positions)], names=list(keys)
+        )
+
+    # -- reductions -------------------------------------------------------
+
+    def _measure(self, grouping, measure):
+        # Values and group ids restricted to rows where both key and measure
+        # are present, shared by every reducer on the same (keys, measure).
+        cache_key = (grouping['keys'], measure, 'values')
+        if cache_key not in self._partials:
+            values = self.df[measure].to_numpy()
+            if grouping['row_mask'] is not None:
+                values = values[grouping['row_mask']]
+            group_ids = grouping['group_ids']
+            present = pd.notna(values)
+            if not present.all():
+                values = values[present]
+                group_ids = group_ids[present]
+            self._partials[cache_key] = (values, group_ids)
+        return self._partials[cache_key]
+
+    def _reduce(self, grouping, measure, reducer):
+        cache_key = (grouping['keys'], measure, reducer)
+        if cache_key in self._partials:
+            return self._partials[cache_key]
+
+        n_groups = grouping['n_groups']
+        if reducer == 'count' and measure is None:
+            result = grouping['sizes']
+        elif reducer == 'count':
+            _, group_ids = self._measure(grouping, measure)
+            result = np.bincount(group_ids, minlength=n_groups)
+        elif reducer == 'sum':
+            values, group_ids = self._measure(grouping, measure)
+            result = np.bincount(group_ids, weights=values.astype(np.float64), minlength=n_groups)
+            if np.issubdtype(values.dtype, np.integer):
+                result = result.astype(np.int64)
+        elif reducer == 'mean':
+            totals = self._reduce(grouping, measure, 'sum')
+            counts = self._reduce(grouping, measure, 'count')
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = totals / counts
+        elif reducer in ('min', 'max'):
+            values, group_ids = self._measure(grouping, measure)
+            values = values.astype(np.float64)
+            if reducer == 'min':
+                result = np.full(n_groups, np.inf)
+                np.minimum.at(result, group_ids, values)
+            else:
+                result = np.full(n_groups, -np.inf)
+                np.maximum.at(result, group_ids, values)
+            counts = self._reduce(grouping, measure, 'count')
+            result[counts == 0] = np.nan
+        else:  # nunique
+            result = self._nunique(grouping, measure)
+
+        self._partials[cache_key] = result
+        return result
+
+    def _nunique(self, grouping, measure):
+        # Count distinct (group, value) pairs: encode each pair as one
+        # integer, keep the unique ones and count them per group.
+        codes, labels = self._codes(measure)
+        if grouping['row_mask'] is not None:
+            codes = codes[grouping['row_mask']]
+        group_ids = grouping['group_ids']
+        present = codes >= 0
+        pairs = group_ids[present] * max(len(labels), 1) + codes[present]
+        distinct_groups = np.unique(pairs) // max(len(labels), 1)
+        return np.bincount(distinct_groups, minlength=grouping['n_groups'])
+
+    def _compute(self, keys, measure, reducer):
+        grouping = self._grouping(keys)
+        values = self._reduce(grouping, measure, reducer)
+        if not keys:
+            return values[0].item()
+        observed = grouping['observed']
+        return pd.Series(values[observed], index=self._index(grouping), name=measure or 'count')
@@ -0,0 +1,271 @@
+"""
+A small content-hashed build graph for derived artifacts.
+
+Each ``Target`` names the files it reads, the files it writes and a
+module-level function that turns one into the other. A target is rebuilt
+only when its *key* changes. The key is a hash of:
+
+- the content of every input file,
+- the target's parameters,
+- the source of the function that builds it: its module and every module
+  of this repository that module imports, directly or through other
+  modules, plus any ``code`` files the target declares.
+
+So editing the raw data, a chart's code (also in a helper module such as
+``superstore/plotting.py``) or an upstream artifact triggers exactly the
+targets downstream of the change. An upstream target that is
+rebuilt with byte-identical output does not ripple any further.
+
+Targets whose inputs are ready run together on a process pool. Keys and
+output hashes are kept in a JSON state file, and file hashes are reused
+while a file's size and modification time are unchanged.
+
+Example::
+
+    graph = BuildGraph(state_path)
+    graph.add('stats', compute_stats, inputs=[raw_csv], outputs=[stats_file])
+    graph.add('chart', draw_chart, inputs=[stats_file], outputs=[chart_png])
+    for result in graph.build(workers=4):
+        print(result.name, result.status)
+"""
+
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+import ast
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import time
+
+from superstore.loader import ROOT, file_fingerprint, fingerprint_matches
+
+STATE_VERSION = 1
+
+Target = namedtuple('Target', ['name', 'action', 'inputs', 'outputs', 'params', 'code'])
+BuildResult = namedtuple('BuildResult', ['name', 'status', 'seconds'])
+
+
+class BuildGraph:
+    """Targets connected through the files they read and write."""
+
+    def __init__(self, state_path):
+        self.state_path = Path(state_path)
+        self.targets = {}
+        self._producers = {}
+        self._code_files = {}
+
+    def add(self, name, action, inputs=(), outputs=(), params=(), code=()):
+        """
+        Register a target.
+
+        ``action(*inputs, *outputs, *params)`` must write every output; it is
+        called in a worker process, so it has to be a module-level function.
+        ``code`` lists source files the action depends on that its imports
+        do not reveal (for example a script it runs).
+        """
+        if name in self.targets:
+            raise ValueError(f"Duplicate target {name!r}")
+        inputs = [Path(path) for path in inputs]
+        outputs = [Path(path) for path in outputs]
+        for path in outputs:
+            if path in self._producers:
+                raise ValueError(f"{path} is produced by both {self._producers[path]!r} and {name!r}")
+            self._producers[path] = name
+        self.targets[name] = Target(name, action, inputs, outputs, tuple(params), [Path(path) for path in code])
+        return self
+
+    def dependencies(self, name):
+        """Names of the targets whose outputs ``name`` reads."""
+        target = self.targets[name]
+        return sorted({self._producers[path] for path in target.inputs if path in self._producers})
+
+    def build(self, targets=None, workers=None, force=False):
+        """
+        Bring ``targets`` (default: all) and everything they depend on up to date.
+
+        Returns one ``BuildResult`` per target, in completion order, with a
+        status of ``'built'`` or ``'up to date'``.
+        """
+        wanted = self._closure(targets or list(self.targets))
+        state = self._load_state()
+        file_hashes = state.setdefault('files', {})
+        records = state.setdefault('targets', {})
+
+        pending = set(wanted)
+        done = set()
+        running = {}
+        results = []
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+            while pending or running:
+                # Up-to-date targets can unblock others straight away, so
+                # keep scanning until no more targets become ready
+                progress = True
+                while progress:
+                    progress = False
+                    for name in sorted(pending):
+                        if not set(self.dependencies(name)) <= done:
+                            continue
+                        pending.discard(name)
+                        progress = True
+                        target = self.targets[name]
+                        key = self._key(target, file_hashes)
+                        if not force and self._is_current(target, key, records.get(name), file_hashes):
+                            done.add(name)
+                            results.append(BuildResult(name, 'up to date', 0.0))
+                            continue
+                        future = pool.submit(_run_target, target)
+                        running[future] = (name, key)
+
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Cannot order targets: {sorted(pending)}")
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, key = running.pop(future)
+                    seconds = future.result()
+                    target = self.targets[name]
+                    records[name] = {
+                        'key': key,
+                        'outputs': {str(path): _content_hash(path, file_hashes) for path in target.outputs},
+                    }
+                    done.add(name)
+                    results.append(BuildResult(name, 'built', seconds))
+                    # Save after every target so an interrupted build keeps its progress
+                    self._save_state(state)
+
+        self._save_state(state)
+        return results
+
+    def _closure(self, names):
+        wanted = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in self.targets:
+                raise KeyError(f"Unknown target {name!r}")
+            if name not in wanted:
+                wanted.add(name)
+                stack.extend(self.dependencies(name))
+        return wanted
+
+    def _key(self, target, file_hashes):
+        digest = hashlib.sha256()
+        # The action is named by its file, not its __module__, which is
+        # '__main__' when its script runs directly and the module name when
+        # another script imports it; both must share up-to-date targets
+        action_file = Path(inspect.getfile(target.action)).resolve()
+        digest.update(f"{action_file}:{target.action.__qualname__}".encode())
+        for path in self._code(target):
+            digest.update(str(path).encode())
+            digest.update(_content_hash(path, file_hashes).encode())
+        digest.update(repr(target.params).encode())
+        for path in target.inputs:
+            digest.update(str(path).encode())
+            digest.update(_content_hash(path, file_hashes).encode())
+        return digest.hexdigest()
+
+    def _code(self, target):
+        # Resolved once per action; the file contents are hashed on every build
+        if target.action not in self._code_files:
+            self._code_files[target.action] = code_files(target.action)
+        return self._code_files[target.action] + sorted(path.resolve() for path in target.code)
+
+    def _is_current(self, target, key, record, file_hashes):
+        if record is None or record['key'] != key:
+            return False
+        # Outputs that were deleted or edited by hand are rebuilt too
+        for path in target.outputs:
+            if not path.exists() or record['outputs'].get(str(path)) != _content_hash(path, file_hashes):
+                return False
+        return True
+
+    def _load_state(self):
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return {'version': STATE_VERSION}
+        if state.get('version') != STATE_VERSION:
+            return {'version': STATE_VERSION}
+        return state
+
+    def _save_state(self, state):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.state_path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(state, indent=2))
+        temporary.replace(self.state_path)
+
+
+def code_files(action):
+    """The source file of ``action`` and of every in-repo module it imports, directly or not."""
+    seen = set()
+    stack = [Path(inspect.getfile(action)).resolve()]
+    while stack:
+        path = stack.pop()
+        if path not in seen:
+            seen.add(path)
+            stack.extend(_imported_files(path))
+    return sorted(seen)
+
+
+def _imported_files(path):
+    # Imports anywhere in the file count, including the ones inside functions
+    names = []
+    for node in ast.walk(ast.parse(path.read_text(), str(path))):
+        if isinstance(node, ast.Import):
+            names += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            # ``from package import name`` may name a submodule
+            names += [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+    files = []
+    for name in names:
+        # Look at the top-level package first: finding a dotted name imports
+        # its parents, which is not worth doing for third-party packages
+        if _repo_file(name.partition('.')[0]) is None:
+            continue
+        origin = _repo_file(name)
+        if origin is not None:
+            files.append(origin)
+    return files
+
+
+def _repo_file(name):
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.has_location or not spec.origin:
+        return None
+    origin = Path(spec.origin).resolve()
+    if origin.suffix != '.py' or ROOT not in origin.parents or 'site-packages' in origin.parts:
+        return None
+    return origin
+
+
+def _content_hash(path, file_hashes):
+    # The SHA-256 of a file, recomputed only when its size or mtime changed
+    path = Path(path)
+    if not path.exists():
+        return 'missing'
+    fingerprint = file_hashes.get(str(path))
+    if fingerprint is None or not fingerprint_matches(fingerprint, path):
+        fingerprint = file_fingerprint(path)
+        file_hashes[str(path)] = fingerprint
+    return fingerprint['sha256']
+
+
+def _run_target(target):
+    start = time.perf_counter()
+    for path in target.outputs:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    target.action(*target.inputs, *target.outputs, *target.params)
+    missing = [str(path) for path in target.outputs if not path.exists()]
+    if missing:
+        raise RuntimeError(f"Target {target.name!r} did not write {', '.join(missing)}")
+    return time.perf_counter() - start
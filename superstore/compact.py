@@ -0,0 +1,328 @@
+"""
+Compact, dictionary-encoded order tables.
+
+A typed order table from ``load_orders`` still keeps Order ID, Customer
+Name, Product Name, City and the other string columns as Python objects, so
+it takes several times the size of the CSV in memory. ``OrderTable`` stores
+the same rows as plain NumPy arrays:
+
+- string and categorical columns as a dictionary of distinct labels plus the
+  smallest integer codes that can index it,
+- Order ID (``CA-2017-152156``) as its prefix code, an int16 year and an
+  int32 order number,
+- money (Sales, Profit) as int64 fixed point: whole cents when every value
+  has at most two decimals, otherwise the smallest power of ten that keeps
+  every value exact (the raw extract has Sales like 957.5775),
+- day-precision dates as int32 days since 1970-01-01,
+- other numbers with integers narrowed to the smallest dtype that fits.
+
+Every encoding round-trips exactly; a column that would not (an Order ID in
+another layout, money with more than six decimals, dates with a time of
+day) keeps a looser encoding instead. Missing values are kept.
+
+``to_frame`` goes back to pandas without touching the rows of dictionary
+columns: they become categoricals over the stored codes, and Order ID is
+formatted once per distinct order.
+
+Example::
+
+    table = OrderTable.from_frame(load_orders(path))
+    table.nbytes, table.memory_usage()
+    df = table.to_frame(['Order Date', 'Region', 'Sales'])
+"""
+
+import numpy as np
+import pandas as pd
+
+from superstore.loader import load_orders
+
+MONEY_COLUMNS = ['Sales', 'Profit']
+
+# Fixed-point scales tried for money columns, finest last
+MONEY_SCALES = [100, 1000, 10000, 100000, 1000000]
+
+# Sentinels for missing values in integer-encoded columns
+MISSING_FIXED = np.iinfo(np.int64).min
+MISSING_DAY = np.iinfo(np.int32).min
+
+ORDER_ID_PATTERN = r'^([A-Z]+)-(\d{4})-(\d+)$'
+
+NANOSECONDS_PER_DAY = 86_400 * 10 ** 9
+
+
+class OrderTable:
+    """An order table held as dictionary codes and narrow NumPy arrays."""
+
+    def __init__(self, columns, n_rows):
+        self._columns = dict(columns)
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_frame(cls, df):
+        """Encode every column of ``df``."""
+        columns = {name: _encode(name, df[name]) for name in df.columns}
+        return cls(columns, len(df))
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays and dictionaries of every column."""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def memory_usage(self):
+        """Bytes per column and its encoding, as a DataFrame."""
+        return pd.DataFrame(
+            {'encoding': [column.kind for column in self._columns.values()],
+             'bytes': [column.nbytes for column in self._columns.values()]},
+            index=pd.Index(self.columns, name='column'),
+        )
+
+    def column(self, name):
+        """One column decoded to a pandas Series."""
+        return pd.Series(self._columns[name].decode(), name=name)
+
+    def codes(self, name):
+        """``(codes, labels)`` of a dictionary-encoded column, for grouping without decoding."""
+        column = self._columns[name]
+        if not isinstance(column, DictionaryColumn):
+            raise TypeError(f"Column {name!r} is not dictionary-encoded ({column.kind})")
+        return column.codes, column.labels
+
+    def to_frame(self, columns=None):
+        """Decode ``columns`` (all by default) into a DataFrame."""
+        names = self.columns if columns is None else [name for name in columns if name in self._columns]
+        return pd.DataFrame({name: self._columns[name].decode() for name in names}, copy=False)
+
+    def take(self, rows):
+        """A new table with only ``rows`` (positions or a boolean mask)."""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return OrderTable({name: column.take(rows) for name, column in self._columns.items()}, len(rows))
+
+    def select(self, columns):
+        """A new table with only ``columns``; the arrays are shared, not copied."""
+        return OrderTable({name: self._columns[name] for name in columns if name in self._columns}, self.n_rows)
+
+
+def load_order_table(filepath, columns=None, filters=None, workers=1):
+    """Load an extract (or partitioned dataset) straight into an ``OrderTable``."""
+    return OrderTable.from_frame(load_orders(filepath, workers=workers, columns=columns, filters=filters))
+
+
+class DictionaryColumn:
+    """Distinct labels plus integer codes; -1 marks a missing value."""
+
+    kind = 'dictionary'
+
+    def __init__(self, codes, labels):
+        self.codes = codes
+        self.labels = labels
+
+    @classmethod
+    def encode(cls, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, labels = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, labels = pd.factorize(series, sort=True)
+        return cls(_narrow(codes, len(labels)), pd.Index(labels))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + int(self.labels.memory_usage(deep=True))
+
+    def decode(self):
+        return pd.Categorical.from_codes(self.codes, categories=self.labels)
+
+    def take(self, rows):
+        return DictionaryColumn(self.codes[rows], self.labels)
+
+
+class OrderIdColumn:
+    """Order IDs such as ``CA-2017-152156`` split into prefix code, year and number."""
+
+    kind = 'order_id'
+
+    def __init__(self, prefix_codes, prefixes, years, numbers, width):
+        self.prefix_codes = prefix_codes
+        self.prefixes = prefixes
+        self.years = years
+        self.numbers = numbers
+        self.width = width
+
+    @classmethod
+    def encode(cls, series):
+        """The split column, or None when some ID does not fit the pattern or would not round-trip."""
+        codes, uniques = pd.factorize(series)
+        if not len(uniques):
+            return None
+        parts = pd.Series(uniques, dtype=object).str.extract(ORDER_ID_PATTERN)
+        if parts.isna().any().any():
+            return None
+        widths = parts[2].str.len()
+        if widths.nunique() > 1 or int(widths.iloc[0]) > 9:
+            return None
+        prefix_codes, prefixes = pd.factorize(parts[0], sort=True)
+        missing = codes < 0
+        rows = np.where(missing, 0, codes)
+        return cls(
+            _narrow(np.where(missing, -1, prefix_codes[rows]), len(prefixes)),
+            pd.Index(prefixes),
+            parts[1].astype(np.int16).to_numpy()[rows],
+            parts[2].astype(np.int32).to_numpy()[rows],
+            int(widths.iloc[0]),
+        )
+
+    @property
+    def nbytes(self):
+        return (self.prefix_codes.nbytes + self.years.nbytes + self.numbers.nbytes
+                + int(self.prefixes.memory_usage(deep=True)))
+
+    def decode(self):
+        # Format each distinct order once and point the rows at it
+        present = self.prefix_codes >= 0
+        key = ((self.prefix_codes[present].astype(np.int64) << 48)
+               | (self.years[present].astype(np.int64) << 32) | self.numbers[present])
+        distinct, inverse = np.unique(key, return_inverse=True)
+        prefix = self.prefixes.take(distinct >> 48)
+        year = pd.Index(((distinct >> 32) & 0xFFFF).astype(str))
+        number = pd.Index((distinct & 0xFFFFFFFF).astype(str)).str.zfill(self.width)
+        codes = np.full(len(self.prefix_codes), -1, dtype=np.int64)
+        codes[present] = inverse.reshape(-1)
+        return pd.Categorical.from_codes(codes, categories=prefix + '-' + year + '-' + number)
+
+    def take(self, rows):
+        return OrderIdColumn(self.prefix_codes[rows], self.prefixes, self.years[rows], self.numbers[rows], self.width)
+
+
+class FixedPointColumn:
+    """Decimal values as int64 multiples of ``1 / scale``."""
+
+    kind = 'fixed'
+
+    def __init__(self, values, scale):
+        self.values = values
+        self.scale = scale
+
+    @classmethod
+    def encode(cls, series):
+        """The column at the coarsest exact scale, or None when no scale is exact."""
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(values)
+        for scale in MONEY_SCALES:
+            scaled = np.round(values[present] * scale)
+            if np.array_equal(scaled / scale, values[present]):
+                encoded = np.full(len(values), MISSING_FIXED, dtype=np.int64)
+                encoded[present] = scaled.astype(np.int64)
+                return cls(encoded, scale)
+        return None
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def decode(self):
+        decoded = self.values / self.scale
+        decoded[self.values == MISSING_FIXED] = np.nan
+        return decoded
+
+    def take(self, rows):
+        return FixedPointColumn(self.values[rows], self.scale)
+
+
+class DateColumn:
+    """Day-precision timestamps as int32 days since the epoch."""
+
+    kind = 'date'
+
+    def __init__(self, days):
+        self.days = days
+
+    @classmethod
+    def encode(cls, series):
+        """The column as day numbers, or None when some timestamp has a time of day."""
+        nanoseconds = series.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        missing = series.isna().to_numpy()
+        if (nanoseconds[~missing] % NANOSECONDS_PER_DAY).any():
+            return None
+        days = np.where(missing, MISSING_DAY, nanoseconds // NANOSECONDS_PER_DAY).astype(np.int32)
+        return cls(days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes
+
+    def decode(self):
+        decoded = self.days.astype('datetime64[D]').astype('datetime64[ns]')
+        decoded[self.days == MISSING_DAY] = np.datetime64('NaT')
+        return decoded
+
+    def take(self, rows):
+        return DateColumn(self.days[rows])
+
+
+class PlainColumn:
+    """Any other column, with integers narrowed to the smallest dtype that holds them."""
+
+    kind = 'plain'
+
+    def __init__(self, values, dtype):
+        self.values = values
+        self.dtype = dtype
+
+    @classmethod
+    def encode(cls, series):
+        if not isinstance(series.dtype, np.dtype):
+            # Nullable and other extension arrays already keep their own mask
+            return cls(series.array, series.dtype)
+        values = series.to_numpy()
+        if np.issubdtype(values.dtype, np.integer) and len(values):
+            low, high = int(values.min()), int(values.max())
+            values = values.astype(np.result_type(np.min_scalar_type(low), np.min_scalar_type(high)))
+        return cls(values, series.dtype)
+
+    @property
+    def nbytes(self):
+        return int(self.values.nbytes)
+
+    def decode(self):
+        if isinstance(self.values, np.ndarray) and self.values.dtype != self.dtype:
+            return self.values.astype(self.dtype)
+        return self.values
+
+    def take(self, rows):
+        return PlainColumn(self.values[rows], self.dtype)
+
+
+def _encode(name, series):
+    if name == 'Order ID':
+        column = OrderIdColumn.encode(series)
+        if column is not None:
+            return column
+    if (isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(series.dtype)
+            or pd.api.types.is_string_dtype(series.dtype)):
+        # Text arrives as object or, on pandas 3, with the str dtype
+        return DictionaryColumn.encode(series)
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        column = DateColumn.encode(series)
+        if column is not None:
+            return column
+    if name in MONEY_COLUMNS:
+        column = FixedPointColumn.encode(series)
+        if column is not None:
+            return column
+    return PlainColumn.encode(series)
+
+
+def _narrow(codes, n_labels):
+    # -1 marks a missing value, so the dtype only needs to hold n_labels - 1
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_labels <= np.iinfo(dtype).max:
+            return np.asarray(codes).astype(dtype)
+    return np.asarray(codes).astype(np.int64)
@@ -0,0 +1,159 @@
+"""
+Rank correlation and outlier detection for large order tables.
+
+``spearman`` ranks each column once and correlates the ranks. Shipping delays
+are whole days, with a handful of distinct values shared by millions of rows,
+so ``average_ranks`` handles integer columns with a counting pass over the
+distinct values instead of sorting every row. For very large inputs
+``bootstrap_spearman`` gives an estimate with a confidence interval from
+resampled rows, reusing the ranks computed once over the full columns.
+
+``suspicious_rows`` returns the positions of outlying records as an integer
+array, so callers can count them or ``take`` just those rows without copying
+the table.
+
+scipy is only imported to turn a correlation into a p-value.
+"""
+
+import numpy as np
+
+# Integer columns whose value range is at most this wide are ranked with a
+# bincount over the range instead of a sort
+MAX_COUNTING_RANGE = 1 << 20
+
+DEFAULT_BOOTSTRAP_SAMPLES = 200
+DEFAULT_CONFIDENCE = 0.95
+
+
+def average_ranks(values):
+    """
+    Rank ``values`` from 1, giving tied values the average of their ranks.
+
+    Same result as ``scipy.stats.rankdata(values, method='average')``.
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.empty(0)
+    if (np.issubdtype(values.dtype, np.floating) and np.isfinite(values).all()
+            and np.array_equal(values, np.floor(values))):
+        # Whole-day delays usually arrive as floats (NaN forces the dtype)
+        values = values.astype(np.int64)
+    if np.issubdtype(values.dtype, np.integer):
+        low = values.min()
+        span = int(values.max()) - int(low) + 1
+        if span <= MAX_COUNTING_RANGE:
+            offsets = (values - low).astype(np.int64)
+            counts = np.bincount(offsets, minlength=span)
+            return _tied_ranks(counts)[offsets]
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    return _tied_ranks(counts)[inverse]
+
+
+def _tied_ranks(counts):
+    # Rank of each distinct value: the ranks its rows would span, averaged
+    ends = np.cumsum(counts)
+    return ends - (counts - 1) / 2.0
+
+
+def spearman(x, y):
+    """
+    Spearman rank correlation of two equal-length columns.
+
+    Rows where either value is missing are dropped. Returns
+    ``(correlation, p_value)`` like ``scipy.stats.spearmanr``, or
+    ``(None, None)`` when fewer than three rows remain.
+    """
+    x, y = _paired(x, y)
+    if len(x) < 3:
+        return None, None
+    correlation = _pearson(average_ranks(x), average_ranks(y))
+    return correlation, _p_value(correlation, len(x))
+
+
+def bootstrap_spearman(x, y, n_samples=DEFAULT_BOOTSTRAP_SAMPLES, sample_size=None,
+                       confidence=DEFAULT_CONFIDENCE, seed=0):
+    """
+    Spearman correlation with a percentile-bootstrap confidence interval.
+
+    The columns are ranked once; every bootstrap sample then draws
+    ``sample_size`` rows (all rows by default) with replacement and
+    correlates their precomputed ranks, so no sample is re-sorted. A
+    ``sample_size`` well below the number of rows keeps the cost bounded for
+    very large inputs. Returns ``(correlation, (low, high))``.
+    """
+    x, y = _paired(x, y)
+    if len(x) < 3:
+        return None, (None, None)
+    x_ranks = average_ranks(x)
+    y_ranks = average_ranks(y)
+    correlation = _pearson(x_ranks, y_ranks)
+
+    rng = np.random.default_rng(seed)
+    size = len(x) if sample_size is None else min(sample_size, len(x))
+    estimates = np.empty(n_samples)
+    for sample in range(n_samples):
+        rows = rng.integers(0, len(x), size)
+        estimates[sample] = _pearson(x_ranks[rows], y_ranks[rows])
+    tail = (1 - confidence) / 2
+    low, high = np.nanquantile(estimates, [tail, 1 - tail])
+    return correlation, (float(low), float(high))
+
+
+def suspicious_rows(values, n_std=3.0, fallback_margin=30.0):
+    """
+    Positions of values that are negative or above ``median + n_std * std``.
+
+    Missing values are never flagged. When the std is undefined (fewer than
+    two values) the threshold is ``median + fallback_margin``. Returns
+    ``(positions, threshold)``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = values[~np.isnan(values)]
+    if len(present) == 0:
+        threshold = fallback_margin
+    else:
+        median = np.median(present)
+        if len(present) > 1:
+            threshold = median + n_std * present.std(ddof=1)
+        else:
+            threshold = median + fallback_margin
+    with np.errstate(invalid='ignore'):
+        flagged = (values < 0) | (values > threshold)
+    return np.flatnonzero(flagged), float(threshold)
+
+
+def _paired(x, y):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    keep = ~(_missing(x) | _missing(y))
+    return x[keep], y[keep]
+
+
+def _missing(values):
+    if np.issubdtype(values.dtype, np.floating):
+        return np.isnan(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return np.zeros(len(values), dtype=bool)
+    return np.array([value is None or value != value for value in values], dtype=bool)
+
+
+def _pearson(a, b):
+    a = a - a.mean()
+    b = b - b.mean()
+    denominator = np.sqrt((a * a).sum() * (b * b).sum())
+    if denominator == 0:
+        return np.nan
+    return float((a * b).sum() / denominator)
+
+
+def _p_value(correlation, n):
+    # Two-sided test on the t statistic with n - 2 degrees of freedom, the
+    # same approximation scipy.stats.spearmanr uses
+    if np.isnan(correlation) or n <= 2:
+        return np.nan
+    if abs(correlation) >= 1:
+        return 0.0
+    from scipy import stats as scipy_stats
+
+    t = correlation * np.sqrt((n - 2) / (1 - correlation * correlation))
+    return float(2 * scipy_stats.t.sf(abs(t), n - 2))
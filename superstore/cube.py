@@ -0,0 +1,339 @@
+"""
+Pre-aggregated sales cube for fast roll-up and slice queries.
+
+Most questions we ask of the order data (sales by region, top states, margin
+by sub-category, monthly sales by category) are sums over a handful of
+dimensions. The cube aggregates the order table once down to one row per
+combination of
+
+    Year x Month x Region x State x Segment x Category x Sub-Category x Ship Mode
+
+keeping the Sales / Profit / Quantity totals, the row count and a small
+HyperLogLog sketch of the distinct Order IDs in each cell. Any coarser view is
+then a roll-up over those cells instead of a rescan of the order rows.
+
+A row with a missing dimension value (a blank Ship Mode, or no Year and
+Month because its Order Date did not parse) is kept in a missing-value cell
+of that dimension, so the cube's totals are always those of the whole
+table. Roll-ups show that group with a missing label, like
+``groupby(dropna=False)``.
+
+Example::
+
+    cube = SalesCube.build(df)
+    cube.query(by=['Region'])
+    cube.query(by=['Year', 'Month'], where={'Category': 'Technology'})
+    cube.query(by=['Segment'], distinct_orders=True)
+"""
+
+from pathlib import Path
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from superstore import sketches
+from superstore.aggregate import AggregationPlan
+from superstore.loader import CACHE_DIR, cache_key, file_fingerprint, fingerprint_matches, load_orders
+
+CUBE_DIMENSIONS = ['Year', 'Month', 'Region', 'State', 'Segment', 'Category', 'Sub-Category', 'Ship Mode']
+CUBE_MEASURES = ['Sales', 'Profit', 'Quantity']
+
+# Order sketches are kept per cell, so their precision is deliberately low:
+# 2**8 one-byte registers per cell, about 6.5% relative error per estimate.
+ORDER_SKETCH_PRECISION = 8
+
+CUBE_VERSION = 1
+
+# Measure totals must match the order table to the cent
+TOTAL_TOLERANCE = 0.005
+
+
+class SalesCube:
+    """Order measures pre-aggregated over the sales dimensions."""
+
+    def __init__(self, dimensions, labels, codes, measures, rows, order_registers=None):
+        self.dimensions = list(dimensions)
+        # labels[dim] holds the distinct values; codes[dim] points into them
+        self.labels = labels
+        self.codes = codes
+        self.measures = measures
+        self.rows = rows
+        self.order_registers = order_registers
+        # Fingerprint of the order file the cube was built from, if known
+        self.source = None
+
+    @property
+    def n_cells(self):
+        return len(self.rows)
+
+    @classmethod
+    def build(cls, df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES,
+              order_sketch_precision=ORDER_SKETCH_PRECISION):
+        """
+        Aggregate an order table into a cube.
+
+        ``Year`` and ``Month`` are derived from Order Date when missing.
+        Dimensions and measures that the table does not have (the raw extract
+        has no Profit or Quantity) are skipped. Pass
+        ``order_sketch_precision=None`` to leave out the distinct-order
+        sketches.
+        """
+        df = _with_calendar_columns(df, dimensions)
+        dimensions = [dimension for dimension in dimensions if dimension in df.columns]
+        measures = [measure for measure in measures if measure in df.columns]
+
+        plan = AggregationPlan(df, dropna=False)
+        plan.add('rows', dimensions, None, 'count')
+        for measure in measures:
+            plan.add(measure, dimensions, measure, 'sum')
+        results = plan.run()
+
+        cell_index = results['rows'].index
+        if len(dimensions) == 1:
+            cell_index = pd.MultiIndex.from_arrays([cell_index])
+        labels = {}
+        codes = {}
+        for level, dimension in enumerate(dimensions):
+            level_values = cell_index.get_level_values(level)
+            level_codes, level_labels = pd.factorize(level_values, sort=True, use_na_sentinel=False)
+            labels[dimension] = level_labels
+            codes[dimension] = level_codes.astype(_code_dtype(len(level_labels)))
+
+        cube_measures = {
+            measure: results[measure].to_numpy(dtype=np.float64) for measure in measures
+        }
+        rows = results['rows'].to_numpy(dtype=np.int64)
+
+        order_registers = None
+        if order_sketch_precision is not None and 'Order ID' in df.columns:
+            cell_of_row, _ = plan.row_groups(dimensions)
+            usable = cell_of_row >= 0
+            hashes, present = sketches.hash_values(df['Order ID'])
+            usable &= present
+            order_registers = sketches.group_registers(
+                hashes[usable], cell_of_row[usable], len(rows), order_sketch_precision
+            )
+
+        return cls(dimensions, labels, codes, cube_measures, rows, order_registers)
+
+    def query(self, by=(), where=None, measures=None, distinct_orders=False):
+        """
+        Roll the cube up to the ``by`` dimensions.
+
+        ``where`` filters cells before rolling up, e.g.
+        ``{'Region': 'West', 'Year': [2016, 2017]}``. The result is a tidy
+        DataFrame with one row per group: the ``by`` columns, the measure
+        totals, the number of order rows and (optionally) the estimated
+        number of distinct orders.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        measures = list(self.measures) if measures is None else list(measures)
+        for dimension in by + list(where or {}):
+            if dimension not in self.dimensions:
+                raise KeyError(f"{dimension!r} is not a cube dimension")
+        if distinct_orders and self.order_registers is None:
+            raise ValueError("This cube was built without distinct-order sketches")
+
+        selected = self._select(where)
+
+        # Combine the codes of the roll-up dimensions into one group id per cell
+        group_ids = np.zeros(len(selected), dtype=np.int64)
+        shape = []
+        for dimension in by:
+            n_labels = len(self.labels[dimension])
+            group_ids = group_ids * n_labels + self.codes[dimension][selected]
+            shape.append(n_labels)
+        cell_groups, group_ids = np.unique(group_ids, return_inverse=True)
+        n_groups = len(cell_groups)
+
+        result = {}
+        positions = np.unravel_index(cell_groups, shape) if by else []
+        for dimension, pos in zip(by, positions):
+            result[dimension] = self.labels[dimension].take(pos)
+        for measure in measures:
+            result[measure] = np.bincount(
+                group_ids, weights=self.measures[measure][selected], minlength=n_groups
+            )
+        result['Rows'] = np.bincount(group_ids, weights=self.rows[selected], minlength=n_groups).astype(np.int64)
+
+        if distinct_orders:
+            result['Orders'] = np.round(self._distinct_orders(selected, group_ids, n_groups)).astype(np.int64)
+
+        return pd.DataFrame(result)
+
+    def total(self, measure, where=None):
+        """Return a single measure total, optionally filtered."""
+        selected = self._select(where)
+        if measure == 'Rows':
+            return int(self.rows[selected].sum())
+        return float(self.measures[measure][selected].sum())
+
+    def _select(self, where):
+        mask = np.ones(self.n_cells, dtype=bool)
+        for dimension, wanted in (where or {}).items():
+            if np.ndim(wanted) == 0:
+                wanted = [wanted]
+            wanted_codes = self.labels[dimension].get_indexer(list(wanted))
+            mask &= np.isin(self.codes[dimension], wanted_codes[wanted_codes >= 0])
+        return np.flatnonzero(mask)
+
+    def _distinct_orders(self, selected, group_ids, n_groups):
+        if n_groups == 0:
+            return np.zeros(0)
+        # Merging sketches is an element-wise maximum over each group's cells:
+        # sort the cells by group and reduce each contiguous run
+        order = np.argsort(group_ids, kind='stable')
+        registers = self.order_registers[selected[order]]
+        starts = np.flatnonzero(np.r_[True, np.diff(group_ids[order]) != 0])
+        merged = np.maximum.reduceat(registers, starts, axis=0)
+        return sketches.estimate_distinct(merged)
+
+    # -- persistence -------------------------------------------------------
+
+    def save(self, directory, source=None):
+        """Write the cube to ``directory`` as .npy arrays plus a JSON manifest."""
+        # Written to a scratch directory that replaces ``directory`` at the
+        # end, as loader._write_snapshot does, so an interrupted save never
+        # leaves a half-written cube that load_cube would accept
+        target = Path(directory)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        directory = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+        if directory.exists():
+            shutil.rmtree(directory)
+        directory.mkdir()
+
+        manifest = {
+            'version': CUBE_VERSION,
+            'source': source,
+            'dimensions': self.dimensions,
+            'measures': list(self.measures),
+            'labels': {dim: _to_json_list(self.labels[dim]) for dim in self.dimensions},
+            'has_order_sketches': self.order_registers is not None,
+        }
+        for position, dimension in enumerate(self.dimensions):
+            np.save(directory / f"dim{position:02d}.npy", self.codes[dimension])
+        for position, measure in enumerate(self.measures):
+            np.save(directory / f"measure{position:02d}.npy", self.measures[measure])
+        np.save(directory / 'rows.npy', self.rows)
+        if self.order_registers is not None:
+            np.save(directory / 'orders.npy', self.order_registers)
+        (directory / 'cube.json').write_text(json.dumps(manifest, indent=2))
+
+        if target.exists():
+            shutil.rmtree(target)
+        directory.rename(target)
+
+    @classmethod
+    def load(cls, directory):
+        """Read a cube written by ``save`` (arrays are memory-mapped)."""
+        directory = Path(directory)
+        manifest = json.loads((directory / 'cube.json').read_text())
+        if manifest.get('version') != CUBE_VERSION:
+            raise ValueError(f"Unsupported cube version in {directory}")
+
+        dimensions = manifest['dimensions']
+        labels = {dim: _from_json_list(manifest['labels'][dim], dim) for dim in dimensions}
+        codes = {
+            dim: np.load(directory / f"dim{position:02d}.npy", mmap_mode='r')
+            for position, dim in enumerate(dimensions)
+        }
+        measures = {
+            measure: np.load(directory / f"measure{position:02d}.npy", mmap_mode='r')
+            for position, measure in enumerate(manifest['measures'])
+        }
+        rows = np.load(directory / 'rows.npy', mmap_mode='r')
+        order_registers = None
+        if manifest['has_order_sketches']:
+            order_registers = np.load(directory / 'orders.npy', mmap_mode='r')
+        cube = cls(dimensions, labels, codes, measures, rows, order_registers)
+        cube.source = manifest.get('source')
+        return cube
+
+
+def load_cube(filepath, cache_dir=CACHE_DIR, workers=1):
+    """
+    Return the cube for an order extract, building it only when needed.
+
+    The cube is stored under ``cache_dir`` together with the fingerprint of
+    the file it was built from, and rebuilt whenever that file changes.
+    ``workers`` is passed on to ``load_orders`` for the rebuild.
+    """
+    filepath = Path(filepath)
+    cube_dir = Path(cache_dir) / f"cube-{cache_key(filepath)}"
+    manifest_path = cube_dir / 'cube.json'
+    if manifest_path.exists():
+        try:
+            cube = SalesCube.load(cube_dir)
+        except (OSError, ValueError, KeyError):
+            cube = None
+        if cube is not None and cube.source:
+            mtime_before = cube.source['mtime_ns']
+            if fingerprint_matches(cube.source, filepath):
+                if cube.source['mtime_ns'] != mtime_before:
+                    manifest = json.loads(manifest_path.read_text())
+                    manifest['source'] = cube.source
+                    tmp_path = manifest_path.with_suffix(f".tmp-{os.getpid()}")
+                    tmp_path.write_text(json.dumps(manifest, indent=2))
+                    tmp_path.replace(manifest_path)
+                return cube
+
+    cube = SalesCube.build(load_orders(filepath, cache_dir=cache_dir, workers=workers))
+    source = file_fingerprint(filepath)
+    cube.save(cube_dir, source=source)
+    cube.source = source
+    return cube
+
+
+def check_totals(cube, df, tolerance=TOTAL_TOLERANCE):
+    """
+    Compare the cube's grand totals with those of the order table ``df``.
+
+    Returns a list of problems, empty when the row count and every measure
+    total agree.
+    """
+    problems = []
+    if cube.total('Rows') != len(df):
+        problems.append(f"Rows: cube has {cube.total('Rows'):,}, the orders {len(df):,}")
+    for measure in cube.measures:
+        expected = float(df[measure].sum())
+        actual = cube.total(measure)
+        if abs(actual - expected) > tolerance:
+            problems.append(f"{measure}: cube total {actual:,.2f}, the orders {expected:,.2f}")
+    return problems
+
+
+def _with_calendar_columns(df, dimensions):
+    extra = {}
+    if 'Order Date' not in df.columns:
+        return df
+    # Nullable integers keep the labels as 2017 rather than 2017.0 when
+    # some order dates could not be parsed
+    if 'Year' in dimensions and 'Year' not in df.columns:
+        extra['Year'] = df['Order Date'].dt.year.astype('Int16')
+    if 'Month' in dimensions and 'Month' not in df.columns:
+        extra['Month'] = df['Order Date'].dt.month.astype('Int8')
+    return df.assign(**extra) if extra else df
+
+
+def _code_dtype(n_labels):
+    for dtype in ('int8', 'int16', 'int32'):
+        if n_labels <= np.iinfo(dtype).max:
+            return dtype
+    return 'int64'
+
+
+def _to_json_list(index):
+    # Convert numpy scalars (e.g. Year as int32) to plain Python values and
+    # missing labels to null
+    return [None if pd.isna(value) else value.item() if hasattr(value, 'item') else value for value in index]
+
+
+def _from_json_list(values, name):
+    # Integer labels with a null stay integers (2017, not 2017.0)
+    present = [value for value in values if value is not None]
+    if len(present) < len(values) and all(isinstance(value, int) for value in present):
+        return pd.Index(pd.array(values, dtype='Int64'), name=name)
+    return pd.Index(values, name=name)
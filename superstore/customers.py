@@ -0,0 +1,248 @@
+"""
+Customer analytics over an order index: RFM scores, acquisition cohorts and basket sizes.
+
+The order table has one row per order line, and customer questions (when did
+this customer first buy, how many orders did they place, which months were
+they active in) need every order of a customer together. ``OrderIndex``
+collapses the lines into orders once and sorts them by Customer ID and Order
+Date, so each customer's orders form one contiguous run. ``offsets[c]`` to
+``offsets[c + 1]`` are the positions of customer ``c``'s orders.
+
+Everything is then a vectorized pass over those sorted arrays, without a
+groupby per question:
+
+- per-customer first/last order, order count and spend come from the run
+  boundaries (``np.add.reduceat``),
+- ``rfm`` ranks recency, frequency and monetary value into quantile scores
+  with one sort each,
+- ``cohorts`` counts the customers of each first-order month still ordering
+  N months later. Because a customer's orders are sorted by date, an order
+  whose month differs from the previous order of the same customer starts a
+  new active month, so counting distinct customers is a comparison with the
+  neighbouring element and one ``np.bincount``,
+- ``basket_sizes`` is the distribution of lines (or units) per order.
+
+Calendar periods use the integer day numbers of ``superstore.timeseries``.
+
+Example::
+
+    index = build_order_index('data/superstore_sales.csv')
+    index.rfm().head()
+    index.retention().round(2)
+    index.basket_sizes()
+"""
+
+import numpy as np
+import pandas as pd
+
+from superstore.loader import load_orders
+from superstore.timeseries import MISSING_DAY, day_numbers, period_codes, period_starts
+
+ORDER_COLUMNS = ['Order ID', 'Customer ID', 'Order Date', 'Sales', 'Quantity']
+
+# Quantile scores per RFM dimension (5 = best)
+RFM_BINS = 5
+
+
+class OrderIndex:
+    """Orders sorted by customer and date, with the offsets of each customer's run."""
+
+    def __init__(self, customer_ids, order_ids, customers, days, sales, lines, quantity):
+        self.customer_ids = customer_ids
+        self.order_ids = order_ids
+        self.customers = customers
+        self.days = days
+        self.sales = sales
+        self.lines = lines
+        self.quantity = quantity
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(customers, minlength=len(customer_ids)))])
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Build the index from order lines.
+
+        Lines without an Order ID, a Customer ID or an Order Date are left
+        out. An order's customer and date are taken from its first line.
+        """
+        days = day_numbers(df['Order Date'])
+        keep = (days != MISSING_DAY) & df['Order ID'].notna().to_numpy() & df['Customer ID'].notna().to_numpy()
+        order_codes, order_ids = pd.factorize(df['Order ID'].to_numpy()[keep])
+        customer_codes, customer_ids = pd.factorize(df['Customer ID'].to_numpy()[keep], sort=True)
+        days = days[keep]
+        sales = np.nan_to_num(df['Sales'].to_numpy(dtype=np.float64, na_value=np.nan)[keep])
+        if 'Quantity' in df.columns:
+            quantity = np.nan_to_num(df['Quantity'].to_numpy(dtype=np.float64, na_value=np.nan)[keep])
+        else:
+            quantity = np.ones(len(sales))
+
+        # Lines to orders: sort by order code and reduce each run
+        by_order = np.argsort(order_codes, kind='stable')
+        sorted_codes = order_codes[by_order]
+        starts = np.flatnonzero(np.diff(sorted_codes, prepend=-1))
+        first_lines = by_order[starts]
+        order_sales = _run_sums(sales[by_order], starts)
+        order_quantity = _run_sums(quantity[by_order], starts)
+        order_lines = np.diff(np.append(starts, len(by_order)))
+
+        # Orders to customer runs, each run in date order
+        order_customers, order_days = customer_codes[first_lines], days[first_lines]
+        position = np.lexsort((order_days, order_customers))
+        return cls(
+            pd.Index(customer_ids),
+            pd.Index(order_ids[sorted_codes[starts]][position]),
+            order_customers[position],
+            order_days[position],
+            order_sales[position],
+            order_lines[position],
+            order_quantity[position],
+        )
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def n_customers(self):
+        return len(self.customer_ids)
+
+    @property
+    def order_counts(self):
+        """Orders per customer."""
+        return np.diff(self.offsets)
+
+    @property
+    def first_days(self):
+        """Day number of each customer's first order."""
+        return self.days[self.offsets[:-1]]
+
+    @property
+    def last_days(self):
+        """Day number of each customer's latest order."""
+        return self.days[self.offsets[1:] - 1]
+
+    @property
+    def spend(self):
+        """Total Sales per customer."""
+        return _run_sums(self.sales, self.offsets[:-1])
+
+    def customer_summary(self):
+        """One row per customer: first and last order date, orders, spend and mean order value."""
+        counts, spend = self.order_counts, self.spend
+        return pd.DataFrame({
+            'First Order': _dates(self.first_days),
+            'Last Order': _dates(self.last_days),
+            'Orders': counts,
+            'Sales': spend,
+            'Average Order Value': spend / counts,
+        }, index=pd.Index(self.customer_ids, name='Customer ID'))
+
+    def rfm(self, as_of=None, bins=RFM_BINS):
+        """
+        Recency, frequency and monetary value per customer with their quantile scores.
+
+        Recency is the number of days from the customer's latest order to
+        ``as_of`` (default: the day after the latest order in the index).
+        Each measure is ranked and cut into ``bins`` equal-sized groups,
+        ``bins`` being the best (most recent, most frequent, highest spend);
+        ties are broken by position, like ``qcut`` on ``rank(method='first')``.
+        """
+        if as_of is None:
+            as_of_day = int(self.days.max()) + 1 if len(self) else 0
+        else:
+            as_of_day = int(day_numbers(pd.Series([pd.Timestamp(as_of)]))[0])
+        recency = as_of_day - self.last_days
+        frequency, monetary = self.order_counts, self.spend
+        scores = {
+            'R': _quantile_scores(-recency, bins),
+            'F': _quantile_scores(frequency, bins),
+            'M': _quantile_scores(monetary, bins),
+        }
+        table = pd.DataFrame({'Recency': recency, 'Frequency': frequency, 'Monetary': monetary, **scores},
+                             index=pd.Index(self.customer_ids, name='Customer ID'))
+        table['RFM'] = table['R'].astype(str) + table['F'].astype(str) + table['M'].astype(str)
+        return table
+
+    def cohorts(self, freq='month'):
+        """
+        Active customers per acquisition cohort and period since acquisition.
+
+        Rows are the ``freq`` periods of the customers' first orders, columns
+        the number of periods since (0 = the acquisition period, which holds
+        the cohort size). A customer counts once per period however many
+        orders they placed in it.
+        """
+        if not len(self):
+            return pd.DataFrame(index=pd.DatetimeIndex([], name='Cohort'))
+        periods = period_codes(self.days, freq)
+        cohort_of_customer = periods[self.offsets[:-1]]
+        ages = periods - cohort_of_customer[self.customers]
+        # Orders are sorted by customer then date: a new (customer, period)
+        # pair starts wherever either changes from the previous order
+        active = np.ones(len(self), dtype=bool)
+        active[1:] = (self.customers[1:] != self.customers[:-1]) | (periods[1:] != periods[:-1])
+
+        cohort_codes = cohort_of_customer[self.customers[active]]
+        first_cohort = int(cohort_of_customer.min())
+        n_cohorts = int(cohort_of_customer.max()) - first_cohort + 1
+        n_ages = int(ages.max()) + 1
+        counts = np.bincount((cohort_codes - first_cohort) * n_ages + ages[active],
+                             minlength=n_cohorts * n_ages).reshape(n_cohorts, n_ages)
+        cohort_starts = period_starts(first_cohort + np.arange(n_cohorts), freq)
+        table = pd.DataFrame(counts, index=pd.DatetimeIndex(_dates(cohort_starts), name='Cohort'),
+                             columns=pd.RangeIndex(n_ages, name='Periods Since'))
+        # Keep only periods in which somebody was acquired
+        return table[table[0] > 0]
+
+    def retention(self, freq='month'):
+        """``cohorts`` as the share of each cohort still active, with periods not yet reached missing."""
+        counts = self.cohorts(freq)
+        if counts.empty:
+            return counts.astype(float)
+        shares = counts.div(counts[0], axis=0)
+        # A cohort acquired k periods before the last one can only be seen k periods on
+        last_period = int(period_codes(self.days.max(), freq))
+        reachable = last_period - period_codes(_days(counts.index), freq)
+        return shares.where(np.arange(counts.shape[1]) <= reachable[:, None])
+
+    def basket_sizes(self, by='lines'):
+        """Orders per basket size: the number of lines (``by='lines'``) or units (``'quantity'``) in an order."""
+        if by not in ('lines', 'quantity'):
+            raise ValueError(f"Unknown basket measure {by!r}; expected 'lines' or 'quantity'")
+        sizes = (self.lines if by == 'lines' else self.quantity).astype(np.int64)
+        counts = np.bincount(sizes) if len(sizes) else np.zeros(0, dtype=np.int64)
+        present = np.flatnonzero(counts)
+        return pd.DataFrame({'Orders': counts[present], 'Share': counts[present] / max(len(sizes), 1)},
+                            index=pd.Index(present, name='Lines' if by == 'lines' else 'Units'))
+
+    def basket_summary(self):
+        """Mean, median and 90th percentile of lines, units and value per order."""
+        measures = {'Lines': self.lines, 'Units': self.quantity, 'Sales': self.sales}
+        return pd.DataFrame({
+            name: {'mean': values.mean(), 'median': np.median(values), 'p90': np.percentile(values, 90)}
+            for name, values in measures.items() if len(values)
+        }).T
+
+
+def build_order_index(filepath, workers=1, filters=None):
+    """Load the columns the index needs from ``filepath`` (file or dataset) and build it."""
+    return OrderIndex.from_frame(load_orders(filepath, workers=workers, columns=ORDER_COLUMNS, filters=filters))
+
+
+def _run_sums(values, starts):
+    # Sum of each run beginning at ``starts`` (reduceat rejects an empty index)
+    return np.add.reduceat(values, starts) if len(starts) else values[:0]
+
+
+def _quantile_scores(values, bins):
+    # Rank with one stable sort, then cut the ranks into equal-sized groups
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[np.argsort(values, kind='stable')] = np.arange(len(values))
+    return (ranks * bins // max(len(values), 1) + 1).astype(np.int8)
+
+
+def _dates(days):
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype('datetime64[ns]')
+
+
+def _days(dates):
+    return pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
@@ -0,0 +1,448 @@
+"""
+Run the same aggregation specs on pandas, Polars or DuckDB.
+
+A spec is ``(keys, measure, reducer)`` as taken by ``AggregationPlan.add``
+(see ``analysis.REPORT_AGGREGATIONS``). ``run_aggregations`` evaluates a dict
+of named specs on one of the ``ENGINES`` and returns the results in the same
+shape whatever the engine: a Series per grouped spec, indexed by its keys in
+sorted order, and a plain number for a grand total.
+
+- ``pandas`` loads the extract with the shared loader and runs an
+  ``AggregationPlan`` (a DataFrame already in memory can be passed instead
+  of a path).
+- ``polars`` builds one lazy query per spec over ``scan_csv`` /
+  ``scan_parquet`` and collects them together, so the file is scanned once,
+  only the referenced columns are read, and the work runs on every core.
+  Polars rejects a bare quote inside a field (``5-1/2" x 4"`` in
+  ``data/superstore_sales.csv``); such a file is parsed by the shared loader
+  instead, with a note on stderr, and only the aggregation runs in Polars.
+- ``duckdb`` reads the referenced columns into an in-process DuckDB table
+  (a Parquet file is queried in place) and runs one SQL query per spec.
+
+A ``filters`` list (see ``superstore.filters``) is pushed down on every
+engine: into the loader's row-group pruning for pandas, into the scan for
+Polars, and into the WHERE clause that fills the DuckDB table.
+
+Polars and DuckDB are optional; asking for an engine that is not installed
+raises ``ImportError``. The derived ``Year``, ``Month`` and ``Quarter``
+columns come from Order Date on every engine, and dates in a CSV are parsed
+with the format ``superstore.dates`` detects for the file.
+
+``check_parity`` runs the specs on several engines and lists every result
+that differs from the first engine's by more than half a cent;
+``scripts/check_consistency.py`` runs it on clean and dirty synthetic
+extracts.
+
+Example::
+
+    results = run_aggregations(REPORT_AGGREGATIONS, 'data/superstore_sales.csv', engine='polars')
+    problems = check_parity(REPORT_AGGREGATIONS, 'data/superstore_sales.csv')
+"""
+
+from pathlib import Path
+import importlib
+import importlib.util
+import sys
+
+import numpy as np
+import pandas as pd
+
+from superstore.aggregate import AggregationPlan, REDUCERS
+from superstore.dates import detect_date_format
+from superstore.filters import DERIVED_COLUMNS, apply_filters, normalize_filters, projected_columns
+from superstore.loader import DATE_COLUMNS, load_orders
+
+# Polars and DuckDB take longer to import than a report takes to compute, so
+# they are imported on first use of their engine (see _require)
+pl = None
+duckdb = None
+
+ENGINES = ('pandas', 'polars', 'duckdb')
+
+# Largest difference between engines that still counts as agreeing
+PARITY_TOLERANCE = 0.005
+
+# Rows read to detect the date format of a CSV for Polars and DuckDB
+DATE_SAMPLE_ROWS = 10000
+
+SQL_REDUCERS = {
+    'sum': 'coalesce(sum({m}), 0)',
+    'count': 'count({m})',
+    'mean': 'avg({m})',
+    'min': 'min({m})',
+    'max': 'max({m})',
+    'nunique': 'count(DISTINCT {m})',
+}
+
+
+def available_engines():
+    """The engines that can run here: pandas plus whichever optional libraries are installed."""
+    installed = {engine: engine == 'pandas' or importlib.util.find_spec(engine) is not None for engine in ENGINES}
+    return [engine for engine in ENGINES if installed[engine]]
+
+
+def run_aggregations(specs, source, engine='pandas', workers=None, filters=None):
+    """
+    Evaluate the named ``specs`` over the rows of ``source`` matching ``filters``.
+
+    ``source`` is a CSV or Parquet path, or (pandas only) a DataFrame.
+    ``workers`` is the number of parse processes for pandas and of threads
+    for DuckDB (by default all cores); Polars sizes its own thread pool from
+    ``POLARS_MAX_THREADS``.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}")
+    specs = {name: _normalize_spec(keys, measure, reducer) for name, (keys, measure, reducer) in specs.items()}
+    filters = normalize_filters(filters)
+    if engine == 'pandas':
+        return _run_pandas(specs, source, workers, filters)
+    if isinstance(source, pd.DataFrame):
+        raise TypeError(f"The {engine} engine reads from a file; pass a CSV or Parquet path")
+    if engine == 'polars':
+        return _run_polars(specs, Path(source), filters)
+    return _run_duckdb(specs, Path(source), workers, filters)
+
+
+def spec_columns(specs):
+    """The stored columns the specs read; Year, Month and Quarter read Order Date."""
+    columns = set()
+    for keys, measure, _ in specs.values():
+        columns.update([keys] if isinstance(keys, str) else keys)
+        if measure is not None:
+            columns.add(measure)
+    return sorted(projected_columns(columns, None))
+
+
+def check_parity(specs, source, engines=None, tolerance=PARITY_TOLERANCE, filters=None):
+    """
+    Run ``specs`` on each engine and compare every result with the first engine's.
+
+    ``engines`` defaults to every installed engine. Returns a list of
+    human-readable differences, empty when the engines agree.
+    """
+    engines = list(engines or available_engines())
+    results = {engine: run_aggregations(specs, source, engine, filters=filters) for engine in engines}
+    reference, expected = engines[0], results[engines[0]]
+    problems = []
+    for engine in engines[1:]:
+        for name in specs:
+            difference = _difference(expected[name], results[engine][name], tolerance)
+            if difference:
+                problems.append(f"{name}: {engine} differs from {reference} ({difference})")
+    return problems
+
+
+def add_derived_columns(df):
+    """Add Year, Month and Quarter from Order Date, as ``analysis.load_and_prepare_data`` does."""
+    # Nullable integers, so that an unparsed Order Date does not turn the
+    # years into floats whose labels (2015.0) no other engine produces
+    df['Year'] = df['Order Date'].dt.year.astype('Int32')
+    df['Month'] = df['Order Date'].dt.month.astype('Int32')
+    df['Quarter'] = df['Order Date'].dt.quarter.astype('Int32')
+    return df
+
+
+def _normalize_spec(keys, measure, reducer):
+    if reducer not in REDUCERS:
+        raise ValueError(f"Unknown reducer {reducer!r}; expected one of {REDUCERS}")
+    if measure is None and reducer != 'count':
+        raise ValueError(f"Reducer {reducer!r} needs a measure column")
+    return (tuple([keys] if isinstance(keys, str) else keys), measure, reducer)
+
+
+def _sample_date_formats(path, columns):
+    # The loader detects a format per column; do the same on a sample of rows
+    dates = [column for column in DATE_COLUMNS if column in columns]
+    if not dates:
+        return {}
+    sample = pd.read_csv(path, usecols=dates, dtype=str, nrows=DATE_SAMPLE_ROWS)
+    return {column: detect_date_format(sample[column].dropna().unique())[0] for column in dates}
+
+
+def _result(index_columns, keys, values, measure, integer=False):
+    # The shape AggregationPlan returns: sorted Series, or a scalar for no keys
+    if not keys:
+        value = values[0] if len(values) else np.nan
+        if value is None:
+            return np.nan
+        return int(value) if integer else float(value)
+    values = np.array([np.nan if value is None else value for value in values],
+                      dtype=np.int64 if integer else np.float64)
+    if len(keys) == 1:
+        index = pd.Index(index_columns[0], name=keys[0])
+    else:
+        index = pd.MultiIndex.from_arrays(index_columns, names=list(keys))
+    return pd.Series(values, index=index, name=measure or 'count').sort_index()
+
+
+def _integer_result(reducer, measure_is_integer):
+    return reducer in ('count', 'nunique') or (reducer == 'sum' and measure_is_integer)
+
+
+# -- pandas -----------------------------------------------------------------
+
+def _run_pandas(specs, source, workers, filters):
+    columns = spec_columns(specs)
+    if isinstance(source, pd.DataFrame):
+        df = apply_filters(source, filters)
+    elif Path(source).suffix == '.parquet':
+        df = pd.read_parquet(source, columns=projected_columns(columns, filters))
+        df = apply_filters(df, filters, columns)
+    else:
+        df = load_orders(source, workers=workers or 1, columns=columns, filters=filters)
+    if any(column not in df.columns for column in DERIVED_COLUMNS) and 'Order Date' in df.columns:
+        df = add_derived_columns(df.copy(deep=False))
+    plan = AggregationPlan(df)
+    for name, (keys, measure, reducer) in specs.items():
+        plan.add(name, list(keys), measure, reducer)
+    return plan.run()
+
+
+def _require(engine):
+    # Bind the module global (pl or duckdb) the first time the engine runs
+    global pl, duckdb
+    try:
+        module = importlib.import_module(engine)
+    except ImportError:
+        raise ImportError(f"The {engine} engine needs the '{engine}' package") from None
+    if engine == 'polars':
+        pl = module
+    else:
+        duckdb = module
+
+
+# -- Polars -----------------------------------------------------------------
+
+def _run_polars(specs, path, filters):
+    _require('polars')
+    columns = projected_columns(spec_columns(specs), filters)
+    try:
+        frame = _polars_frame(path, columns)
+        for column, op, value in filters:
+            # Polars pushes these predicates down into the scan
+            frame = frame.filter(_polars_condition(frame, column, op, value))
+        queries = _polars_queries(specs, frame)
+        # One collect for every query lets Polars share the scan between them
+        collected = pl.collect_all(queries)
+    except pl.exceptions.ComputeError as error:
+        # Polars rejects a bare quote inside a field (5-1/2" x 4") that
+        # pandas accepts; such a file is parsed by the shared loader and only
+        # the aggregation runs in Polars
+        if path.suffix == '.parquet' or 'malformed' not in str(error):
+            raise
+        print(f"Polars cannot parse {path.name} ({str(error).splitlines()[0]}); "
+              f"reading it with the shared loader instead", file=sys.stderr)
+        df = load_orders(path, columns=columns, filters=filters)
+        frame = _with_polars_dates(_polars_from_pandas(df).lazy(), columns, {})
+        queries = _polars_queries(specs, frame)
+        collected = pl.collect_all(queries)
+
+    schema = frame.collect_schema()
+    results = {}
+    for name, table in zip(specs, collected):
+        keys, measure, reducer = specs[name]
+        integer = _integer_result(reducer, measure is not None and schema[measure].is_integer())
+        index_columns = [table[key].to_list() for key in keys]
+        results[name] = _result(index_columns, keys, table['__value'].to_list(), measure, integer)
+    return results
+
+
+def _polars_from_pandas(df):
+    # Column by column, so that the conversion does not need pyarrow
+    data = {}
+    for name, column in df.items():
+        if isinstance(column.dtype, np.dtype) and column.dtype != object:
+            data[name] = column.to_numpy()
+        else:
+            data[name] = pl.Series(name, column.astype(object).where(column.notna(), None).tolist())
+    return pl.DataFrame(data)
+
+
+def _polars_queries(specs, frame):
+    queries = []
+    for keys, measure, reducer in specs.values():
+        query = frame.drop_nulls(list(keys)) if keys else frame
+        value = _polars_expr(measure, reducer).alias('__value')
+        queries.append(query.group_by(list(keys)).agg(value) if keys else query.select(value))
+    return queries
+
+
+def _polars_frame(path, columns):
+    if path.suffix == '.parquet':
+        frame = pl.scan_parquet(path).select(columns)
+    else:
+        # Dates come in as text and are parsed below with the detected format
+        overrides = {column: pl.Utf8 for column in DATE_COLUMNS}
+        frame = pl.scan_csv(path, schema_overrides=overrides, infer_schema_length=DATE_SAMPLE_ROWS).select(columns)
+    formats = _sample_date_formats(path, columns) if path.suffix != '.parquet' else {}
+    return _with_polars_dates(frame, columns, formats)
+
+
+def _with_polars_dates(frame, columns, formats):
+    # Date columns as pl.Date (text parsed with ``formats``) plus Year, Month
+    # and Quarter from Order Date
+    schema = frame.collect_schema()
+    parsed = []
+    for column in DATE_COLUMNS:
+        if column not in columns:
+            continue
+        if schema[column] == pl.Utf8:
+            parsed.append(pl.col(column).str.strptime(pl.Date, formats.get(column), strict=False))
+        else:
+            parsed.append(pl.col(column).cast(pl.Date))
+    if parsed:
+        frame = frame.with_columns(parsed)
+    if 'Order Date' in columns:
+        order_date = pl.col('Order Date')
+        frame = frame.with_columns(
+            order_date.dt.year().alias('Year'),
+            order_date.dt.month().alias('Month'),
+            order_date.dt.quarter().alias('Quarter'),
+        )
+    return frame
+
+
+def _polars_condition(frame, column, op, value):
+    expr = pl.col(column)
+    if frame.collect_schema()[column] == pl.Date:
+        value = [pd.Timestamp(item).date() for item in value] if op in ('in', 'between') else pd.Timestamp(value).date()
+    if op == 'in':
+        return expr.is_in(value)
+    if op == 'between':
+        return expr.is_between(value[0], value[1])
+    return {
+        '==': expr.__eq__, '!=': expr.__ne__, '<': expr.__lt__,
+        '<=': expr.__le__, '>': expr.__gt__, '>=': expr.__ge__,
+    }[op](value)
+
+
+def _polars_expr(measure, reducer):
+    if measure is None:
+        return pl.len()
+    column = pl.col(measure)
+    if reducer == 'nunique':
+        return column.drop_nulls().n_unique()
+    return getattr(column, reducer)()
+
+
+# -- DuckDB -----------------------------------------------------------------
+
+def _run_duckdb(specs, path, workers, filters):
+    _require('duckdb')
+    columns = projected_columns(spec_columns(specs), filters)
+    connection = duckdb.connect()
+    try:
+        if workers:
+            connection.execute(f"SET threads = {int(workers)}")
+        _duckdb_orders(connection, path, columns, filters)
+        types = dict(connection.execute("SELECT column_name, column_type FROM (DESCRIBE orders)").fetchall())
+        results = {}
+        for name, (keys, measure, reducer) in specs.items():
+            value = SQL_REDUCERS[reducer].format(m=_quote(measure) if measure else '*')
+            key_list = ', '.join(_quote(key) for key in keys)
+            if keys:
+                not_null = ' AND '.join(f"{_quote(key)} IS NOT NULL" for key in keys)
+                sql = f"SELECT {key_list}, {value} FROM orders WHERE {not_null} GROUP BY {key_list}"
+            else:
+                sql = f"SELECT {value} FROM orders"
+            rows = connection.execute(sql).fetchall()
+            integer = _integer_result(reducer, measure is not None and 'INT' in types[measure])
+            index_columns = [[row[position] for row in rows] for position in range(len(keys))]
+            results[name] = _result(index_columns, keys, [row[-1] for row in rows], measure, integer)
+        return results
+    finally:
+        connection.close()
+
+
+def _duckdb_orders(connection, path, columns, filters):
+    # A CSV is read once into a columnar table with just the needed columns
+    # and rows; a Parquet file is left in place and queried through a view
+    selected = []
+    if path.suffix == '.parquet':
+        source = f"read_parquet({_literal(path)})"
+        formats = {}
+    else:
+        date_types = ', '.join(f"{_literal(column)}: 'VARCHAR'" for column in DATE_COLUMNS)
+        source = f"read_csv({_literal(path)}, header = true, types = {{{date_types}}})"
+        formats = _sample_date_formats(path, columns)
+    for column in columns:
+        if column in formats:
+            selected.append(f"try_strptime({_quote(column)}, {_literal(formats[column])})::DATE AS {_quote(column)}")
+        elif column in DATE_COLUMNS:
+            selected.append(f"{_quote(column)}::DATE AS {_quote(column)}")
+        else:
+            selected.append(_quote(column))
+    # Year, Month and Quarter are taken from the parsed Order Date, so they
+    # go in the outer SELECT: inside, "Order Date" is still the source text
+    derived = ''
+    if 'Order Date' in columns:
+        derived = ''.join(f", {part}(\"Order Date\") AS \"{name}\""
+                          for part, name in [('year', 'Year'), ('month', 'Month'), ('quarter', 'Quarter')])
+    kind = 'VIEW' if path.suffix == '.parquet' else 'TABLE'
+    where = ' AND '.join(_sql_condition(column, op, value) for column, op, value in filters) or 'true'
+    connection.execute(
+        f"CREATE TEMP {kind} orders AS SELECT *{derived} "
+        f"FROM (SELECT {', '.join(selected)} FROM {source}) WHERE {where}"
+    )
+
+
+def _sql_condition(column, op, value):
+    # Values are inlined as literals because views cannot take parameters
+    def sql_value(item):
+        if column in DATE_COLUMNS:
+            return f"DATE {_literal(pd.Timestamp(item).date().isoformat())}"
+        if isinstance(item, str):
+            return _literal(item)
+        return str(item)
+
+    if op == 'in':
+        return f"{_quote(column)} IN ({', '.join(sql_value(item) for item in value)})"
+    if op == 'between':
+        return f"{_quote(column)} BETWEEN {sql_value(value[0])} AND {sql_value(value[1])}"
+    return f"{_quote(column)} {'=' if op == '==' else op} {sql_value(value)}"
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# -- parity -----------------------------------------------------------------
+
+def _difference(expected, actual, tolerance):
+    # Describe how two results differ, or return None when they agree
+    if not isinstance(expected, pd.Series):
+        if pd.isna(expected) and pd.isna(actual):
+            return None
+        if abs(expected - actual) <= tolerance:
+            return None
+        return f"{expected} != {actual}"
+    expected = _string_index(expected)
+    actual = _string_index(actual)
+    if not expected.index.equals(actual.index):
+        missing = expected.index.difference(actual.index)
+        extra = actual.index.difference(expected.index)
+        return f"groups differ: missing {list(missing[:5])}, extra {list(extra[:5])}"
+    gap = (expected.astype(float) - actual.astype(float)).abs()
+    both_missing = expected.isna() & actual.isna()
+    wrong = ~both_missing & ~(gap <= tolerance)
+    if not wrong.any():
+        return None
+    label = wrong.idxmax()
+    return f"{int(wrong.sum())} groups, e.g. {label}: {expected[label]} != {actual[label]}"
+
+
+def _string_index(series):
+    # Engines type keys differently (int32 vs int64 years, categories vs
+    # text), so groups are matched on their text form
+    if isinstance(series.index, pd.MultiIndex):
+        index = pd.MultiIndex.from_arrays(
+            [series.index.get_level_values(level).astype(str) for level in range(series.index.nlevels)],
+            names=series.index.names,
+        )
+    else:
+        index = series.index.astype(str)
+    return pd.Series(series.to_numpy(), index=index).sort_index()
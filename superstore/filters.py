@@ -0,0 +1,243 @@
+"""
+Row filters that the loaders can push down to storage.
+
+A filter is a list of ``(column, op, value)`` conditions that must all hold,
+for example ``[('Year', '==', 2017), ('Region', '==', 'West')]``. ``op`` is
+one of ``OPERATORS``; ``'in'`` takes a list and ``'between'`` an inclusive
+``(low, high)`` pair. ``Year``, ``Month`` and ``Quarter`` are derived from
+Order Date, so filtering on them reads Order Date.
+
+The same filter is used at two levels:
+
+- ``may_match`` looks only at per-block statistics (min/max of a column, or
+  the set of labels present) and says whether a block of rows could hold a
+  match, so the loader can skip whole row groups or partitions unread,
+- ``filter_mask`` evaluates the conditions exactly on the rows that were read.
+
+Example::
+
+    filters = [('Year', '==', 2017), ('Region', '==', 'West')]
+    df = load_orders(path, columns=['Category', 'Sales'], filters=filters)
+"""
+
+import numpy as np
+import pandas as pd
+
+OPERATORS = ('==', '!=', '<', '<=', '>', '>=', 'in', 'between')
+
+# Calendar parts of Order Date that can be filtered on as if they were columns
+DERIVED_COLUMNS = {'Year': 'year', 'Month': 'month', 'Quarter': 'quarter'}
+DERIVED_FROM = 'Order Date'
+
+
+def normalize_filters(filters):
+    """Check ``filters`` and return them as a list of ``(column, op, value)`` tuples."""
+    normalized = []
+    for column, op, value in filters or []:
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown filter operator {op!r}; expected one of {OPERATORS}")
+        if op == 'in':
+            value = list(value)
+        elif op == 'between':
+            low, high = value
+            value = (low, high)
+        normalized.append((column, op, value))
+    return normalized
+
+
+def filter_columns(filters):
+    """The stored columns needed to evaluate ``filters``."""
+    columns = []
+    for column, _, _ in normalize_filters(filters):
+        column = DERIVED_FROM if column in DERIVED_COLUMNS else column
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def projected_columns(columns, filters):
+    """``columns`` plus the stored columns ``filters`` need, or None to read everything."""
+    if columns is None:
+        return None
+    wanted = [DERIVED_FROM if column in DERIVED_COLUMNS else column for column in columns]
+    return list(dict.fromkeys(wanted + filter_columns(filters)))
+
+
+def column_values(df, column):
+    """A column of ``df``, computing Year/Month/Quarter from Order Date when it is not stored."""
+    if column not in df.columns and column in DERIVED_COLUMNS:
+        return getattr(df[DERIVED_FROM].dt, DERIVED_COLUMNS[column])
+    return df[column]
+
+
+def filter_mask(df, filters):
+    """Boolean array of the rows of ``df`` that satisfy every condition."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in normalize_filters(filters):
+        values = column_values(df, column)
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            value = _as_timestamps(op, value)
+        mask &= _compare(values, op, value).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+
+def apply_filters(df, filters, columns=None):
+    """Keep the rows matching ``filters`` and then only ``columns`` (all when None)."""
+    if filters:
+        df = df[filter_mask(df, filters)].reset_index(drop=True)
+    if columns is not None:
+        kept = [column for column in df.columns if column in columns]
+        if len(kept) < len(df.columns):
+            df = df[kept]
+    return df
+
+
+def may_match(stats, filters):
+    """
+    Whether a block with these statistics can contain a row matching ``filters``.
+
+    ``stats`` has ``'min'`` and ``'max'`` dicts for range columns and a
+    ``'values'`` dict of the labels present for low-cardinality columns.
+    Conditions on columns without statistics never rule a block out.
+    """
+    for column, op, value in normalize_filters(filters):
+        if column in DERIVED_COLUMNS:
+            low, high = _derived_range(stats, column)
+            if low is not None and not _range_may_match(low, high, op, value):
+                return False
+        elif column in stats.get('values', {}):
+            present = stats['values'][column]
+            if not any(_compare(pd.Series([label]), op, value).iloc[0] for label in present):
+                return False
+        elif column in stats.get('min', {}):
+            low, high = stats['min'][column], stats['max'][column]
+            if low is None:
+                # Every value in the block is missing, so no comparison holds
+                return op == '!='
+            if isinstance(low, pd.Timestamp):
+                value = _as_timestamps(op, value)
+            if not _range_may_match(low, high, op, value):
+                return False
+    return True
+
+
+def year_filters(first=None, last=None):
+    """Conditions keeping order years from ``first`` to ``last`` (either may be open)."""
+    if first is not None and last is not None:
+        return [('Year', 'between', (first, last))]
+    if first is not None:
+        return [('Year', '>=', first)]
+    if last is not None:
+        return [('Year', '<=', last)]
+    return []
+
+
+def month_filters(first=None, last=None):
+    """Conditions keeping orders from month ``first`` to month ``last`` (``'YYYY-MM'``, either may be open)."""
+    filters = []
+    if first is not None:
+        filters.append((DERIVED_FROM, '>=', pd.Timestamp(first)))
+    if last is not None:
+        filters.append((DERIVED_FROM, '<', pd.Timestamp(last) + pd.offsets.MonthBegin(1)))
+    return filters
+
+
+def add_filter_arguments(parser):
+    """Add the --years / --months / --region / --segment / --category options shared by the report scripts."""
+    parser.add_argument('--years', type=int, nargs='+', metavar='YEAR',
+                        help='only orders from this year, or from the first to the last year given')
+    parser.add_argument('--months', nargs='+', metavar='YYYY-MM',
+                        help='only orders from this month, or from the first to the last month given')
+    parser.add_argument('--region', nargs='+', help='only orders from these regions')
+    parser.add_argument('--segment', nargs='+', help='only orders from these customer segments')
+    parser.add_argument('--category', nargs='+', help='only orders in these product categories')
+
+
+def filters_from_args(args):
+    """The filter list for the options added by ``add_filter_arguments``."""
+    filters = []
+    if args.years:
+        filters += year_filters(min(args.years), max(args.years))
+    if args.months:
+        filters += month_filters(min(args.months), max(args.months))
+    for column, values in [('Region', args.region), ('Segment', args.segment), ('Category', args.category)]:
+        if values:
+            filters.append((column, 'in', values))
+    return filters
+
+
+def describe_filters(filters):
+    """Short text form of ``filters`` for report headers."""
+    parts = []
+    for column, op, value in normalize_filters(filters):
+        if op == 'between':
+            parts.append(f"{column} {value[0]}-{value[1]}")
+        elif op == 'in':
+            parts.append(f"{column} in {', '.join(str(item) for item in value)}")
+        elif isinstance(value, pd.Timestamp):
+            parts.append(f"{column} {op} {value.date()}")
+        else:
+            parts.append(f"{column} {op} {value}")
+    return '; '.join(parts) if parts else 'all rows'
+
+
+def _compare(values, op, value):
+    if isinstance(values.dtype, pd.CategoricalDtype) and op not in ('==', '!=', 'in'):
+        # Unordered categories cannot be compared with < or >, their labels can
+        values = values.astype(object)
+    if op == '==':
+        return values == value
+    if op == '!=':
+        return values != value
+    if op == '<':
+        return values < value
+    if op == '<=':
+        return values <= value
+    if op == '>':
+        return values > value
+    if op == '>=':
+        return values >= value
+    if op == 'in':
+        return values.isin(value)
+    low, high = value
+    return (values >= low) & (values <= high)
+
+
+def _range_may_match(low, high, op, value):
+    # Could some value in [low, high] satisfy the condition?
+    if op == '==':
+        return low <= value <= high
+    if op == '!=':
+        return not (low == high == value)
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+    if op == '>':
+        return high > value
+    if op == '>=':
+        return high >= value
+    if op == 'in':
+        return any(low <= item <= high for item in value)
+    return high >= value[0] and low <= value[1]
+
+
+def _derived_range(stats, column):
+    # Year bounds follow from the Order Date bounds; Month and Quarter only
+    # when the block lies within a single year
+    low = stats.get('min', {}).get(DERIVED_FROM)
+    high = stats.get('max', {}).get(DERIVED_FROM)
+    if low is None or high is None:
+        return None, None
+    if column != 'Year' and low.year != high.year:
+        return None, None
+    part = DERIVED_COLUMNS[column]
+    return getattr(low, part), getattr(high, part)
+
+
+def _as_timestamps(op, value):
+    if op == 'in':
+        return [pd.Timestamp(item) for item in value]
+    if op == 'between':
+        return (pd.Timestamp(value[0]), pd.Timestamp(value[1]))
+    return pd.Timestamp(value)
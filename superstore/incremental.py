@@ -0,0 +1,238 @@
+"""
+Incremental refresh of the monthly sales partial sums.
+
+New orders are only ever appended to the raw extract, so a nightly refresh
+does not need to re-read the whole history. After each run we record a
+watermark: how many bytes of the file were processed, the last Row ID and
+Order Date seen, and a checksum of the bytes just before the watermark. We
+also keep the aggregate state itself: Sales totals and row counts per
+Year x Month x Segment x Category.
+
+The watermark always sits just after a line break. A row that a writer
+has only partly appended is left for the next run instead of being read
+and resumed from the middle.
+
+On the next run only the bytes after the watermark are parsed. Their partial
+sums are added to the stored ones, and only the months that received new
+orders change. If the file was rewritten rather than appended to (it got
+shorter, its header or the checksum changed, or Row IDs went backwards),
+the state is rebuilt from the full file.
+"""
+
+from pathlib import Path
+import hashlib
+import json
+
+import pandas as pd
+
+from superstore.aggregate import AggregationPlan
+from superstore.loader import CACHE_DIR, cache_key, load_orders, read_header, read_orders_csv
+
+PARTIAL_KEYS = ['Year', 'Month', 'Segment', 'Category']
+
+# The checksum covers this many bytes just before the watermark. That is
+# enough to notice a rewritten file without re-reading its whole history.
+CHECKSUM_WINDOW = 64 * 1024
+
+STATE_VERSION = 1
+
+
+def refresh_partials(filepath, state_dir=None, workers=1):
+    """
+    Bring the stored partial sums up to date with ``filepath``.
+
+    Returns ``(partials, info)``. ``partials`` is a tidy DataFrame with the
+    ``PARTIAL_KEYS`` columns plus ``Sales`` and ``Rows``. ``info`` says how
+    the refresh ran: ``mode`` is ``'full'``, ``'incremental'`` or
+    ``'unchanged'``. It also gives the number of new rows and the months
+    whose totals changed. ``workers`` is used for a full rebuild (see
+    ``load_orders``).
+    """
+    filepath = Path(filepath)
+    if state_dir is None:
+        state_dir = CACHE_DIR / f"incremental-{cache_key(filepath)}"
+    state_dir = Path(state_dir)
+
+    state, partials = _load_state(state_dir)
+
+    if state is not None:
+        new_rows, new_state = read_appended(state, filepath)
+        if new_rows is not None and new_state['offset'] == state['offset']:
+            return partials, {'mode': 'unchanged', 'new_rows': 0, 'affected_months': []}
+        if new_rows is not None:
+            new_partials = partial_sums(new_rows)
+            merged = merge_partials(partials, new_partials)
+            _save_state(state_dir, new_state, merged)
+            info = {
+                'mode': 'incremental',
+                'new_rows': len(new_rows),
+                'affected_months': _months(new_partials),
+            }
+            return merged, info
+
+    # No usable state, or the file was not simply appended to: start over
+    df, end = read_complete_rows(filepath, workers=workers)
+    partials = partial_sums(df)
+    state = watermark(filepath, end, df)
+    _save_state(state_dir, state, partials)
+    return partials, {'mode': 'full', 'new_rows': len(df), 'affected_months': _months(partials)}
+
+
+def read_appended(state, filepath):
+    """
+    The rows appended to ``filepath`` since the watermark ``state``, and the new watermark.
+
+    Returns ``(None, None)`` when the file was rewritten rather than appended
+    to, so whatever was built from it has to be rebuilt from the full file.
+    When nothing was appended the rows are empty and the watermark is
+    ``state`` itself.
+    """
+    size = Path(filepath).stat().st_size
+    if not _is_append_of(state, filepath, size):
+        return None, None
+    end = complete_end(filepath, state['offset'], size)
+    if end == state['offset']:
+        return pd.DataFrame(columns=state['header']), state
+    new_rows = read_orders_csv(filepath, start_offset=state['offset'], end_offset=end)
+    if not _row_ids_move_forward(state, new_rows):
+        return None, None
+    return new_rows, watermark(filepath, end, new_rows, previous=state)
+
+
+def read_complete_rows(filepath, workers=1, columns=None):
+    """
+    Every complete row of ``filepath`` and the offset just after the last one.
+
+    A file that ends in a line break is read through ``load_orders`` (and
+    its snapshot); one that ends in a partly written row is parsed only up
+    to the last line break.
+    """
+    size = Path(filepath).stat().st_size
+    end = complete_end(filepath, 0, size)
+    if end == size:
+        return load_orders(filepath, workers=workers, columns=columns), end
+    return read_orders_csv(filepath, columns=columns, end_offset=end), end
+
+
+def complete_end(filepath, start, size):
+    """The offset just after the last line break in ``filepath[start:size]``, or ``start`` if there is none."""
+    with open(filepath, 'rb') as f:
+        end = size
+        while end > start:
+            block_start = max(start, end - CHECKSUM_WINDOW)
+            f.seek(block_start)
+            position = f.read(end - block_start).rfind(b'\n')
+            if position >= 0:
+                return block_start + position + 1
+            end = block_start
+    return start
+
+
+def watermark(filepath, size, rows, previous=None):
+    """The watermark after processing the first ``size`` bytes of ``filepath``, ending with ``rows``."""
+    last_row_id = previous['last_row_id'] if previous else None
+    last_order_date = previous['last_order_date'] if previous else None
+    if 'Row ID' in rows.columns and not rows.empty:
+        last_row_id = int(rows['Row ID'].max())
+    if not rows.empty and rows['Order Date'].notna().any():
+        newest = rows['Order Date'].max()
+        if last_order_date is None or newest > pd.Timestamp(last_order_date):
+            last_order_date = newest.isoformat()
+    return {
+        'version': STATE_VERSION,
+        'path': str(Path(filepath).resolve()),
+        'header': read_header(filepath),
+        'offset': size,
+        'tail_sha256': _tail_checksum(filepath, size),
+        'last_row_id': last_row_id,
+        'last_order_date': last_order_date,
+        'rows': (previous['rows'] if previous else 0) + len(rows),
+    }
+
+
+def partial_sums(df):
+    """
+    Sum Sales and count rows per Year x Month x Segment x Category.
+
+    Rows without an Order Date are left out. A missing Segment or Category
+    is a group of its own, so the monthly totals still count those rows.
+    """
+    df = df.assign(Year=df['Order Date'].dt.year, Month=df['Order Date'].dt.month)
+    keys = [key for key in PARTIAL_KEYS if key in df.columns]
+
+    plan = AggregationPlan(df, dropna=False)
+    plan.add('Sales', keys, 'Sales', 'sum')
+    plan.add('Rows', keys, None, 'count')
+    results = plan.run()
+
+    partials = pd.DataFrame({'Sales': results['Sales'], 'Rows': results['Rows']})
+    partials = partials.reset_index().dropna(subset=['Year', 'Month'])
+    partials['Year'] = partials['Year'].astype(int)
+    partials['Month'] = partials['Month'].astype(int)
+    for column in ['Segment', 'Category']:
+        if column in partials.columns:
+            partials[column] = partials[column].astype(str).where(partials[column].notna())
+    return partials.reset_index(drop=True)
+
+
+def merge_partials(partials, new_partials):
+    """Add two partial-sum tables together, key by key."""
+    keys = [key for key in PARTIAL_KEYS if key in partials.columns]
+    combined = pd.concat([partials, new_partials], ignore_index=True)
+    merged = combined.groupby(keys, as_index=False, dropna=False)[['Sales', 'Rows']].sum()
+    return merged
+
+
+def _months(partials):
+    months = partials[['Year', 'Month']].drop_duplicates().sort_values(['Year', 'Month'])
+    return [f"{year:04d}-{month:02d}" for year, month in months.itertuples(index=False)]
+
+
+def _tail_checksum(filepath, offset):
+    start = max(0, offset - CHECKSUM_WINDOW)
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+def _is_append_of(state, filepath, size):
+    if size < state['offset']:
+        return False
+    if read_header(filepath) != state['header']:
+        return False
+    return _tail_checksum(filepath, state['offset']) == state['tail_sha256']
+
+
+def _row_ids_move_forward(state, new_rows):
+    # Appended rows must continue the Row ID sequence; anything else means
+    # the file was edited and the stored sums can no longer be trusted
+    if 'Row ID' not in new_rows.columns or state['last_row_id'] is None or new_rows.empty:
+        return True
+    return int(new_rows['Row ID'].min()) > state['last_row_id']
+
+
+def _load_state(state_dir):
+    state_path = state_dir / 'state.json'
+    partials_path = state_dir / 'partials.csv'
+    if not state_path.exists() or not partials_path.exists():
+        return None, None
+    try:
+        state = json.loads(state_path.read_text())
+        partials = pd.read_csv(partials_path, dtype={'Segment': str, 'Category': str})
+    except (OSError, ValueError):
+        return None, None
+    if state.get('version') != STATE_VERSION:
+        return None, None
+    return state, partials
+
+
+def _save_state(state_dir, state, partials):
+    # Drop the old watermark before touching the sums: if the run stops half
+    # way, the next run finds no watermark and rebuilds from the full file
+    # instead of adding new rows to half-written sums
+    state_dir.mkdir(parents=True, exist_ok=True)
+    state_path = state_dir / 'state.json'
+    if state_path.exists():
+        state_path.unlink()
+    partials.to_csv(state_dir / 'partials.csv', index=False)
+    state_path.write_text(json.dumps(state, indent=2))
@@ -0,0 +1,418 @@
+"""
+Shared loader for the Superstore order extracts.
+
+Every entry point reads the same CSV layout, so the column types are declared
+once here instead of being re-derived by each script. After the first parse the
+typed table is written to a snapshot of ``.npy`` column files under
+``data/cache/``; later runs memory-map that snapshot and skip CSV and date
+parsing entirely until the source file changes.
+
+Callers can ask for only the columns they use and for a row filter (see
+``superstore.filters``). The snapshot keeps min/max and label statistics per
+row group, so a filtered load maps just the requested columns of the row
+groups that can match.
+"""
+
+from pathlib import Path
+import hashlib
+import io
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from superstore.dates import parse_date_column
+from superstore.filters import apply_filters, may_match, projected_columns
+
+ROOT = Path(__file__).resolve().parents[1]
+RAW_DATA_PATH = ROOT / 'data' / 'raw' / 'superstore.csv'
+CACHE_DIR = ROOT / 'data' / 'cache'
+
+# Bump this whenever the schema or the snapshot layout changes so that old
+# snapshots are rebuilt instead of being read with the wrong types.
+SNAPSHOT_VERSION = 3
+
+# Rows per snapshot row group, the unit a filtered load can skip
+ROW_GROUP_ROWS = 1 << 16
+
+# Low-cardinality dimensions are stored as categoricals: a handful of labels
+# plus small integer codes instead of one Python string per row.
+CATEGORY_COLUMNS = ['Segment', 'Region', 'Category', 'Sub-Category', 'Ship Mode', 'State']
+DATE_COLUMNS = ['Order Date', 'Ship Date']
+
+SCHEMA = {
+    'Row ID': 'int32',
+    'Order ID': 'object',
+    'Order Date': 'object',
+    'Ship Date': 'object',
+    'Ship Mode': 'category',
+    'Customer ID': 'object',
+    'Customer Name': 'object',
+    'Segment': 'category',
+    'Country': 'object',
+    'City': 'object',
+    'State': 'category',
+    # A few raw rows have no postal code, so use the nullable integer type
+    'Postal Code': 'Int32',
+    'Region': 'category',
+    'Product ID': 'object',
+    'Category': 'category',
+    'Sub-Category': 'category',
+    'Product Name': 'object',
+    # Money columns stay float64 so that totals still add up to the cent
+    'Sales': 'float64',
+    'Quantity': 'int32',
+    'Discount': 'float32',
+    'Profit': 'float64',
+}
+
+
+def file_fingerprint(filepath):
+    """Return the size, modification time and SHA-256 hash of a file."""
+    filepath = Path(filepath)
+    stat = filepath.stat()
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': _hash_file(filepath),
+    }
+
+
+def _hash_file(filepath, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_orders_csv(filepath, start_offset=0, columns=None, end_offset=None):
+    """
+    Parse an order extract with the shared schema (no snapshot involved).
+
+    ``start_offset`` is a byte offset at the start of a line; when given, only
+    the rows from that point on are parsed (the header is still taken from
+    the top of the file). ``end_offset``, the offset just after a line
+    break, stops parsing there instead of at the end of the file.
+    ``columns`` limits parsing to those columns. The
+    date parse reports from ``superstore.dates`` are kept in
+    ``df.attrs['date_reports']`` so callers can show what the parser did.
+    """
+    header = read_header(filepath)
+    usecols = header if columns is None else [column for column in header if column in columns]
+    dtypes = csv_dtypes(usecols)
+    if start_offset or end_offset is not None:
+        with open(filepath, 'rb') as f:
+            f.seek(start_offset)
+            source = f if end_offset is None else io.BytesIO(f.read(end_offset - start_offset))
+            # Past the top of the file there is no header line to read
+            names = {'header': None, 'names': header} if start_offset else {}
+            try:
+                df = pd.read_csv(source, usecols=usecols, dtype=dtypes, low_memory=False, **names)
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame({column: pd.Series(dtype=SCHEMA.get(column, 'object')) for column in usecols})
+    else:
+        df = pd.read_csv(filepath, usecols=usecols, dtype=dtypes, low_memory=False)
+
+    date_reports = []
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            df[column], report = parse_date_column(df[column])
+            date_reports.append(report)
+    df.attrs['date_reports'] = date_reports
+    return df
+
+
+def read_header(filepath):
+    """Return the column names from the first line of an extract."""
+    return list(pd.read_csv(filepath, nrows=0).columns)
+
+
+def csv_dtypes(columns):
+    """Return the ``read_csv`` dtypes from SCHEMA for the given columns."""
+    return {column: SCHEMA[column] for column in columns if column in SCHEMA}
+
+
+def load_orders(filepath=RAW_DATA_PATH, use_cache=True, cache_dir=CACHE_DIR, workers=1,
+                columns=None, filters=None):
+    """
+    Load an order extract as a typed DataFrame.
+
+    When ``use_cache`` is true the parsed table is read from (or written to) a
+    binary snapshot keyed on the source file's size, modification time and
+    hash, so repeated runs do not pay for CSV parsing again. Snapshot columns
+    are mapped copy-on-write, so editing the DataFrame in place only copies the
+    touched pages and never writes back to the snapshot.
+
+    With ``workers`` above 1 a CSV that has to be parsed is split across that
+    many processes (see ``superstore.parallel``); the result is the same.
+
+    ``columns`` returns only those columns and ``filters`` only the rows
+    matching a ``superstore.filters`` condition list. From a snapshot, just
+    those columns of the row groups that can match are mapped; a CSV parse
+    without the cache reads only the needed columns. The snapshot itself
+    always holds the whole table, so any later projection can use it.
+
+    ``filepath`` can also be a partitioned dataset directory written by
+    ``superstore.partitions.ingest``; its partition index is then used to
+    skip the partitions the filters rule out.
+    """
+    filepath = Path(filepath)
+    if filepath.is_dir():
+        # Imported here because superstore.partitions builds on this module
+        from superstore.partitions import load_dataset
+        return load_dataset(filepath, columns=columns, filters=filters)
+    projection = projected_columns(columns, filters)
+    if not use_cache:
+        return apply_filters(_parse_orders(filepath, workers, projection), filters, columns)
+
+    snapshot_dir = _snapshot_dir(filepath, cache_dir)
+    manifest = _read_manifest(snapshot_dir)
+    if manifest is not None and _snapshot_is_current(manifest, filepath, snapshot_dir):
+        return _read_snapshot(snapshot_dir, manifest, projection, filters, columns)
+
+    df = _parse_orders(filepath, workers)
+    _write_snapshot(df, snapshot_dir, file_fingerprint(filepath))
+    return apply_filters(df, filters, columns)
+
+
+def _parse_orders(filepath, workers, columns=None):
+    if workers == 1:
+        return read_orders_csv(filepath, columns=columns)
+    # Imported here because superstore.parallel builds on this module
+    from superstore.parallel import read_orders_parallel
+    return read_orders_parallel(filepath, workers=workers, columns=columns)
+
+
+def cache_key(filepath):
+    """
+    Return the name used for files cached from ``filepath``.
+
+    It combines the file name with a short hash of its absolute path so that
+    two extracts with the same file name never share a cache entry.
+    """
+    filepath = Path(filepath)
+    path_key = hashlib.sha1(str(filepath.resolve()).encode('utf-8')).hexdigest()[:10]
+    return f"{filepath.stem}-{path_key}"
+
+
+def _snapshot_dir(filepath, cache_dir):
+    return Path(cache_dir) / cache_key(filepath)
+
+
+def _read_manifest(snapshot_dir):
+    manifest_path = snapshot_dir / 'manifest.json'
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        return None
+    return manifest
+
+
+def fingerprint_matches(fingerprint, filepath):
+    """
+    Check whether ``filepath`` still matches a fingerprint saved earlier.
+
+    Size and modification time are compared first; the content hash is only
+    recomputed when the size matches but the mtime moved (e.g. the file was
+    copied or touched). In that case the saved mtime is refreshed in place so
+    the caller can persist it and skip the hash next time.
+    """
+    stat = Path(filepath).stat()
+    if stat.st_size != fingerprint['size']:
+        return False
+    if stat.st_mtime_ns == fingerprint['mtime_ns']:
+        return True
+    if _hash_file(filepath) != fingerprint['sha256']:
+        return False
+    fingerprint['mtime_ns'] = stat.st_mtime_ns
+    return True
+
+
+def _snapshot_is_current(manifest, filepath, snapshot_dir):
+    previous_mtime = manifest['source']['mtime_ns']
+    if not fingerprint_matches(manifest['source'], filepath):
+        return False
+    if manifest['source']['mtime_ns'] != previous_mtime:
+        (snapshot_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+    return True
+
+
+def _write_snapshot(df, snapshot_dir, fingerprint):
+    # Build the snapshot in a scratch directory and move it into place at the
+    # end, so an interrupted run never leaves a half-written snapshot behind.
+    tmp_dir = snapshot_dir.with_name(f"{snapshot_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    columns = write_columns(df, tmp_dir)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'source': fingerprint,
+        'rows': len(df),
+        'columns': columns,
+        'row_groups': _row_group_stats(df),
+        'date_reports': df.attrs.get('date_reports', []),
+    }
+    (tmp_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+
+    if snapshot_dir.exists():
+        shutil.rmtree(snapshot_dir)
+    tmp_dir.rename(snapshot_dir)
+
+
+def write_columns(df, directory):
+    """Save every column of ``df`` as ``.npy`` files in ``directory``; returns their manifest entries."""
+    return [_write_column(df[column], directory, f"col{position:03d}") for position, column in enumerate(df.columns)]
+
+
+def read_columns(directory, entries, columns=None, ranges=None):
+    """
+    Map columns saved by ``write_columns`` back into a DataFrame.
+
+    ``columns`` picks which entries to read and ``ranges`` which
+    ``(start, stop)`` row ranges; the files are memory-mapped, so nothing
+    outside them is read from disk.
+    """
+    data = {}
+    for entry in entries:
+        if columns is None or entry['name'] in columns:
+            data[entry['name']] = _read_column(directory, entry, ranges)
+    return pd.DataFrame(data, copy=False)
+
+
+def block_stats(df):
+    """
+    JSON-ready statistics of a block of rows, as ``superstore.filters.may_match`` reads them.
+
+    Date and number columns get their min and max, categorical columns the
+    labels present. ``stats_from_json`` turns the saved dates back into
+    timestamps.
+    """
+    stats = {'min': {}, 'max': {}, 'values': {}}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            present = np.unique(series.cat.codes.to_numpy())
+            stats['values'][column] = [str(label) for label in series.cat.categories[present[present >= 0]]]
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+            low, high = series.min(), series.max()
+            stats['min'][column] = None if pd.isna(low) else low.isoformat()
+            stats['max'][column] = None if pd.isna(high) else high.isoformat()
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            low, high = series.min(), series.max()
+            stats['min'][column] = None if pd.isna(low) else low.item()
+            stats['max'][column] = None if pd.isna(high) else high.item()
+    return stats
+
+
+def stats_from_json(stats):
+    """Statistics saved by ``block_stats`` with the date bounds as timestamps again."""
+    def timestamps(bounds):
+        return {
+            column: pd.Timestamp(value) if column in DATE_COLUMNS and value is not None else value
+            for column, value in bounds.items()
+        }
+
+    return dict(stats, min=timestamps(stats['min']), max=timestamps(stats['max']))
+
+
+def _write_column(series, directory, stem):
+    entry = {'name': series.name, 'file': stem}
+
+    if (isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(series.dtype)
+            or pd.api.types.is_string_dtype(series.dtype)):
+        # Strings (object or, on pandas 3, the str dtype) are
+        # dictionary-encoded: integer codes plus a fixed-width unicode array
+        # of labels. Both can be memory-mapped without pickle.
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            entry['kind'] = 'category'
+            codes = series.cat.codes.to_numpy()
+            labels = series.cat.categories.to_numpy()
+        else:
+            entry['kind'] = 'string'
+            codes, labels = pd.factorize(series)
+        np.save(directory / f"{stem}.codes.npy", _narrow_codes(codes, len(labels)))
+        np.save(directory / f"{stem}.labels.npy", np.asarray(labels, dtype=str))
+    elif isinstance(series.dtype, pd.Int32Dtype):
+        entry['kind'] = 'nullable_int'
+        np.save(directory / f"{stem}.values.npy", series.to_numpy(dtype='int32', na_value=0))
+        np.save(directory / f"{stem}.mask.npy", series.isna().to_numpy())
+    else:
+        entry['kind'] = 'numeric'
+        np.save(directory / f"{stem}.values.npy", series.to_numpy())
+    return entry
+
+
+def _row_group_stats(df):
+    row_groups = []
+    for start in range(0, len(df), ROW_GROUP_ROWS):
+        block = df.iloc[start:start + ROW_GROUP_ROWS]
+        row_groups.append({'start': start, 'stop': start + len(block), **block_stats(block)})
+    return row_groups
+
+
+def _matching_ranges(manifest, filters):
+    # Row ranges of the row groups that may hold matches, adjacent ones merged
+    ranges = []
+    for stats in manifest['row_groups']:
+        if not may_match(stats_from_json(stats), filters):
+            continue
+        if ranges and ranges[-1][1] == stats['start']:
+            ranges[-1] = (ranges[-1][0], stats['stop'])
+        else:
+            ranges.append((stats['start'], stats['stop']))
+    return ranges
+
+
+def _narrow_codes(codes, n_labels):
+    # -1 marks a missing value, so the dtype only needs to hold n_labels - 1
+    for dtype in ('int8', 'int16', 'int32'):
+        if n_labels <= np.iinfo(dtype).max:
+            return codes.astype(dtype)
+    return codes.astype('int64')
+
+
+def _read_snapshot(snapshot_dir, manifest, projection=None, filters=None, columns=None):
+    ranges = _matching_ranges(manifest, filters) if filters else None
+    df = read_columns(snapshot_dir, manifest['columns'], projection, ranges)
+    df.attrs['date_reports'] = manifest.get('date_reports', [])
+    return apply_filters(df, filters, columns)
+
+
+def _read_column(directory, entry, ranges=None):
+    stem = entry['file']
+    kind = entry['kind']
+
+    def load(suffix):
+        # Memory-mapped, so rows outside the ranges are never read from disk
+        values = np.load(directory / f"{stem}.{suffix}.npy", mmap_mode='c')
+        if ranges is None:
+            return values
+        if len(ranges) == 1:
+            return values[ranges[0][0]:ranges[0][1]]
+        return np.concatenate([values[start:stop] for start, stop in ranges])
+
+    if kind in ('category', 'string'):
+        codes = load('codes')
+        labels = np.load(directory / f"{stem}.labels.npy")
+        if kind == 'category':
+            return pd.Categorical.from_codes(codes, categories=labels)
+        values = labels.astype(object).take(codes)
+        missing = codes < 0
+        if missing.any():
+            values[missing] = np.nan
+        # Kept as object, as a CSV parse returns them, rather than letting
+        # pandas 3 infer its str dtype
+        return pd.Series(values, dtype=object, copy=False)
+    if kind == 'nullable_int':
+        return pd.arrays.IntegerArray(np.asarray(load('values')), np.asarray(load('mask')))
+    return load('values')
@@ -0,0 +1,223 @@
+"""
+Headless, parameterized execution of the notebooks in notebooks/.
+
+Each notebook starts with a cell tagged ``parameters`` holding its defaults
+(``DATA_PATH``, ``START_DATE``, ``END_DATE``, ``AGGREGATES_PATH``,
+``EXPORT_DIR``).
+``execute_notebook`` adds a cell tagged ``injected-parameters`` right after
+it with the values of this run, the way papermill does, runs the notebook in
+its own kernel and saves the executed copy.
+
+The notebooks read their data through ``notebook_orders`` and
+``notebook_partials`` instead of ``pd.read_csv``:
+
+- ``notebook_orders`` goes through the shared loader, so every kernel maps
+  the same binary snapshot instead of parsing the CSV again,
+- ``notebook_partials`` returns the Year x Month x Segment x Category sales
+  sums, read from ``AGGREGATES_PATH`` when the runner computed them up front.
+
+``prepare_shared_data`` does that up-front work once per run: it builds (or
+reuses) the loader snapshot and pickles the partial sums, so kernels that
+start together do not race to write the snapshot or repeat the roll-up.
+``run_notebooks`` prepares the data and then executes several notebooks at
+once, each in its own kernel, recording the wall time of each.
+
+Executing needs ``nbformat`` and ``nbclient`` (installed with Jupyter); they
+are imported only when a notebook is run.
+
+Example::
+
+    records = run_notebooks(NOTEBOOKS, 'data/cache/notebooks/executed', 'data/cache/notebooks',
+                            start='2017-01-01', end='2017-12-31')
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import ast
+import json
+import pickle
+import time
+
+import pandas as pd
+
+from superstore.filters import apply_filters
+from superstore.incremental import partial_sums
+from superstore.loader import ROOT, cache_key, load_orders
+
+NOTEBOOK_DIR = ROOT / 'notebooks'
+
+NOTEBOOKS = [
+    '01_exploratory_analysis',
+    '02_aggregate_sales_by_category',
+    '03_monthly_sales_trends',
+    'superstore_analysis',
+    'shipping_performance_analysis',
+]
+
+PARAMETERS_TAG = 'parameters'
+INJECTED_TAG = 'injected-parameters'
+
+# Seconds a single cell may run before the notebook counts as failed
+DEFAULT_CELL_TIMEOUT = 600
+
+PARTIAL_COLUMNS = ['Order Date', 'Segment', 'Category', 'Sales']
+
+
+def date_filters(start=None, end=None):
+    """Conditions keeping orders dated from ``start`` to ``end`` inclusive (either may be open)."""
+    filters = []
+    if start is not None:
+        filters.append(('Order Date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('Order Date', '<=', pd.Timestamp(end)))
+    return filters
+
+
+def notebook_orders(data_path, start=None, end=None, columns=None):
+    """The typed order table a notebook works on, limited to orders from ``start`` to ``end``."""
+    return load_orders(data_path, columns=columns, filters=date_filters(start, end))
+
+
+def notebook_partials(data_path, start=None, end=None, aggregates_path=None):
+    """Sales sums per Year x Month x Segment x Category, from the runner's cache when it has one."""
+    if aggregates_path is not None and Path(aggregates_path).exists():
+        with open(aggregates_path, 'rb') as f:
+            cached = pickle.load(f)
+        # The cache only stands in for the same file and date range
+        if cached['key'] == _aggregates_key(data_path, start, end):
+            return cached['partials']
+    return partial_sums(notebook_orders(data_path, start, end, columns=PARTIAL_COLUMNS))
+
+
+def prepare_shared_data(data_path, shared_dir, start=None, end=None):
+    """
+    Warm the loader snapshot of ``data_path`` and pickle its partial sums.
+
+    Returns the path of the pickle, which the notebooks get as
+    ``AGGREGATES_PATH``. It is named after the file (path, size and
+    modification time) and the date range, so a rerun on unchanged data
+    reuses it.
+    """
+    df = load_orders(data_path)
+    stat = Path(data_path).stat()
+    name = f"{cache_key(data_path)}-{stat.st_size}-{stat.st_mtime_ns}_{start or 'first'}_{end or 'last'}"
+    name = name.replace(':', '').replace(' ', 'T')
+    aggregates_path = Path(shared_dir) / f"partials_{name}.pkl"
+    if not aggregates_path.exists():
+        aggregates_path.parent.mkdir(parents=True, exist_ok=True)
+        partials = partial_sums(apply_filters(df, date_filters(start, end), PARTIAL_COLUMNS))
+        cached = {'key': _aggregates_key(data_path, start, end), 'partials': partials}
+        tmp_path = aggregates_path.with_suffix(f".tmp{time.time_ns()}")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(aggregates_path)
+    return aggregates_path
+
+
+def notebook_parameters(path):
+    """The defaults assigned in the ``parameters`` cell of the notebook at ``path``."""
+    cells = json.loads(Path(path).read_text())['cells']
+    defaults = {}
+    for cell in cells:
+        if cell['cell_type'] == 'code' and PARAMETERS_TAG in cell.get('metadata', {}).get('tags', []):
+            for node in ast.parse(''.join(cell['source'])).body:
+                if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                    defaults[node.targets[0].id] = ast.literal_eval(node.value)
+    return defaults
+
+
+def inject_parameters(nb, parameters):
+    """Insert an ``injected-parameters`` cell with ``parameters`` after the ``parameters`` cell."""
+    import nbformat
+
+    source = '# Parameters injected by the notebook runner\n' + ''.join(
+        f"{name} = {value!r}\n" for name, value in parameters.items()
+    )
+    injected = nbformat.v4.new_code_cell(source, metadata={'tags': [INJECTED_TAG]})
+    # A notebook saved by an earlier run already has an injected cell; replace it
+    cells = [cell for cell in nb.cells if INJECTED_TAG not in cell.metadata.get('tags', [])]
+    position = next(
+        (i + 1 for i, cell in enumerate(cells) if PARAMETERS_TAG in cell.metadata.get('tags', [])), 0,
+    )
+    nb.cells = cells[:position] + [injected] + cells[position:]
+    return nb
+
+
+def execute_notebook(path, output_path, parameters=None, timeout=DEFAULT_CELL_TIMEOUT, kernel_name=None):
+    """
+    Run the notebook at ``path`` with ``parameters`` and save the executed copy.
+
+    Cells run with the notebook's own directory as working directory, so its
+    relative paths keep working. Returns a record with the wall time, the
+    number of code cells and the error, if a cell failed (the partly executed
+    notebook is saved either way).
+    """
+    import nbformat
+    from nbclient import NotebookClient
+    from nbclient.exceptions import CellExecutionError
+
+    path, output_path = Path(path), Path(output_path)
+    nb = inject_parameters(nbformat.read(path, as_version=4), parameters or {})
+    client = NotebookClient(
+        nb, timeout=timeout, kernel_name=kernel_name or nb.metadata.get('kernelspec', {}).get('name', 'python3'),
+        resources={'metadata': {'path': str(path.parent)}},
+    )
+    error = None
+    start = time.perf_counter()
+    try:
+        client.execute()
+    except CellExecutionError as exc:
+        error = str(exc).strip().splitlines()[-1] if str(exc).strip() else type(exc).__name__
+    wall_seconds = time.perf_counter() - start
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    nbformat.write(nb, output_path)
+    return {
+        'notebook': path.stem,
+        'wall_seconds': round(wall_seconds, 3),
+        'cells': sum(cell.cell_type == 'code' for cell in nb.cells),
+        'status': 'failed' if error else 'ok',
+        'error': error,
+        'output': str(output_path),
+    }
+
+
+def run_notebooks(names, executed_dir, shared_dir, start=None, end=None, data_path=None,
+                  parallel=None, timeout=DEFAULT_CELL_TIMEOUT):
+    """
+    Execute the notebooks ``names`` side by side and return one record per notebook.
+
+    The data each notebook reads (``data_path``, or its own ``DATA_PATH``
+    default) is prepared once up front. Every notebook then runs in its own
+    kernel, at most ``parallel`` at a time (default: all at once), so the
+    whole run takes about as long as the slowest notebook. Executed copies
+    go to ``executed_dir`` and each notebook's CSV exports to a directory of
+    its own inside it.
+    """
+    executed_dir = Path(executed_dir)
+    jobs = []
+    aggregates = {}
+    for name in names:
+        path = NOTEBOOK_DIR / f"{name}.ipynb"
+        source = Path(data_path) if data_path else (path.parent / notebook_parameters(path)['DATA_PATH'])
+        source = source.resolve()
+        if source not in aggregates:
+            aggregates[source] = prepare_shared_data(source, shared_dir, start, end)
+        parameters = {
+            'DATA_PATH': str(source),
+            'START_DATE': start,
+            'END_DATE': end,
+            'AGGREGATES_PATH': str(aggregates[source]),
+            'EXPORT_DIR': str(executed_dir / f"{name}_exports"),
+        }
+        jobs.append((path, executed_dir / f"{name}.ipynb", parameters))
+
+    # Each notebook runs in a kernel process of its own; these threads only
+    # drive the kernels, so they do not contend for the GIL
+    with ThreadPoolExecutor(max_workers=parallel or len(jobs) or 1) as pool:
+        futures = [pool.submit(execute_notebook, path, output, parameters, timeout) for path, output, parameters in jobs]
+        return [future.result() for future in futures]
+
+
+def _aggregates_key(data_path, start, end):
+    stat = Path(data_path).stat()
+    return (str(Path(data_path).resolve()), stat.st_size, stat.st_mtime_ns, start, end)
@@ -0,0 +1,183 @@
+"""
+Multi-core parsing and pre-aggregation of the order extracts.
+
+An extract is split into byte ranges that start and end on line boundaries.
+That is only safe when every record is one line: a quoted field holding a
+line break, which is legal CSV, could put a boundary inside a record. Our
+extracts have none, and ``read_byte_range`` checks it: a range that parses
+into fewer rows than it has lines raises ``ValueError`` instead of returning
+misaligned rows (parse such a file with one worker). Each range is parsed by
+a worker process with the shared schema, and the results come back in file
+order:
+
+- ``read_orders_parallel`` returns one typed table, identical to a serial
+  ``read_orders_csv``. Workers read the date columns as categoricals, and the
+  parent parses each distinct date string once, exactly as the serial path
+  does, so the parse reports are the same as well.
+- ``map_partitions`` runs a function on every parsed range inside the worker
+  and returns the per-range results (e.g. ``GroupedStats`` or partial sums)
+  for the caller to merge.
+
+Partition boundaries depend only on the file and ``partition_bytes``, never
+on the number of workers, so a merged result is the same for any
+``--workers`` value.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import io
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from superstore.dates import parse_date_column
+from superstore.filters import apply_filters, projected_columns
+from superstore.loader import DATE_COLUMNS, csv_dtypes, read_header
+from superstore.streaming import MEMORY_PER_CSV_BYTE, parse_chunk_dates
+
+PARTITION_BYTES = 16 * 1024 * 1024
+MIN_PARTITION_BYTES = 64 * 1024
+
+# Rows read up front to settle each date column's format before any worker
+# starts, so that every partition parses dates the same way
+FORMAT_SAMPLE_ROWS = 50_000
+
+
+def byte_ranges(filepath, partition_bytes=PARTITION_BYTES):
+    """
+    Split the rows after the header into ``(start, end)`` byte ranges on line boundaries.
+
+    The boundaries assume no record spans lines (no quoted line breaks);
+    ``read_byte_range`` raises when that does not hold.
+    """
+    size = os.path.getsize(filepath)
+    ranges = []
+    with open(filepath, 'rb') as f:
+        f.readline()  # header
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + partition_bytes, size))
+            if f.tell() < size:
+                f.readline()  # move on to the end of the current line
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def partition_bytes_for_budget(max_memory_mb, workers):
+    """Partition size that keeps ``workers`` parsed partitions within ``max_memory_mb``."""
+    budget = max_memory_mb * 1024 * 1024 / (MEMORY_PER_CSV_BYTE * max(workers, 1))
+    return max(int(budget), MIN_PARTITION_BYTES)
+
+
+def read_byte_range(filepath, start, end, columns=None, dtypes=None):
+    """
+    Parse the rows between two line-aligned byte offsets (dates are left as text).
+
+    Raises ``ValueError`` when the range holds a record that spans lines (a
+    quoted field with a line break), since a byte range split on lines
+    cannot be trusted for such a file.
+    """
+    header = read_header(filepath)
+    usecols = header if columns is None else [column for column in header if column in columns]
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    df = pd.read_csv(
+        io.BytesIO(data), header=None, names=header, usecols=usecols,
+        dtype=dtypes if dtypes is not None else csv_dtypes(usecols), low_memory=False,
+    )
+    # One row per non-empty line, unless a quoted field holds a line break
+    lines = sum(1 for line in data.split(b'\n') if line not in (b'', b'\r'))
+    if len(df) < lines:
+        raise ValueError(
+            f"{filepath} has records spanning lines (quoted line breaks) between bytes {start} and {end}; "
+            f"it cannot be split on line boundaries, so parse it with workers=1"
+        )
+    return df
+
+
+def read_orders_parallel(filepath, workers=None, partition_bytes=PARTITION_BYTES, columns=None):
+    """Parse a whole extract with ``workers`` processes; same result as ``read_orders_csv``."""
+    header = read_header(filepath)
+    usecols = header if columns is None else [column for column in header if column in columns]
+    dtypes = csv_dtypes(usecols)
+    for column in DATE_COLUMNS:
+        if column in usecols:
+            dtypes[column] = 'category'
+
+    task = partial(_read_part, filepath, usecols, dtypes)
+    parts = _run(task, byte_ranges(filepath, partition_bytes), workers)
+    df = _concat_parts(parts, usecols, dtypes)
+
+    date_reports = []
+    for column in DATE_COLUMNS:
+        if column in df.columns:
+            df[column], report = parse_date_column(df[column])
+            date_reports.append(report)
+    df.attrs['date_reports'] = date_reports
+    return df
+
+
+def map_partitions(filepath, func, workers=None, columns=None, partition_bytes=PARTITION_BYTES, filters=None):
+    """
+    Parse each partition in a worker and return ``func(chunk)`` for each, in file order.
+
+    ``func`` must be a module-level function so that it can be sent to the
+    worker processes. Chunks have their dates parsed with the formats
+    detected from the top of the file, and only the rows matching
+    ``filters`` (see ``superstore.filters``) are passed on.
+    """
+    header = read_header(filepath)
+    read_columns = projected_columns(columns, filters)
+    usecols = header if read_columns is None else [column for column in header if column in read_columns]
+    date_columns = [column for column in DATE_COLUMNS if column in usecols]
+    locked_formats = {}
+    if date_columns:
+        sample = pd.read_csv(filepath, usecols=date_columns, dtype=str, nrows=FORMAT_SAMPLE_ROWS)
+        parse_chunk_dates(sample, locked_formats)
+
+    task = partial(_map_part, filepath, usecols, locked_formats, func, filters, columns)
+    return _run(task, byte_ranges(filepath, partition_bytes), workers)
+
+
+def _run(task, ranges, workers):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(ranges))
+    if workers <= 1:
+        # Same partitions, same order, no process pool
+        return [task(byte_range) for byte_range in ranges]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(task, ranges))
+
+
+def _read_part(filepath, columns, dtypes, byte_range):
+    start, end = byte_range
+    return read_byte_range(filepath, start, end, columns=columns, dtypes=dtypes)
+
+
+def _map_part(filepath, usecols, locked_formats, func, filters, columns, byte_range):
+    start, end = byte_range
+    chunk = read_byte_range(filepath, start, end, columns=usecols)
+    parse_chunk_dates(chunk, dict(locked_formats))
+    return func(apply_filters(chunk, filters, columns))
+
+
+def _concat_parts(parts, header, dtypes):
+    if not parts:
+        return pd.DataFrame({column: pd.Series(dtype=dtypes.get(column, 'object')) for column in header})
+    # Each partition only knows the categories it saw; unioning them with
+    # sorted categories gives the same dtype a single read_csv would
+    categorical = {}
+    for column, dtype in dtypes.items():
+        if dtype == 'category':
+            categorical[column] = union_categoricals([part[column] for part in parts], sort_categories=True)
+    df = pd.concat(
+        [part.drop(columns=list(categorical)) for part in parts], ignore_index=True
+    )
+    for column, values in categorical.items():
+        df[column] = values
+    return df[header]
@@ -0,0 +1,204 @@
+"""
+Hive-style partitioned order datasets, one directory per order month.
+
+``ingest`` splits an extract by the year and month of its Order Date and
+saves each month in the column-file format of the loader's snapshots::
+
+    data/partitioned/superstore/
+        index.json
+        year=2014/month=01/col000.values.npy ...
+        year=2014/month=02/...
+
+``index.json`` lists every partition with its row count and the same block
+statistics the snapshot keeps per row group (min/max of the date and number
+columns, the labels present in the categorical ones). ``load_dataset``
+checks each partition's statistics against the filters and maps only the
+requested columns of the partitions that can match, so a question about one
+quarter touches three directories.
+
+Rows without an Order Date go to ``year=__HIVE_DEFAULT_PARTITION__``, the
+name Hive uses for a missing key. Rows come back grouped by month, in file
+order within each month.
+
+Example::
+
+    ingest('data/raw/superstore.csv')
+    df = load_orders('data/partitioned/superstore', columns=['Order Date', 'Sales'],
+                     filters=month_filters('2017-01', '2017-03'))
+"""
+
+from pathlib import Path
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from superstore.filters import apply_filters, may_match, projected_columns
+from superstore.loader import (
+    ROOT, SCHEMA, block_stats, file_fingerprint, fingerprint_matches, load_orders, read_columns,
+    stats_from_json, write_columns,
+)
+
+DATASET_DIR = ROOT / 'data' / 'partitioned'
+
+# Bump this whenever the index or partition layout changes
+INDEX_VERSION = 2
+
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def default_dataset_dir(filepath):
+    """Where ``ingest`` puts the dataset for an extract unless told otherwise."""
+    return DATASET_DIR / Path(filepath).stem
+
+
+def is_dataset(path):
+    """Whether ``path`` is a dataset directory written by ``ingest``."""
+    return (Path(path) / 'index.json').exists()
+
+
+def ingest(filepath, dataset_dir=None, workers=1, force=False):
+    """
+    Write ``filepath`` as a dataset partitioned by order year and month.
+
+    The dataset is rebuilt in a scratch directory and swapped in at the end,
+    and not rebuilt at all when it was made from the same file contents
+    (unless ``force``). Returns the partition index.
+    """
+    filepath = Path(filepath)
+    dataset_dir = Path(dataset_dir or default_dataset_dir(filepath))
+    if not force and is_dataset(dataset_dir):
+        index = read_index(dataset_dir)
+        if index is not None and fingerprint_matches(index['source'], filepath):
+            return index
+
+    df = load_orders(filepath, workers=workers)
+    tmp_dir = dataset_dir.with_name(f"{dataset_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    # One stable sort on a yyyymm key groups the rows of each month while
+    # keeping their file order; rows without a date sort first under -1
+    order_date = df['Order Date']
+    month_key = np.where(
+        order_date.isna(), -1,
+        order_date.dt.year.fillna(0).to_numpy(dtype=np.int64) * 100
+        + order_date.dt.month.fillna(0).to_numpy(dtype=np.int64),
+    )
+    order = np.argsort(month_key, kind='stable')
+    df = df.take(order).reset_index(drop=True)
+    month_key = month_key[order]
+    bounds = np.flatnonzero(np.diff(month_key)) + 1
+    starts = np.concatenate([[0], bounds]) if len(df) else np.array([], dtype=np.int64)
+    stops = np.concatenate([bounds, [len(df)]]) if len(df) else np.array([], dtype=np.int64)
+
+    columns = None
+    partitions = []
+    for start, stop in zip(starts, stops):
+        key = int(month_key[start])
+        year, month = (None, None) if key < 0 else divmod(key, 100)
+        relative = partition_path(year, month)
+        block = df.iloc[start:stop].reset_index(drop=True)
+        (tmp_dir / relative).mkdir(parents=True)
+        columns = write_columns(block, tmp_dir / relative)
+        partitions.append({
+            'path': relative.as_posix(),
+            'year': year,
+            'month': month,
+            'rows': len(block),
+            **block_stats(block),
+        })
+
+    index = {
+        'version': INDEX_VERSION,
+        'source': dict(file_fingerprint(filepath), path=str(filepath.resolve())),
+        'rows': len(df),
+        'columns': columns or [],
+        'dtypes': {column: str(dtype) for column, dtype in df.dtypes.items()},
+        'partitions': partitions,
+        'date_reports': df.attrs.get('date_reports', []),
+    }
+    (tmp_dir / 'index.json').write_text(json.dumps(index, indent=2))
+
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    tmp_dir.rename(dataset_dir)
+    return index
+
+
+def partition_path(year, month):
+    """Relative directory of one partition."""
+    if year is None:
+        return Path(f"year={DEFAULT_PARTITION}") / f"month={DEFAULT_PARTITION}"
+    return Path(f"year={year}") / f"month={month:02d}"
+
+
+def read_index(dataset_dir):
+    """The partition index of a dataset, or None when it is missing or from an older layout."""
+    try:
+        index = json.loads((Path(dataset_dir) / 'index.json').read_text())
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION:
+        return None
+    return index
+
+
+def matching_partitions(index, filters=None):
+    """The index entries of the partitions that can hold rows matching ``filters``."""
+    return [
+        partition for partition in index['partitions']
+        if not filters or may_match(stats_from_json(partition), filters)
+    ]
+
+
+def load_dataset(dataset_dir, columns=None, filters=None):
+    """
+    Load the rows of a partitioned dataset that match ``filters``.
+
+    Partitions the index rules out are never opened; in the others only
+    ``columns`` (plus what the filters read) are mapped. The number of
+    partitions read is kept in ``df.attrs['partitions_read']``.
+    """
+    dataset_dir = Path(dataset_dir)
+    index = read_index(dataset_dir)
+    if index is None:
+        raise FileNotFoundError(f"No partition index in {dataset_dir}; run scripts/ingest_orders.py first")
+    projection = projected_columns(columns, filters)
+    selected = matching_partitions(index, filters)
+    frames = [read_columns(dataset_dir / partition['path'], index['columns'], projection) for partition in selected]
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+    else:
+        df = _empty_frame(index, projection)
+    df = apply_filters(df, filters, columns)
+    df.attrs['date_reports'] = index.get('date_reports', [])
+    df.attrs['partitions_read'] = len(selected)
+    df.attrs['partitions_total'] = len(index['partitions'])
+    return df
+
+
+def partition_summary(index):
+    """One row per partition: year, month, rows and the Order Date range."""
+    return pd.DataFrame([
+        {
+            'partition': partition['path'],
+            'rows': partition['rows'],
+            'first order': partition['min'].get('Order Date'),
+            'last order': partition['max'].get('Order Date'),
+        }
+        for partition in index['partitions']
+    ])
+
+
+def _empty_frame(index, projection):
+    names = [entry['name'] for entry in index['columns']]
+    if projection is not None:
+        names = [name for name in names if name in projection]
+    dtypes = index.get('dtypes', {})
+    return pd.DataFrame({
+        name: pd.Series(dtype=dtypes.get(name, SCHEMA.get(name, 'object'))) for name in names
+    })
@@ -0,0 +1,231 @@
+"""
+Run named stages as a small DAG and measure each one.
+
+A ``Stage`` is a function that takes the outputs of the stages it depends on
+and returns its own output. ``run_stages`` runs the stages in dependency
+order and records for every stage:
+
+- wall time and CPU time (this process plus any worker processes it waited for),
+- the peak resident memory reached while the stage ran,
+- rows in (the rows out of the stages it reads) and rows out.
+
+The records can be written as JSON or CSV with ``write_profile``. Any stage
+can also be run under ``cProfile`` (or ``pyinstrument`` when it is installed)
+to see where its time goes.
+
+Example::
+
+    stages = [
+        Stage('load', lambda: load_orders(path)),
+        Stage('kpis', compute_kpis, deps=['load']),
+    ]
+    outputs, profile = run_stages(stages, profile_stages=['kpis'], profile_dir='profiles')
+    write_profile(profile, 'profile.json')
+"""
+
+from collections import namedtuple
+from pathlib import Path
+import cProfile
+import csv
+import json
+import os
+import resource
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - psutil is optional
+    psutil = None
+
+Stage = namedtuple('Stage', ['name', 'func', 'deps', 'rows'], defaults=[(), None])
+Stage.__doc__ = """A pipeline step: ``func(*outputs of deps)``; ``rows(output)`` overrides the row count."""
+
+PROFILE_FIELDS = ['stage', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'rss_delta_mb', 'rows_in', 'rows_out']
+
+# How often the memory sampler looks at the resident set size
+RSS_SAMPLE_SECONDS = 0.01
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def run_stages(stages, only=None, profile_stages=(), profile_dir='.', profiler='cprofile'):
+    """
+    Run ``stages`` in dependency order.
+
+    ``only`` limits the run to those stages and whatever they depend on.
+    Stages named in ``profile_stages`` run under ``profiler`` and leave a
+    ``<stage>.prof`` (cProfile) or ``<stage>.html`` (pyinstrument) file in
+    ``profile_dir``. Returns ``(outputs, profile)``: the output of every
+    stage by name and one profile record per stage.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}; expected one of {PROFILERS}")
+    order = _topological_order(stages, only)
+    by_name = {stage.name: stage for stage in stages}
+    outputs = {}
+    rows_out = {}
+    profile = []
+    for name in order:
+        stage = by_name[name]
+        inputs = [outputs[dep] for dep in stage.deps]
+        profiled = name in profile_stages
+        with _Measurement() as measurement:
+            if profiled:
+                output = _run_profiled(stage, inputs, profiler, Path(profile_dir))
+            else:
+                output = stage.func(*inputs)
+        outputs[name] = output
+        rows_out[name] = stage.rows(output) if stage.rows else count_rows(output)
+        record = measurement.record(name)
+        record['rows_in'] = _sum_rows(rows_out[dep] for dep in stage.deps)
+        record['rows_out'] = rows_out[name]
+        profile.append(record)
+    return outputs, profile
+
+
+def count_rows(value):
+    """Rows in a stage output: len() of frames and arrays, summed over dicts; None otherwise."""
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    if isinstance(value, dict):
+        return _sum_rows(count_rows(item) for item in value.values())
+    return None
+
+
+def write_profile(profile, path):
+    """Write profile records as JSON or CSV, chosen by the file suffix."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == '.csv':
+        with open(path, 'w', newline='') as f:
+            # Callers may add their own fields (e.g. the benchmark's size and engine)
+            writer = csv.DictWriter(f, fieldnames=list(profile[0]) if profile else PROFILE_FIELDS)
+            writer.writeheader()
+            writer.writerows(profile)
+    else:
+        path.write_text(json.dumps(profile, indent=2))
+
+
+def format_profile(profile):
+    """Render profile records as an aligned text table."""
+    lines = [f"{'stage':<12} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} {'rows in':>10} {'rows out':>10}"]
+    for record in profile:
+        rows_in = '' if record['rows_in'] is None else record['rows_in']
+        rows_out = '' if record['rows_out'] is None else record['rows_out']
+        lines.append(
+            f"{record['stage']:<12} {record['wall_seconds']:>8.3f} {record['cpu_seconds']:>8.3f} "
+            f"{record['peak_rss_mb']:>8.1f} {rows_in:>10} {rows_out:>10}"
+        )
+    return '\n'.join(lines)
+
+
+def _sum_rows(counts):
+    counts = [count for count in counts if count is not None]
+    return sum(counts) if counts else None
+
+
+def _topological_order(stages, only):
+    by_name = {stage.name: stage for stage in stages}
+    wanted = set(by_name) if only is None else set()
+    stack = list(only or [])
+    while stack:
+        name = stack.pop()
+        if name not in by_name:
+            raise KeyError(f"Unknown stage {name!r}")
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(by_name[name].deps)
+
+    order = []
+    visiting = set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"Stage {name!r} is part of a dependency cycle")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    # Keep the declared order wherever the dependencies allow it
+    for stage in stages:
+        if stage.name in wanted:
+            visit(stage.name)
+    return order
+
+
+def _run_profiled(stage, inputs, profiler, profile_dir):
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        with Profiler() as session:
+            output = stage.func(*inputs)
+        (profile_dir / f"{stage.name}.html").write_text(session.output_html())
+        return output
+
+    session = cProfile.Profile()
+    output = session.runcall(stage.func, *inputs)
+    session.dump_stats(profile_dir / f"{stage.name}.prof")
+    return output
+
+
+class _Measurement:
+    # Wall and CPU time around a block, plus the peak RSS seen by a sampling
+    # thread. ru_maxrss only ever reports the peak of the whole process, so
+    # it is used only when psutil is not installed.
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._process = psutil.Process(os.getpid()) if psutil else None
+        self.start_rss = self._rss()
+        self.peak_rss = self.start_rss
+        if self._process is not None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = _cpu_seconds()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.start_wall
+        self.cpu = _cpu_seconds() - self.start_cpu
+        self._stop.set()
+        if self._process is not None:
+            self._sampler.join()
+        self.end_rss = self._rss()
+        self.peak_rss = max(self.peak_rss, self.end_rss)
+        return False
+
+    def record(self, name):
+        return {
+            'stage': name,
+            'wall_seconds': round(self.wall, 4),
+            'cpu_seconds': round(self.cpu, 4),
+            'peak_rss_mb': round(self.peak_rss / 2 ** 20, 1),
+            'rss_delta_mb': round((self.end_rss - self.start_rss) / 2 ** 20, 1),
+        }
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak_rss = max(self.peak_rss, self._rss())
+
+    def _rss(self):
+        if self._process is not None:
+            return self._process.memory_info().rss
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _cpu_seconds():
+    # Worker processes count once they have been waited for
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
@@ -0,0 +1,113 @@
+"""
+Charts drawn from compact summaries instead of raw rows.
+
+Handing millions of points to ``sns.scatterplot`` or ``sns.boxplot`` makes
+rendering time grow with the data, and the result is an overplotted blob.
+The helpers here take small pre-aggregated inputs instead:
+
+- ``density_scatter`` bins (x, y) pairs into a 2-D histogram and draws the
+  bin counts as a heat map, optionally with a log-scaled y axis.
+- ``binned_histogram`` draws counts that were already binned.
+- ``box_stats_from_kpis`` turns a quartile table (as returned by
+  ``superstore.shipping.delay_kpis``) into the input of ``Axes.bxp``, so box
+  plots need only per-group quartiles, minimum and maximum.
+
+``use_headless`` switches matplotlib to the Agg backend, which writes PNGs
+without a display or GUI toolkit. matplotlib itself is only imported when a
+chart is drawn, so importing this module stays cheap for text-only runs.
+"""
+
+import numpy as np
+
+DEFAULT_GRID = (60, 60)
+
+# Whiskers reach at most this many IQRs beyond the box, like matplotlib's
+# and seaborn's default box plots
+WHISKER_IQR = 1.5
+
+
+def use_headless():
+    """Render with the non-interactive Agg backend (call before drawing)."""
+    import matplotlib
+
+    matplotlib.use('Agg', force=True)
+
+
+def density_scatter(ax, x, y, bins=DEFAULT_GRID, log_y=False, cmap='viridis'):
+    """
+    Draw the density of (x, y) points as a 2-D histogram.
+
+    Missing pairs (and non-positive y when ``log_y``) are dropped. Only the
+    bin counts reach matplotlib, so drawing time does not depend on the
+    number of points. Returns the mesh so callers can add a colour bar.
+    """
+    from matplotlib.colors import LogNorm
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    if log_y:
+        keep &= y > 0
+    x, y = x[keep], y[keep]
+    if len(x) == 0:
+        return None
+
+    x_edges = _edges(x, bins[0])
+    if log_y:
+        y_edges = np.logspace(np.log10(y.min()), np.log10(y.max()), bins[1] + 1)
+    else:
+        y_edges = _edges(y, bins[1])
+    counts, _, _ = np.histogram2d(x, y, bins=[x_edges, y_edges])
+
+    # Empty bins stay transparent; a log colour scale keeps sparse tails visible
+    counts = np.ma.masked_equal(counts.T, 0)
+    mesh = ax.pcolormesh(x_edges, y_edges, counts, cmap=cmap, norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)))
+    if log_y:
+        ax.set_yscale('log')
+    return mesh
+
+
+def binned_histogram(ax, edges, counts, **kwargs):
+    """Draw a histogram from ``len(edges) - 1`` precomputed bin counts."""
+    return ax.stairs(counts, edges, fill=True, **kwargs)
+
+
+def box_stats_from_kpis(table, order=None, integer=False):
+    """
+    Build ``Axes.bxp`` input from a table with q1/median/q3/min/max columns.
+
+    Whiskers end at the data minimum and maximum, clipped to 1.5 IQR beyond
+    the box. Without the raw rows the exact furthest point inside the fences
+    is unknown; with ``integer=True`` (e.g. whole-day delays) the fences are
+    at least rounded inward to values the data can take. Outliers are not
+    drawn individually.
+    """
+    labels = list(table.index) if order is None else list(order)
+    stats = []
+    for label in labels:
+        row = table.loc[label]
+        iqr = row['q3'] - row['q1']
+        low_fence = row['q1'] - WHISKER_IQR * iqr
+        high_fence = row['q3'] + WHISKER_IQR * iqr
+        if integer:
+            low_fence, high_fence = np.ceil(low_fence), np.floor(high_fence)
+        stats.append({
+            'label': str(label),
+            'q1': row['q1'],
+            'med': row['median'],
+            'q3': row['q3'],
+            'whislo': max(row['min'], min(low_fence, row['q1'])),
+            'whishi': min(row['max'], max(high_fence, row['q3'])),
+            'fliers': [],
+        })
+    return stats
+
+
+def _edges(values, n_bins):
+    low, high = values.min(), values.max()
+    if np.array_equal(values, np.round(values)) and high - low + 1 <= n_bins:
+        # Whole numbers (e.g. delay days) get one bin per value
+        return np.arange(low - 0.5, high + 1.5)
+    if low == high:
+        return np.array([low - 0.5, high + 0.5])
+    return np.linspace(low, high, n_bins + 1)
@@ -0,0 +1,345 @@
+"""
+A long-running query service over a warm, in-memory order table.
+
+Every report script is a cold process: it imports pandas and the plotting
+stack and reloads the extract before computing anything. ``QueryService``
+loads the table once and answers named queries against it; ``serve`` puts it
+behind a small asyncio HTTP server on a TCP port or a Unix socket::
+
+    GET  /health                        rows, data version, cache counters
+    GET  /queries                       the query names
+    GET  /<query>?years=2017&region=West
+    POST /reload                        reload the table now
+
+A query is a function ``query(df, **options)`` returning a DataFrame, a
+Series, a dict of those or plain values. The filter parameters of the report
+scripts (``years``, ``months``, ``region``, ``segment``, ``category``; repeated
+or comma-separated) are applied before the query runs; every other query
+parameter is passed on as a string keyword argument.
+
+Results are kept as encoded JSON in an LRU cache keyed on the query, its
+parameters and the data version, so a repeated request is a dictionary
+lookup. Identical requests that arrive while the first is still computing
+wait for that computation instead of starting their own. The ``X-Cache``
+header says which of the three a request was (``hit``, ``joined`` or
+``miss``), and ``/health`` counts them the same way; joined requests are
+among the cache misses.
+
+The source file is checked for changes at most every ``check_interval``
+seconds; a new version reloads the table and retires the cached results of
+the old one.
+
+Example::
+
+    service = QueryService(lambda: load_orders(path), {'report': report}, source=path)
+    asyncio.run(serve(service, port=8765))
+
+    # from a notebook
+    fetch('report', years=[2016, 2017], region='West')
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import urlopen
+import asyncio
+import inspect
+import json
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from superstore.filters import apply_filters, filters_from_args
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 256
+
+# Seconds between checks of the source file for a new version
+DEFAULT_CHECK_INTERVAL = 1.0
+
+FILTER_PARAMETERS = ('years', 'months', 'region', 'segment', 'category')
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+
+class QueryError(Exception):
+    """A request the service cannot answer; carries the HTTP status to reply with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ResultCache:
+    """A least-recently-used map from request keys to encoded results."""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class QueryService:
+    """Named queries over a table that is loaded once and reloaded when its source changes."""
+
+    def __init__(self, load, queries, source=None, cache_size=DEFAULT_CACHE_SIZE,
+                 workers=4, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.load = load
+        self.queries = dict(queries)
+        self.source = Path(source) if source is not None else None
+        self.cache = ResultCache(cache_size)
+        self.check_interval = check_interval
+        self.df = None
+        self.version = 0
+        self.loaded_at = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._pending = {}
+        self.joined = 0
+        self._reload_lock = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+
+    async def start(self):
+        """Load the table before the first request arrives."""
+        self._reload_lock = asyncio.Lock()
+        await self.reload()
+
+    async def reload(self):
+        """Load the table again and start a new data version."""
+        async with self._reload_lock:
+            stamp = self._source_stamp()
+            started = time.perf_counter()
+            df = await asyncio.get_running_loop().run_in_executor(self._executor, self.load)
+            self.df, self._stamp = df, stamp
+            self.version += 1
+            self.loaded_at = time.time()
+            self._checked_at = time.monotonic()
+            # Results of the previous version can never be asked for again
+            self.cache.clear()
+            return {'version': self.version, 'rows': len(df),
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+    async def refresh_if_changed(self):
+        """Reload when the source file changed since it was loaded (checked every ``check_interval`` s)."""
+        if self.source is None or time.monotonic() - self._checked_at < self.check_interval:
+            return
+        self._checked_at = time.monotonic()
+        if self._source_stamp() != self._stamp:
+            await self.reload()
+
+    async def query(self, name, params):
+        """The encoded JSON result of query ``name`` and where it came from: ``'hit'``, ``'joined'`` or ``'miss'``."""
+        if name not in self.queries:
+            raise QueryError(404, f"Unknown query {name!r}; see /queries")
+        await self.refresh_if_changed()
+        key = (name, _canonical(params), self.version)
+        body = self.cache.get(key)
+        if body is not None:
+            return body, 'hit'
+        if key in self._pending:
+            # Not in the cache yet, but computed by a request already running
+            self.joined += 1
+            return await asyncio.shield(self._pending[key]), 'joined'
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._compute, self.queries[name], self.df, params,
+        )
+        self._pending[key] = future
+        try:
+            body = await future
+        finally:
+            del self._pending[key]
+        self.cache.put(key, body)
+        return body, 'miss'
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'rows': None if self.df is None else len(self.df),
+            'data_version': self.version,
+            'loaded_at': self.loaded_at,
+            'source': None if self.source is None else str(self.source),
+            'cache': dict(self.cache.stats(), joined=self.joined),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _compute(self, query, df, params):
+        options = {name: values[-1] for name, values in params.items() if name not in FILTER_PARAMETERS}
+        try:
+            filters = filters_from_params(params)
+            inspect.signature(query).bind(df, **options)
+        except (TypeError, ValueError) as error:
+            raise QueryError(400, str(error)) from None
+        result = query(apply_filters(df, filters), **options)
+        return json.dumps(to_jsonable(result), allow_nan=False).encode()
+
+    def _source_stamp(self):
+        if self.source is None:
+            return None
+        stat = self.source.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+
+def filters_from_params(params):
+    """The filter list for the filter parameters of a request (see ``add_filter_arguments``)."""
+    def values(name):
+        items = [item for value in params.get(name, []) for item in value.split(',') if item]
+        return items or None
+
+    years = values('years')
+    args = SimpleNamespace(
+        years=[int(year) for year in years] if years else None,
+        months=values('months'),
+        region=values('region'),
+        segment=values('segment'),
+        category=values('category'),
+    )
+    return filters_from_args(args)
+
+
+def to_jsonable(value):
+    """``value`` with DataFrames, Series, NumPy and pandas scalars turned into JSON types."""
+    if isinstance(value, pd.DataFrame):
+        return {'columns': [str(column) for column in value.columns],
+                'index': [to_jsonable(label) for label in value.index],
+                'data': [[to_jsonable(item) for item in row] for row in value.itertuples(index=False)]}
+    if isinstance(value, pd.Series):
+        return {'index': [to_jsonable(label) for label in value.index],
+                'data': [to_jsonable(item) for item in value.tolist()]}
+    if isinstance(value, dict):
+        return {str(to_jsonable(key)): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+    """Load the table and answer HTTP requests until cancelled."""
+    await service.start()
+
+    async def handle(reader, writer):
+        try:
+            await _handle_connection(service, reader, writer)
+        finally:
+            writer.close()
+
+    if unix_socket:
+        server = await asyncio.start_unix_server(handle, path=unix_socket)
+    else:
+        server = await asyncio.start_server(handle, host=host, port=port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+async def _handle_connection(service, reader, writer):
+    # HTTP/1.1 with keep-alive, so a notebook session reuses one connection
+    while True:
+        try:
+            request_line = await reader.readline()
+        except ConnectionError:
+            return
+        if not request_line.strip():
+            return
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if int(headers.get('content-length') or 0):
+            await reader.readexactly(int(headers['content-length']))
+
+        method, target, version = (request_line.decode('latin-1').split() + ['', '', ''])[:3]
+        started = time.perf_counter()
+        status, body, source = await _route(service, method, target)
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"X-Cache: {source}\r\n"
+            f"X-Elapsed-Ms: {(time.perf_counter() - started) * 1000:.2f}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+        if not keep_alive:
+            return
+
+
+async def _route(service, method, target):
+    url = urlsplit(target)
+    path = url.path.rstrip('/') or '/'
+    try:
+        if path == '/health':
+            return 200, json.dumps(service.health()).encode(), 'miss'
+        if path == '/queries':
+            return 200, json.dumps(sorted(service.queries)).encode(), 'miss'
+        if path == '/reload':
+            if method != 'POST':
+                raise QueryError(405, 'Use POST to reload')
+            return 200, json.dumps(await service.reload()).encode(), 'miss'
+        if method != 'GET':
+            raise QueryError(405, f"Use GET for {path}")
+        return (200,) + await service.query(path.lstrip('/'), parse_qs(url.query))
+    except QueryError as error:
+        return error.status, json.dumps({'error': str(error)}).encode(), 'miss'
+    except Exception as error:  # the connection stays usable after a failing query
+        return 500, json.dumps({'error': f"{type(error).__name__}: {error}"}).encode(), 'miss'
+
+
+def fetch(query, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60, **params):
+    """Ask a running service for ``query`` and return the decoded JSON (for notebooks and dashboards)."""
+    params = {name: ','.join(map(str, value)) if isinstance(value, (list, tuple)) else value
+              for name, value in params.items() if value is not None}
+    url = f"http://{host}:{port}/{query}" + (f"?{urlencode(params)}" if params else '')
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _canonical(params):
+    return tuple(sorted((name, tuple(values)) for name, values in params.items()))
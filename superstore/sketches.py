@@ -0,0 +1,239 @@
+"""
+Mergeable sketches for summaries that cannot simply be added together.
+
+Sums and counts roll up by addition, but distinct counts do not: the orders
+in January and the orders in February may overlap. A HyperLogLog sketch keeps
+a small array of registers per group instead of the full set of IDs. Two
+sketches merge with an element-wise maximum, and the number of distinct
+values can be estimated from the registers with a relative error of about
+``1.04 / sqrt(2 ** precision)``.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PRECISION = 12
+
+
+def hash_values(values):
+    """Return a 64-bit hash for every value (strings, numbers, categoricals)."""
+    # Hash each distinct value once and map the hashes back to the rows
+    codes, uniques = pd.factorize(pd.Series(values))
+    unique_hashes = pd.util.hash_array(np.asarray(uniques, dtype=object))
+    present = codes >= 0
+    hashes = np.zeros(len(codes), dtype=np.uint64)
+    hashes[present] = unique_hashes[codes[present]]
+    return hashes, present
+
+
+def _bit_length(values):
+    # Exact bit length of unsigned 64-bit integers using a binary search over
+    # shifts (a float log2 would round large values up)
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    lengths += (values > 0).astype(np.uint8)
+    return lengths
+
+
+def register_updates(hashes, precision):
+    """Split hashes into (register index, rank) pairs for a HyperLogLog."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    remainder = hashes & np.uint64((1 << (64 - precision)) - 1)
+    # rank = position of the first set bit in the remaining 64 - p bits
+    rank = (64 - precision) - _bit_length(remainder).astype(np.int64) + 1
+    return index, rank.astype(np.uint8)
+
+
+def group_registers(hashes, group_ids, n_groups, precision=DEFAULT_PRECISION):
+    """Build one HyperLogLog register array per group in a single pass."""
+    index, rank = register_updates(hashes, precision)
+    n_registers = 1 << precision
+    registers = np.zeros(n_groups * n_registers, dtype=np.uint8)
+    np.maximum.at(registers, np.asarray(group_ids, dtype=np.int64) * n_registers + index, rank)
+    return registers.reshape(n_groups, n_registers)
+
+
+def estimate_distinct(registers):
+    """Estimate distinct counts from HyperLogLog registers (1-D or one row per group)."""
+    registers = np.atleast_2d(registers)
+    n_registers = registers.shape[1]
+    if n_registers == 16:
+        alpha = 0.673
+    elif n_registers == 32:
+        alpha = 0.697
+    elif n_registers == 64:
+        alpha = 0.709
+    else:
+        alpha = 0.7213 / (1 + 1.079 / n_registers)
+
+    harmonic = np.power(2.0, -registers.astype(np.float64)).sum(axis=1)
+    estimate = alpha * n_registers * n_registers / harmonic
+
+    # Small-range correction: with empty registers left, linear counting is
+    # far more accurate than the raw HyperLogLog estimate
+    empty = (registers == 0).sum(axis=1)
+    small = (estimate <= 2.5 * n_registers) & (empty > 0)
+    with np.errstate(divide='ignore'):
+        linear = n_registers * np.log(n_registers / np.maximum(empty, 1))
+    estimate = np.where(small, linear, estimate)
+    return estimate
+
+
+class HyperLogLog:
+    """Approximate distinct counter that can be merged with others."""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        if registers is None:
+            registers = np.zeros(1 << precision, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, values):
+        """Add a batch of values (missing values are ignored)."""
+        hashes, present = hash_values(values)
+        index, rank = register_updates(hashes[present], self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        """Fold another sketch with the same precision into this one."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Return the estimated number of distinct values added so far."""
+        return float(estimate_distinct(self.registers)[0])
+
+
+DEFAULT_K = 200
+
+# Normalised rank error of a KLL sketch is roughly this constant over k
+# (about 0.85% at k=200), following the published KLL error tables
+KLL_ERROR_CONSTANT = 1.7
+
+
+def k_for_rank_error(rank_error):
+    """Smallest KLL ``k`` whose expected rank error is at most ``rank_error``."""
+    if not 0 < rank_error < 1:
+        raise ValueError("rank_error must be between 0 and 1")
+    return max(int(np.ceil(KLL_ERROR_CONSTANT / rank_error)), 8)
+
+
+def weighted_quantile(values, weights, q):
+    """
+    Quantile ``q`` of sorted ``values`` where each value stands for ``weights`` observations.
+
+    Interpolates linearly between neighbouring observations like pandas does,
+    so with all weights equal to 1 this is exactly ``Series.quantile(q)``.
+    """
+    total = int(weights.sum())
+    if total == 0:
+        return np.nan
+    cumulative = np.cumsum(weights)
+    position = (total - 1) * q
+    lower = int(np.floor(position))
+    upper = int(np.ceil(position))
+    # searchsorted finds the value that holds the k-th sorted observation
+    lower_value = values[np.searchsorted(cumulative, lower, side='right')]
+    upper_value = values[np.searchsorted(cumulative, upper, side='right')]
+    return lower_value + (position - lower) * (upper_value - lower_value)
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (Karnin, Lang and Liberty's KLL).
+
+    Values are kept in a stack of compactors; an item on level ``h`` stands
+    for ``2 ** h`` observations. When a level outgrows its capacity it is
+    sorted and every other item (from a random offset) moves up a level, so
+    memory stays around ``3 * k`` items however many values are added. While
+    nothing has been compacted the quantiles are exact.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=0):
+        if k < 8:
+            raise ValueError("k must be at least 8")
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        # A seeded generator keeps results reproducible for the same input
+        # and merge order
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self):
+        """Expected normalised rank error of quantile estimates."""
+        return KLL_ERROR_CONSTANT / self.k
+
+    def add(self, values):
+        """Add a batch of values (missing values are ignored)."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self.count += len(values)
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Estimated quantile ``q`` (a float, or a list of floats)."""
+        values, weights = self._weighted_items()
+        if np.ndim(q) == 0:
+            return weighted_quantile(values, weights, q)
+        return [weighted_quantile(values, weights, one_q) for one_q in q]
+
+    def rank(self, value):
+        """Estimated fraction of the added values that are <= ``value``."""
+        values, weights = self._weighted_items()
+        if weights.sum() == 0:
+            return np.nan
+        return weights[values <= value].sum() / weights.sum()
+
+    def _weighted_items(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(items), 1 << level, dtype=np.int64) for level, items in enumerate(self.levels)
+        ])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def _capacity(self, level):
+        # Lower levels get geometrically smaller capacities (factor 2/3)
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so that the total weight is kept
+                keep = items[:0]
+                if len(items) % 2:
+                    keep, items = items[-1:], items[:-1]
+                offset = int(self._rng.integers(2))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[offset::2]])
+                self.levels[level] = keep
+            level += 1
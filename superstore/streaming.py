@@ -0,0 +1,368 @@
+"""
+Bounded-memory, chunked processing of the order extracts.
+
+``iter_order_chunks`` reads an extract in large chunks with the shared schema,
+so no script has to hold a whole year of orders in memory. The aggregators
+below keep only small per-group state. Each chunk updates that state, and
+two aggregators of the same kind can be merged, so a result is the same
+whether it was built from one chunk, many chunks or several processes.
+
+- ``GroupedStats`` keeps count, sum, min, max and a Welford/Chan running mean
+  and variance per group.
+- ``ValueCounts`` keeps exact counts of a discrete measure (such as whole-day
+  shipping delays) per group, from which exact quantiles can be read.
+- ``QuantileSketches`` and ``DistinctCounts`` trade exactness for bounded
+  memory with KLL and HyperLogLog sketches (``superstore.sketches``).
+"""
+
+import numpy as np
+import pandas as pd
+
+from superstore import sketches
+from superstore.aggregate import AggregationPlan
+from superstore.dates import DATE_FORMATS, DAY_FIRST_FORMATS, parse_date_column
+from superstore.filters import apply_filters, projected_columns
+from superstore.loader import DATE_COLUMNS, csv_dtypes, read_header
+
+DEFAULT_MEMORY_MB = 256
+
+# A typed chunk in pandas takes several times its size on disk (string
+# columns are Python objects); this factor keeps chunk sizing on the safe side.
+MEMORY_PER_CSV_BYTE = 6
+
+MIN_CHUNK_ROWS = 1000
+
+
+def chunk_rows_for_budget(filepath, max_memory_mb=DEFAULT_MEMORY_MB, sample_lines=1000):
+    """Estimate how many rows fit in ``max_memory_mb`` once parsed."""
+    with open(filepath, 'rb') as f:
+        f.readline()  # header
+        sample = [f.readline() for _ in range(sample_lines)]
+    sample = [line for line in sample if line]
+    if not sample:
+        return MIN_CHUNK_ROWS
+    bytes_per_row = sum(len(line) for line in sample) / len(sample)
+    rows = int(max_memory_mb * 1024 * 1024 / (bytes_per_row * MEMORY_PER_CSV_BYTE))
+    return max(rows, MIN_CHUNK_ROWS)
+
+
+def iter_order_chunks(filepath, chunksize=None, max_memory_mb=DEFAULT_MEMORY_MB, columns=None, filters=None):
+    """
+    Yield an extract as typed DataFrame chunks.
+
+    ``chunksize`` defaults to the number of rows that fit in
+    ``max_memory_mb``. ``columns`` limits parsing to the columns a caller
+    actually uses and ``filters`` (see ``superstore.filters``) drops the
+    rows that do not match from every chunk. Date formats are locked after
+    the first chunk (see ``parse_chunk_dates``).
+    """
+    if chunksize is None:
+        chunksize = chunk_rows_for_budget(filepath, max_memory_mb)
+    header = read_header(filepath)
+    read_columns = projected_columns(columns, filters)
+    usecols = header if read_columns is None else [column for column in header if column in read_columns]
+
+    reader = pd.read_csv(
+        filepath, dtype=csv_dtypes(usecols), usecols=usecols, chunksize=chunksize, low_memory=False
+    )
+    locked_formats = {}
+    for chunk in reader:
+        parse_chunk_dates(chunk, locked_formats)
+        yield apply_filters(chunk, filters, columns)
+
+
+def parse_chunk_dates(chunk, locked_formats):
+    """
+    Parse the date columns of one chunk in place, keeping formats consistent.
+
+    ``locked_formats`` maps a column to the format detected for it so far and
+    is filled in from the first chunk that has one. Later chunks try that
+    format first, so a chunk whose days happen to be all <= 12 cannot flip to
+    month-first. Returns the parse reports.
+    """
+    reports = []
+    for column in DATE_COLUMNS:
+        if column not in chunk.columns:
+            continue
+        if column in locked_formats:
+            fmt = locked_formats[column]
+            formats = [fmt] + [other for other in DATE_FORMATS if other != fmt]
+            dayfirst = fmt in DAY_FIRST_FORMATS
+        else:
+            formats, dayfirst = DATE_FORMATS, True
+        chunk[column], report = parse_date_column(chunk[column], formats=formats, dayfirst=dayfirst)
+        if column not in locked_formats and report['format'] is not None:
+            locked_formats[column] = report['format']
+        reports.append(report)
+    return reports
+
+
+def _group_positions(chunk, keys):
+    # Group position of every row plus the group labels; a grand total is
+    # treated as a single group labelled 'All'
+    if not keys:
+        return np.zeros(len(chunk), dtype=np.int64), pd.Index(['All'])
+    return AggregationPlan(chunk).row_groups(keys)
+
+
+class GroupedStats:
+    """Mergeable count / sum / mean / variance / min / max of a measure per group."""
+
+    def __init__(self, keys, measure):
+        self.keys = [keys] if isinstance(keys, str) else list(keys)
+        self.measure = measure
+        self.state = None
+
+    def update(self, chunk):
+        """Fold one chunk of rows into the running state."""
+        self._merge_state(self._chunk_state(chunk))
+        return self
+
+    def merge(self, other):
+        """Fold another aggregator's state (e.g. from another process) into this one."""
+        if other.state is not None:
+            self._merge_state(other.state)
+        return self
+
+    def result(self):
+        """Return count, sum, mean, std (ddof=1, like pandas), min and max per group."""
+        if self.state is None:
+            return pd.DataFrame(columns=['count', 'sum', 'mean', 'std', 'min', 'max'])
+        state = self.state
+        counts = state['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(state['m2'] / (counts - 1))
+        result = pd.DataFrame({
+            'count': counts.astype(np.int64),
+            'sum': state['sum'],
+            'mean': state['mean'].where(counts > 0),
+            'std': std.where(counts > 1),
+            'min': state['min'].where(counts > 0),
+            'max': state['max'].where(counts > 0),
+        })
+        return result.sort_index()
+
+    def _chunk_state(self, chunk):
+        positions, index = _group_positions(chunk, self.keys)
+        values = chunk[self.measure].to_numpy(dtype=np.float64, na_value=np.nan)
+        usable = (positions >= 0) & ~np.isnan(values)
+        positions = positions[usable]
+        values = values[usable]
+        n_groups = len(index)
+
+        counts = np.bincount(positions, minlength=n_groups).astype(np.float64)
+        totals = np.bincount(positions, weights=values, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, totals / counts, 0.0)
+        # Squared deviations from the chunk's own group means (Welford-style)
+        # are numerically stable, unlike the sum-of-squares shortcut
+        deviations = values - means[positions]
+        m2 = np.bincount(positions, weights=deviations * deviations, minlength=n_groups)
+        minimums = np.full(n_groups, np.inf)
+        maximums = np.full(n_groups, -np.inf)
+        np.minimum.at(minimums, positions, values)
+        np.maximum.at(maximums, positions, values)
+
+        return pd.DataFrame(
+            {'count': counts, 'sum': totals, 'mean': means, 'm2': m2, 'min': minimums, 'max': maximums},
+            index=index,
+        )
+
+    def _merge_state(self, other):
+        if self.state is None:
+            self.state = other.copy()
+            return
+        index = self.state.index.union(other.index)
+        fill = {'count': 0.0, 'sum': 0.0, 'mean': 0.0, 'm2': 0.0, 'min': np.inf, 'max': -np.inf}
+        a = self.state.reindex(index).fillna(fill)
+        b = other.reindex(index).fillna(fill)
+
+        # Chan et al.'s pairwise update combines two (count, mean, M2) triples
+        counts = a['count'] + b['count']
+        delta = b['mean'] - a['mean']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(counts > 0, b['count'] / counts, 0.0)
+        self.state = pd.DataFrame({
+            'count': counts,
+            'sum': a['sum'] + b['sum'],
+            'mean': a['mean'] + delta * weight,
+            'm2': a['m2'] + b['m2'] + delta * delta * a['count'] * weight,
+            'min': np.minimum(a['min'], b['min']),
+            'max': np.maximum(a['max'], b['max']),
+        }, index=index)
+
+
+class ValueCounts:
+    """Mergeable exact counts of a discrete measure per group."""
+
+    def __init__(self, keys, measure):
+        self.keys = [keys] if isinstance(keys, str) else list(keys)
+        self.measure = measure
+        self.counts = None
+
+    def update(self, chunk):
+        """Count the measure's values in one chunk of rows."""
+        if self.keys:
+            plan = AggregationPlan(chunk)
+            plan.add('n', self.keys + [self.measure], None, 'count')
+            counts = plan.run()['n']
+        else:
+            counts = chunk[self.measure].dropna().value_counts()
+            counts.index.name = self.measure
+        return self._add(counts)
+
+    def merge(self, other):
+        """Fold another ValueCounts (same keys and measure) into this one."""
+        if other.counts is not None:
+            self._add(other.counts)
+        return self
+
+    def _add(self, counts):
+        counts = counts.astype(np.int64)
+        if self.counts is None:
+            self.counts = counts
+        else:
+            self.counts = self.counts.add(counts, fill_value=0).astype(np.int64)
+        return self
+
+    def groups(self):
+        """Yield ``(group label, Series of counts indexed by sorted value)``."""
+        if self.counts is None:
+            return
+        if not self.keys:
+            yield 'All', self.counts.sort_index()
+            return
+        group_levels = list(range(len(self.keys)))
+        level = group_levels[0] if len(group_levels) == 1 else group_levels
+        for label, group in self.counts.groupby(level=level, sort=True):
+            yield label, group.droplevel(group_levels).sort_index()
+
+    def quantiles(self, qs):
+        """
+        Exact quantiles per group, with pandas' default linear interpolation.
+
+        Returns a DataFrame with one row per group and one column per
+        requested quantile.
+        """
+        rows = {}
+        for label, counts in self.groups():
+            rows[label] = [quantile_from_counts(counts, q) for q in qs]
+        result = pd.DataFrame.from_dict(rows, orient='index', columns=list(qs))
+        if len(self.keys) == 1:
+            result.index.name = self.keys[0]
+        return result
+
+
+def quantile_from_counts(counts, q):
+    """Quantile ``q`` of the values described by ``counts`` (value -> count)."""
+    counts = counts[counts > 0]
+    return sketches.weighted_quantile(counts.index.to_numpy(dtype=np.float64), counts.to_numpy(), q)
+
+
+class QuantileSketches:
+    """
+    Approximate per-group quantiles of a measure from mergeable KLL sketches.
+
+    A drop-in for ``ValueCounts`` when the measure has too many distinct
+    values to count exactly: memory per group is bounded by ``k`` and the
+    rank error is about ``1.7 / k``.
+    """
+
+    def __init__(self, keys, measure, k=sketches.DEFAULT_K):
+        self.keys = [keys] if isinstance(keys, str) else list(keys)
+        self.measure = measure
+        self.k = k
+        self.sketches = {}
+
+    def update(self, chunk):
+        """Add one chunk of rows to the sketch of each group."""
+        positions, index = _group_positions(chunk, self.keys)
+        values = chunk[self.measure].to_numpy(dtype=np.float64, na_value=np.nan)
+        order = np.argsort(positions, kind='stable')
+        bounds = np.searchsorted(positions[order], np.arange(len(index) + 1))
+        for group, label in enumerate(index):
+            rows = order[bounds[group]:bounds[group + 1]]
+            if len(rows):
+                self._sketch(label).add(values[rows])
+        return self
+
+    def merge(self, other):
+        """Fold another QuantileSketches (same keys, measure and k) into this one."""
+        for label, sketch in other.sketches.items():
+            self._sketch(label).merge(sketch)
+        return self
+
+    def quantiles(self, qs):
+        """Estimated quantiles per group, laid out like ``ValueCounts.quantiles``."""
+        rows = {label: self.sketches[label].quantile(list(qs)) for label in sorted(self.sketches)}
+        result = pd.DataFrame.from_dict(rows, orient='index', columns=list(qs))
+        if len(self.keys) == 1:
+            result.index.name = self.keys[0]
+        return result
+
+    def ranks(self, value):
+        """Estimated fraction of each group's values that are <= ``value``."""
+        return pd.Series({label: self.sketches[label].rank(value) for label in sorted(self.sketches)})
+
+    def _sketch(self, label):
+        if label not in self.sketches:
+            self.sketches[label] = sketches.KLLSketch(self.k)
+        return self.sketches[label]
+
+
+class DistinctCounts:
+    """
+    Mergeable per-group distinct counts of a column.
+
+    With ``precision=None`` the distinct values themselves are kept and the
+    counts are exact; otherwise each group keeps a HyperLogLog sketch of
+    ``2 ** precision`` registers (relative error ``1.04 / sqrt(2 ** precision)``).
+    """
+
+    def __init__(self, keys, column, precision=None):
+        self.keys = [keys] if isinstance(keys, str) else list(keys)
+        self.column = column
+        self.precision = precision
+        self.state = {}
+
+    def update(self, chunk):
+        """Add the values of one chunk of rows."""
+        positions, index = _group_positions(chunk, self.keys)
+        values = chunk[self.column]
+        present = (positions >= 0) & values.notna().to_numpy()
+        positions = positions[present]
+        values = values[present]
+        if self.precision is None:
+            for group, label in enumerate(index):
+                self._add_state(label, np.unique(values[positions == group].astype(str)))
+        else:
+            hashes, _ = sketches.hash_values(values)
+            registers = sketches.group_registers(hashes, positions, len(index), self.precision)
+            for group, label in enumerate(index):
+                self._add_state(label, registers[group])
+        return self
+
+    def merge(self, other):
+        """Fold another DistinctCounts (same keys, column and precision) into this one."""
+        for label, state in other.state.items():
+            self._add_state(label, state)
+        return self
+
+    def result(self):
+        """Distinct count per group (rounded estimates when sketching)."""
+        counts = {}
+        for label in sorted(self.state):
+            state = self.state[label]
+            if self.precision is None:
+                counts[label] = len(state)
+            else:
+                counts[label] = int(round(sketches.estimate_distinct(state)[0]))
+        return pd.Series(counts, dtype=np.int64)
+
+    def _add_state(self, label, state):
+        if label not in self.state:
+            self.state[label] = state
+        elif self.precision is None:
+            self.state[label] = np.union1d(self.state[label], state)
+        else:
+            self.state[label] = np.maximum(self.state[label], state)
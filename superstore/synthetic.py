@@ -0,0 +1,323 @@
+"""
+Synthetic Superstore order extracts of any size.
+
+The real extract has under 10k rows, which says nothing about how the
+loaders and aggregations scale. ``generate_orders`` produces order tables
+with the same columns and formatting as the raw extract (or, with
+``layout='sales'``, the ``data/superstore_sales.csv`` layout with Quantity,
+Discount and Profit), drawing every distribution from a template table,
+by default the real extract:
+
+- basket sizes (rows per order), ship modes and the shipping delay of each
+  ship mode,
+- order dates: the template's orders per month, spread evenly over the days
+  of the month, so yearly growth and seasonality carry over,
+- locations (country/city/state/postal code/region), product hierarchy and
+  names, customer names and segments,
+- a log-normal Sales distribution per sub-category.
+
+Customer and product cardinalities are configurable; by default they grow
+with the row count at the template's rows-per-customer and rows-per-product
+ratios. ``dirty_rate`` injects the kinds of bad records the loaders have to
+cope with (see ``DIRTY_KINDS``).
+
+``write_orders`` generates the rows in chunks and appends them to a CSV, so
+files far larger than memory can be produced. Chunk ``i`` always comes from
+the same random stream, so a given seed and size gives the same file.
+
+Example::
+
+    df = generate_orders(100_000, seed=1, dirty_rate=0.01)
+    write_orders('data/cache/bench/orders_100M.csv', 100_000_000)
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from superstore.loader import RAW_DATA_PATH, load_orders
+
+RAW_COLUMNS = [
+    'Row ID', 'Order ID', 'Order Date', 'Ship Date', 'Ship Mode', 'Customer ID', 'Customer Name',
+    'Segment', 'Country', 'City', 'State', 'Postal Code', 'Region', 'Product ID', 'Category',
+    'Sub-Category', 'Product Name', 'Sales',
+]
+SALES_COLUMNS = RAW_COLUMNS[1:] + ['Quantity', 'Discount', 'Profit']
+LAYOUTS = {
+    # columns, date format
+    'raw': (RAW_COLUMNS, '%d/%m/%Y'),
+    'sales': (SALES_COLUMNS, '%Y-%m-%d'),
+}
+
+DEFAULT_CHUNK_ROWS = 1_000_000
+ROW_COUNT_SUFFIXES = {'k': 10 ** 3, 'm': 10 ** 6, 'b': 10 ** 9}
+
+# Bad records injected by ``dirty_rate``, in equal shares:
+#   bad_date        an Order or Ship Date that is blank, 'N/A' or not a real day
+#   negative_delay  shipped one to five days before it was ordered
+#   long_delay      shipped 30 to 90 days after it was ordered
+#   missing_sales   blank Sales
+#   missing_postal  blank Postal Code
+#   duplicate       an exact copy of the previous row (apart from Row ID)
+DIRTY_KINDS = ['bad_date', 'negative_delay', 'long_delay', 'missing_sales', 'missing_postal', 'duplicate']
+BAD_DATE_VALUES = ['', 'N/A', '31/02/2017']
+
+# Dates are drawn as day offsets into a table of pre-formatted strings that
+# extends past the order range, for early and late (including dirty) ship dates
+DATE_MARGIN_BEFORE = 10
+DATE_MARGIN_AFTER = 120
+
+DISCOUNTS = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.7, 0.8])
+DISCOUNT_WEIGHTS = np.array([0.48, 0.04, 0.37, 0.02, 0.02, 0.01, 0.04, 0.02])
+MAX_QUANTITY = 14
+
+
+class OrderTemplate:
+    """The distributions that synthetic orders are drawn from, taken from a real order table."""
+
+    def __init__(self, df):
+        df = df.dropna(subset=['Order Date', 'Ship Date', 'Sales'])
+        df = df[df['Sales'] > 0]
+        delay = (df['Ship Date'] - df['Order Date']).dt.days
+        df = df[delay >= 0]
+        delay = delay[delay >= 0]
+
+        self.basket_sizes = _frequencies(df.groupby('Order ID').size())
+        self.ship_modes = _frequencies(df['Ship Mode'].astype(str))
+        self.delays = {
+            mode: _frequencies(values)
+            for mode, values in delay.groupby(df['Ship Mode'].astype(str), observed=True)
+        }
+        self.order_prefixes = _frequencies(df['Order ID'].str[:2])
+
+        # Orders per calendar month, spread evenly over that month's days
+        first = df['Order Date'].min().to_period('Y').start_time
+        last = df['Order Date'].max().to_period('Y').end_time.normalize()
+        days = pd.date_range(first, last, freq='D')
+        per_month = df['Order Date'].dt.to_period('M').value_counts()
+        months = days.to_period('M')
+        weights = per_month.reindex(months).fillna(0).to_numpy() / days.days_in_month.to_numpy()
+        self.first_day = first
+        self.day_weights = weights / weights.sum()
+
+        locations = df[['Country', 'City', 'State', 'Postal Code', 'Region']].drop_duplicates()
+        self.locations = locations.astype({'State': str, 'Region': str}).reset_index(drop=True)
+        products = df[['Product ID', 'Category', 'Sub-Category', 'Product Name']].drop_duplicates('Product ID')
+        self.products = products.astype({'Category': str, 'Sub-Category': str}).reset_index(drop=True)
+        customers = df[['Customer ID', 'Customer Name', 'Segment']].drop_duplicates('Customer ID')
+        self.customers = customers.astype({'Segment': str}).reset_index(drop=True)
+
+        log_sales = np.log(df['Sales']).groupby(df['Sub-Category'].astype(str), observed=True)
+        self.sales_params = pd.DataFrame({'mu': log_sales.mean(), 'sigma': log_sales.std().fillna(0)})
+
+        self.rows_per_customer = len(df) / len(self.customers)
+        self.rows_per_product = len(df) / len(self.products)
+
+
+def default_template():
+    """The template drawn from the real raw extract."""
+    return OrderTemplate(load_orders(RAW_DATA_PATH))
+
+
+def generate_orders(n_rows, seed=0, n_customers=None, n_products=None, dirty_rate=0.0,
+                    layout='raw', template=None, chunk_index=0, first_row_id=1, first_order=0):
+    """
+    Generate ``n_rows`` synthetic order lines as a frame of CSV-ready values.
+
+    ``n_customers`` and ``n_products`` default to the template's rows per
+    customer and product scaled to ``n_rows``. ``chunk_index``,
+    ``first_row_id`` and ``first_order`` let ``write_orders`` continue one
+    dataset over several calls; customers and products depend only on
+    ``seed``, so they are the same entities in every chunk. The injected
+    dirty records are counted in ``df.attrs['dirty']``.
+    """
+    columns, date_format = LAYOUTS[layout]
+    template = template or default_template()
+    n_customers = n_customers or max(len(template.customers), round(n_rows / template.rows_per_customer))
+    n_products = n_products or max(len(template.products), round(n_rows / template.rows_per_product))
+    rng = np.random.default_rng([seed, 1, chunk_index])
+    entities = np.random.default_rng([seed, 0])
+
+    # Rows grouped into orders with the template's basket sizes
+    sizes = _draw(rng, template.basket_sizes, n_rows)
+    order_of_row = np.repeat(np.arange(n_rows), sizes)[:n_rows]
+    n_orders = order_of_row[-1] + 1 if n_rows else 0
+
+    # Order-level attributes
+    day = rng.choice(len(template.day_weights), size=n_orders, p=template.day_weights)
+    ship_mode = _draw(rng, template.ship_modes, n_orders)
+    delay = np.zeros(n_orders, dtype=np.int64)
+    for mode, frequencies in template.delays.items():
+        chosen = ship_mode == mode
+        delay[chosen] = _draw(rng, frequencies, int(chosen.sum()))
+    # A few customers place most orders, as in real order logs
+    customer = _skewed(rng, n_customers, n_orders)
+    prefix = _draw(rng, template.order_prefixes, n_orders)
+
+    # Customers: name, segment and home location depend only on the seed
+    customer_ids = np.unique(customer)
+    customer_template = entities.integers(len(template.customers), size=n_customers)[customer_ids]
+    customer_location = entities.integers(len(template.locations), size=n_customers)[customer_ids]
+    slot = np.searchsorted(customer_ids, customer)
+
+    # Line-level attributes
+    product = _skewed(rng, n_products, n_rows)
+    product_template = entities.integers(len(template.products), size=n_products)[product]
+
+    dates, date_years = _date_table(template.first_day, len(template.day_weights), date_format)
+    order_day = day[order_of_row] + DATE_MARGIN_BEFORE
+    ship_day = order_day + delay[order_of_row]
+
+    products = template.products.iloc[product_template].reset_index(drop=True)
+    customers = template.customers.iloc[customer_template[slot]].reset_index(drop=True)
+    locations = template.locations.iloc[customer_location[slot]].reset_index(drop=True)
+    customers = customers.iloc[order_of_row].reset_index(drop=True)
+    locations = locations.iloc[order_of_row].reset_index(drop=True)
+
+    params = template.sales_params.reindex(products['Sub-Category'])
+    sales = np.exp(rng.normal(params['mu'].to_numpy(), params['sigma'].to_numpy()))
+
+    order_numbers = pd.Series(first_order + order_of_row + 100000).astype(str)
+    years = pd.Series(date_years[order_day])
+    df = pd.DataFrame({
+        'Row ID': np.arange(first_row_id, first_row_id + n_rows),
+        'Order ID': pd.Series(prefix[order_of_row]) + '-' + years + '-' + order_numbers,
+        'Order Date': dates[order_day],
+        'Ship Date': dates[ship_day],
+        'Ship Mode': ship_mode[order_of_row],
+        'Customer ID': customers['Customer ID'].str[:2] + '-' + (customer[order_of_row] + 10000).astype(str),
+        'Customer Name': customers['Customer Name'],
+        'Segment': customers['Segment'],
+        'Country': locations['Country'],
+        'City': locations['City'],
+        'State': locations['State'],
+        'Postal Code': locations['Postal Code'],
+        'Region': locations['Region'],
+        'Product ID': products['Product ID'].str[:7] + (product + 10000000).astype(str),
+        'Category': products['Category'],
+        'Sub-Category': products['Sub-Category'],
+        'Product Name': products['Product Name'],
+        'Sales': sales.round(2),
+    })
+
+    if layout == 'sales':
+        quantity = np.minimum(rng.geometric(0.3, size=n_rows), MAX_QUANTITY)
+        discount = rng.choice(DISCOUNTS, size=n_rows, p=DISCOUNT_WEIGHTS)
+        df['Sales'] = (sales * quantity * (1 - discount)).round(2)
+        df['Quantity'] = quantity
+        df['Discount'] = discount
+        # Margins fall with the discount and turn into losses past about 20% off
+        margin = 0.25 - 1.2 * discount + rng.normal(0, 0.05, size=n_rows)
+        df['Profit'] = (df['Sales'] * margin).round(2)
+
+    df.attrs['orders'] = int(n_orders)
+    df.attrs['dirty'] = _inject_dirty(df, rng, dirty_rate, dates, order_day)
+    return df[columns]
+
+
+def write_orders(path, n_rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS, layout='raw', template=None, **kwargs):
+    """
+    Write ``n_rows`` synthetic order lines to a CSV file, ``chunk_rows`` at a time.
+
+    Keyword arguments are passed on to ``generate_orders``; customer and
+    product counts default to values for the whole file, not per chunk.
+    Returns the number of injected dirty records of each kind.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    template = template or default_template()
+    if kwargs.get('n_customers') is None:
+        kwargs['n_customers'] = max(len(template.customers), round(n_rows / template.rows_per_customer))
+    if kwargs.get('n_products') is None:
+        kwargs['n_products'] = max(len(template.products), round(n_rows / template.rows_per_product))
+
+    dirty = dict.fromkeys(DIRTY_KINDS, 0)
+    temporary = path.with_suffix('.tmp')
+    written = 0
+    first_order = 0
+    with open(temporary, 'w', newline='') as f:
+        for chunk_index, start in enumerate(range(0, n_rows, chunk_rows)):
+            size = min(chunk_rows, n_rows - start)
+            chunk = generate_orders(
+                size, seed=seed, layout=layout, template=template, chunk_index=chunk_index,
+                first_row_id=start + 1, first_order=first_order, **kwargs,
+            )
+            chunk.to_csv(f, header=written == 0, index=False)
+            written += size
+            first_order += chunk.attrs['orders']
+            for kind, count in chunk.attrs['dirty'].items():
+                dirty[kind] += count
+    # Readers never see a half-written file
+    temporary.replace(path)
+    return dirty
+
+
+def parse_row_count(text):
+    """Parse row counts written like ``10k``, ``2.5M`` or ``100000``."""
+    text = str(text).strip().replace('_', '')
+    multiplier = ROW_COUNT_SUFFIXES.get(text[-1:].lower(), 1)
+    if multiplier != 1:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+
+def _frequencies(values):
+    counts = pd.Series(values).value_counts().sort_index()
+    return counts.index.to_numpy(), (counts / counts.sum()).to_numpy()
+
+
+def _draw(rng, frequencies, size):
+    values, probabilities = frequencies
+    return values[rng.choice(len(values), size=size, p=probabilities)]
+
+
+def _skewed(rng, n_entities, size):
+    # Entity k is drawn with weight proportional to 1 / (k + 10): a long tail
+    # with a few heavy buyers / best sellers, without a Python-level loop
+    u = rng.random(size)
+    ids = np.floor(10 * ((n_entities / 10 + 1) ** u - 1)).astype(np.int64)
+    # Scatter popular ids over the id range so that ids do not encode rank
+    return (ids * 2654435761) % n_entities if n_entities > 1 else np.zeros(size, dtype=np.int64)
+
+
+def _date_table(first_day, n_days, date_format):
+    # Formatted date and year strings for every day the generator can pick
+    start = first_day - pd.Timedelta(days=DATE_MARGIN_BEFORE)
+    days = pd.date_range(start, periods=n_days + DATE_MARGIN_BEFORE + DATE_MARGIN_AFTER, freq='D')
+    return days.strftime(date_format).to_numpy(dtype=object), days.year.astype(str).to_numpy(dtype=object)
+
+
+def _inject_dirty(df, rng, dirty_rate, dates, order_day):
+    counts = dict.fromkeys(DIRTY_KINDS, 0)
+    n_rows = len(df)
+    if not dirty_rate or not n_rows:
+        return counts
+    rows = np.flatnonzero(rng.random(n_rows) < dirty_rate)
+    kinds = rng.integers(len(DIRTY_KINDS), size=len(rows))
+    for number, kind in enumerate(DIRTY_KINDS):
+        chosen = rows[kinds == number]
+        if kind == 'duplicate':
+            chosen = chosen[chosen > 0]
+        counts[kind] = len(chosen)
+        if not len(chosen):
+            continue
+        if kind == 'bad_date':
+            column = np.where(rng.random(len(chosen)) < 0.5, 'Order Date', 'Ship Date')
+            values = rng.choice(BAD_DATE_VALUES, size=len(chosen))
+            for name in ['Order Date', 'Ship Date']:
+                df.loc[chosen[column == name], name] = values[column == name]
+        elif kind == 'negative_delay':
+            shift = rng.integers(1, 6, size=len(chosen))
+            df.loc[chosen, 'Ship Date'] = dates[order_day[chosen] - shift]
+        elif kind == 'long_delay':
+            shift = rng.integers(30, 91, size=len(chosen))
+            df.loc[chosen, 'Ship Date'] = dates[order_day[chosen] + shift]
+        elif kind == 'missing_sales':
+            df.loc[chosen, 'Sales'] = np.nan
+        elif kind == 'missing_postal':
+            df.loc[chosen, 'Postal Code'] = pd.NA
+        else:
+            for column in df.columns.drop('Row ID'):
+                df.loc[chosen, column] = df[column].array[chosen - 1]
+    return counts
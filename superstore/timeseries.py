@@ -0,0 +1,418 @@
+"""
+Daily sales series with rolling, growth and running-total metrics.
+
+``SalesTimeSeries`` keeps one dense array of daily totals per dimension
+(Category, Segment, Region by default, plus the whole table): measure x
+group x day. Rows are binned to days with integer arithmetic on the
+datetime64 values, so ``update`` costs one ``np.bincount`` over the new rows
+and touches only the days they fall on. Appending a day of orders never
+re-groups the history.
+
+Everything else is derived from the daily arrays, whose size depends on the
+number of days and groups and not on the number of orders:
+
+- ``series`` rolls days up to weeks (Monday to Sunday), months or quarters
+  with ``np.add.reduceat`` over the period boundaries,
+- ``trends`` adds trailing 3- and 12-month sums, growth over the previous
+  period, year-over-year growth and running totals, per group.
+
+Calendar periods come from the proleptic Gregorian day number (H. Hinnant's
+``civil_from_days``), so no ``to_period`` or ``Timestamp`` objects are built
+per row. ``refresh_timeseries`` keeps the arrays on disk next to an
+incremental watermark (see ``superstore.incremental``) and only parses the
+rows appended to the extract since the previous run.
+
+Example::
+
+    series, info = refresh_timeseries('data/raw/superstore.csv')
+    series.trends('month', dimension='Category').tail()
+    series.trends('day', windows=(3,))          # trailing 3-month sum per day
+"""
+
+from pathlib import Path
+import json
+
+import numpy as np
+import pandas as pd
+
+from superstore.incremental import read_appended, read_complete_rows, watermark
+from superstore.loader import CACHE_DIR, cache_key
+
+FREQUENCIES = ('day', 'week', 'month', 'quarter')
+DEFAULT_DIMENSIONS = ['Category', 'Segment', 'Region']
+DEFAULT_MEASURES = ['Sales']
+
+# Trailing windows of the trend tables, in months
+DEFAULT_WINDOWS = (3, 12)
+
+# Periods back to the same period of the previous year; days are shifted by
+# calendar date instead
+YOY_LAGS = {'week': 52, 'month': 12, 'quarter': 4}
+
+NANOSECONDS_PER_DAY = 86_400 * 10 ** 9
+MISSING_DAY = np.iinfo(np.int64).min
+
+STATE_VERSION = 1
+
+
+class SalesTimeSeries:
+    """Daily totals per group that can be extended with new rows and rolled up to any period."""
+
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS, measures=DEFAULT_MEASURES, date_column='Order Date'):
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.date_column = date_column
+        self.first_day = None
+        self.n_days = 0
+        self.rows = 0
+        self.labels = {dimension: [] for dimension in self.dimensions}
+        self._codes = {dimension: {} for dimension in self.dimensions}
+        # measure x group x day; the whole-table totals are kept under None
+        self._daily = {key: np.zeros((len(self.measures), 1 if key is None else 0, 0)) for key in self._keys()}
+
+    @property
+    def days(self):
+        """The dates covered, one per day column."""
+        if self.first_day is None:
+            return pd.DatetimeIndex([])
+        return pd.DatetimeIndex(_dates(self.first_day + np.arange(self.n_days)))
+
+    def update(self, df):
+        """Add the rows of ``df``; rows without a date or a group label are left out."""
+        self.rows += len(df)
+        days = day_numbers(df[self.date_column])
+        present = days != MISSING_DAY
+        if not present.any():
+            return self
+        days = days[present]
+        low, high = int(days.min()), int(days.max())
+        self._extend_days(low, high)
+        offsets = days - low
+        width = high - low + 1
+        values = [np.nan_to_num(df[measure].to_numpy(dtype=np.float64, na_value=np.nan)[present])
+                  for measure in self.measures]
+        start = low - self.first_day
+        for key in self._keys():
+            if key is None:
+                groups = np.zeros(len(days), dtype=np.int64)
+            else:
+                groups = self._group_codes(key, df[key].to_numpy()[present])
+            keep = groups >= 0
+            n_groups = self._daily[key].shape[1]
+            flat = groups[keep] * width + offsets[keep]
+            for i, measure_values in enumerate(values):
+                added = np.bincount(flat, weights=measure_values[keep], minlength=n_groups * width)
+                self._daily[key][i, :, start:start + width] += added.reshape(n_groups, width)
+        return self
+
+    def merge(self, other):
+        """Add the totals of another series with the same dimensions and measures."""
+        if other.dimensions != self.dimensions or other.measures != self.measures:
+            raise ValueError('Only series with the same dimensions and measures can be merged')
+        self.rows += other.rows
+        if other.first_day is None:
+            return self
+        self._extend_days(other.first_day, other.first_day + other.n_days - 1)
+        start = other.first_day - self.first_day
+        for key in self._keys():
+            if key is None:
+                rows = np.zeros(1, dtype=np.int64)
+            else:
+                rows = self._group_codes(key, np.asarray(other.labels[key], dtype=object))
+            self._daily[key][:, rows, start:start + other.n_days] += other._daily[key]
+        return self
+
+    def daily(self, dimension=None, measure='Sales'):
+        """Daily totals: one row per day, one column per group (``'All'`` without a dimension)."""
+        return pd.DataFrame(self._matrix(dimension, measure).T,
+                            index=self.days, columns=self._columns(dimension))
+
+    def series(self, freq='month', dimension=None, measure='Sales'):
+        """Totals per ``freq`` period, indexed by the first day of each period."""
+        starts, values = self._rollup(self._matrix(dimension, measure), freq)
+        return pd.DataFrame(values.T, index=pd.DatetimeIndex(_dates(starts), name='Period'),
+                            columns=self._columns(dimension))
+
+    def trends(self, freq='month', dimension=None, measure='Sales', windows=DEFAULT_WINDOWS):
+        """
+        One row per period and group with the total and its trend metrics.
+
+        ``rolling_<n>m`` is the total of the ``n`` months up to the end of
+        the period (at day and week granularity, the ``n`` calendar months
+        up to that day). It is missing while the window still reaches before
+        the first day of data, like ``Series.rolling(n)``. ``growth`` is the
+        change over the previous period, ``yoy`` over the same period a year
+        earlier, and ``cumulative`` the running total.
+        """
+        daily = self._matrix(dimension, measure)
+        starts, values = self._rollup(daily, freq)
+        n_periods = len(starts)
+        columns = {measure: values}
+        for months in windows:
+            columns[f"rolling_{months}m"] = self._rolling(daily, freq, starts, values, months)
+        columns['growth'] = _growth(values, np.arange(n_periods) - 1)
+        columns['yoy'] = _growth(values, self._year_earlier(freq, starts))
+        columns['cumulative'] = np.cumsum(values, axis=1)
+
+        labels = self._columns(dimension)
+        table = pd.DataFrame({'Period': np.tile(_dates(starts), len(labels))})
+        if dimension is not None:
+            table[dimension] = np.repeat(np.asarray(labels, dtype=object), n_periods)
+        for name, matrix in columns.items():
+            table[name] = matrix.reshape(-1)
+        return table
+
+    def save(self, directory):
+        """Write the daily arrays and labels to ``directory``."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.savez(directory / 'daily.npz', **{_array_name(key): self._daily[key] for key in self._keys()})
+        (directory / 'series.json').write_text(json.dumps({
+            'dimensions': self.dimensions,
+            'measures': self.measures,
+            'date_column': self.date_column,
+            'first_day': self.first_day,
+            'n_days': self.n_days,
+            'rows': self.rows,
+            'labels': {dimension: [_label_json(label) for label in labels] for dimension, labels in self.labels.items()},
+        }, indent=2))
+
+    @classmethod
+    def load(cls, directory):
+        """Read a series written by ``save``."""
+        directory = Path(directory)
+        meta = json.loads((directory / 'series.json').read_text())
+        series = cls(meta['dimensions'], meta['measures'], meta['date_column'])
+        series.first_day, series.n_days, series.rows = meta['first_day'], meta['n_days'], meta['rows']
+        for dimension, labels in meta['labels'].items():
+            series.labels[dimension] = list(labels)
+            series._codes[dimension] = {label: code for code, label in enumerate(labels)}
+        with np.load(directory / 'daily.npz') as arrays:
+            series._daily = {key: arrays[_array_name(key)] for key in series._keys()}
+        return series
+
+    def _keys(self):
+        return [None] + self.dimensions
+
+    def _columns(self, dimension):
+        return ['All'] if dimension is None else list(self.labels[dimension])
+
+    def _extend_days(self, low, high):
+        if self.first_day is None:
+            self.first_day, self.n_days = low, high - low + 1
+            for key, daily in self._daily.items():
+                self._daily[key] = np.zeros(daily.shape[:2] + (self.n_days,))
+            return
+        before = max(0, self.first_day - low)
+        after = max(0, high - (self.first_day + self.n_days - 1))
+        if before or after:
+            for key, daily in self._daily.items():
+                self._daily[key] = np.pad(daily, ((0, 0), (0, 0), (before, after)))
+            self.first_day -= before
+            self.n_days += before + after
+
+    def _group_codes(self, dimension, values):
+        # Codes of labels seen before are kept; new labels get the next codes
+        chunk_codes, uniques = pd.factorize(values)
+        codes = self._codes[dimension]
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, label in enumerate(uniques):
+            if label not in codes:
+                codes[label] = len(codes)
+                self.labels[dimension].append(label)
+            mapping[i] = codes[label]
+        added = len(codes) - self._daily[dimension].shape[1]
+        if added:
+            self._daily[dimension] = np.pad(self._daily[dimension], ((0, 0), (0, added), (0, 0)))
+        return np.where(chunk_codes >= 0, mapping[chunk_codes] if len(mapping) else -1, -1)
+
+    def _matrix(self, dimension, measure):
+        # group x day totals of one measure
+        return self._daily[dimension][self.measures.index(measure)]
+
+    def _rollup(self, daily, freq):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unknown frequency {freq!r}; expected one of {FREQUENCIES}")
+        if self.first_day is None:
+            return np.array([], dtype=np.int64), daily[:, :0]
+        codes = period_codes(self.first_day + np.arange(self.n_days), freq)
+        # Days are consecutive, so each period is one contiguous run of columns
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+        return period_starts(codes[bounds], freq), np.add.reduceat(daily, bounds, axis=1)
+
+    def _rolling(self, daily, freq, starts, values, months):
+        if freq in ('month', 'quarter'):
+            if freq == 'quarter' and months % 3:
+                raise ValueError(f"A {months}-month window does not cover whole quarters")
+            periods = months if freq == 'month' else months // 3
+            running = np.concatenate([np.zeros((values.shape[0], 1)), np.cumsum(values, axis=1)], axis=1)
+            rolling = np.full(values.shape, np.nan)
+            rolling[:, periods - 1:] = running[:, periods:] - running[:, :-periods]
+            return rolling
+        # Days and weeks: the calendar months up to the last day of each period
+        running = np.concatenate([np.zeros((daily.shape[0], 1)), np.cumsum(daily, axis=1)], axis=1)
+        ends = np.minimum(period_starts(period_codes(starts, freq) + 1, freq) - 1, self.first_day + self.n_days - 1)
+        window_starts = shift_months(ends, -months)
+        end_offsets = ends - self.first_day + 1
+        start_offsets = window_starts - self.first_day + 1
+        complete = start_offsets >= 0
+        rolling = np.full(values.shape, np.nan)
+        rolling[:, complete] = running[:, end_offsets[complete]] - running[:, start_offsets[complete]]
+        return rolling
+
+    def _year_earlier(self, freq, starts):
+        if freq in YOY_LAGS:
+            return np.arange(len(starts)) - YOY_LAGS[freq]
+        # Days: the same calendar date a year earlier (29 February -> 28 February)
+        return shift_months(starts, -12) - self.first_day
+
+
+def day_numbers(values):
+    """Days since 1970-01-01 of datetime values, ``MISSING_DAY`` where the date is missing."""
+    nanoseconds = pd.Series(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return np.where(nanoseconds == np.iinfo(np.int64).min, MISSING_DAY,
+                    np.floor_divide(nanoseconds, NANOSECONDS_PER_DAY))
+
+
+def civil_from_days(days):
+    """``(year, month, day)`` arrays for day numbers (days since 1970-01-01)."""
+    z = np.asarray(days, dtype=np.int64) + 719468
+    era = np.floor_divide(z, 146097)
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def days_from_civil(year, month, day):
+    """Day numbers (days since 1970-01-01) of ``(year, month, day)`` arrays."""
+    year = np.asarray(year, dtype=np.int64) - (np.asarray(month) <= 2)
+    era = np.floor_divide(year, 400)
+    yoe = year - era * 400
+    mp = np.where(np.asarray(month) > 2, np.asarray(month) - 3, np.asarray(month) + 9)
+    doy = (153 * mp + 2) // 5 + np.asarray(day) - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def period_codes(days, freq):
+    """Consecutive integer codes of the ``freq`` period each day falls in."""
+    days = np.asarray(days, dtype=np.int64)
+    if freq == 'day':
+        return days
+    if freq == 'week':
+        # 1969-12-29, three days before the epoch, is the Monday of week 0
+        return np.floor_divide(days + 3, 7)
+    year, month, _ = civil_from_days(days)
+    months = (year - 1970) * 12 + month - 1
+    return months if freq == 'month' else np.floor_divide(months, 3)
+
+
+def period_starts(codes, freq):
+    """Day number of the first day of each period code."""
+    codes = np.asarray(codes, dtype=np.int64)
+    if freq == 'day':
+        return codes
+    if freq == 'week':
+        return codes * 7 - 3
+    months = codes if freq == 'month' else codes * 3
+    return days_from_civil(1970 + np.floor_divide(months, 12), np.mod(months, 12) + 1, 1)
+
+
+def shift_months(days, months):
+    """The same day of the month ``months`` later (earlier when negative), clamped to the month's end."""
+    year, month, day = civil_from_days(days)
+    total = year * 12 + month - 1 + months
+    year, month = np.floor_divide(total, 12), np.mod(total, 12) + 1
+    next_year, next_month = np.where(month == 12, year + 1, year), np.where(month == 12, 1, month + 1)
+    month_length = days_from_civil(next_year, next_month, 1) - days_from_civil(year, month, 1)
+    return days_from_civil(year, month, np.minimum(day, month_length))
+
+
+def refresh_timeseries(filepath, state_dir=None, workers=1, dimensions=DEFAULT_DIMENSIONS,
+                       measures=DEFAULT_MEASURES):
+    """
+    Bring the stored daily series up to date with ``filepath``.
+
+    Returns ``(series, info)`` like ``refresh_partials``: ``info['mode']`` is
+    ``'full'``, ``'incremental'`` or ``'unchanged'``, with the number of new
+    rows and the first and last day they touched.
+    """
+    filepath = Path(filepath)
+    if state_dir is None:
+        state_dir = CACHE_DIR / f"timeseries-{cache_key(filepath)}"
+    state_dir = Path(state_dir)
+    state, series = _load_state(state_dir, dimensions, measures)
+
+    if state is not None:
+        new_rows, new_state = read_appended(state, filepath)
+        if new_rows is not None and new_state['offset'] == state['offset']:
+            return series, {'mode': 'unchanged', 'new_rows': 0, 'first_day': None, 'last_day': None}
+        if new_rows is not None:
+            series.update(new_rows)
+            _save_state(state_dir, new_state, series)
+            return series, dict({'mode': 'incremental', 'new_rows': len(new_rows)}, **_day_range(new_rows))
+
+    # No usable state, or the file was not simply appended to: start over
+    columns = ['Row ID', 'Order Date'] + list(dimensions) + list(measures)
+    df, end = read_complete_rows(filepath, workers=workers, columns=columns)
+    series = SalesTimeSeries(dimensions, measures).update(df)
+    _save_state(state_dir, watermark(filepath, end, df), series)
+    return series, dict({'mode': 'full', 'new_rows': len(df)}, **_day_range(df))
+
+
+def _growth(values, previous):
+    # Relative change against the column ``previous`` (negative = no earlier period)
+    growth = np.full(values.shape, np.nan)
+    valid = previous >= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        base = values[:, previous[valid]]
+        growth[:, valid] = np.where(base != 0, values[:, valid] / base - 1, np.nan)
+    return growth
+
+
+def _dates(days):
+    return np.asarray(days, dtype=np.int64).astype('datetime64[D]').astype('datetime64[ns]')
+
+
+def _day_range(rows):
+    dates = rows['Order Date'].dropna()
+    if dates.empty:
+        return {'first_day': None, 'last_day': None}
+    return {'first_day': dates.min().date().isoformat(), 'last_day': dates.max().date().isoformat()}
+
+
+def _array_name(key):
+    return '__all__' if key is None else key
+
+
+def _label_json(label):
+    return label.item() if isinstance(label, np.generic) else label
+
+
+def _load_state(state_dir, dimensions, measures):
+    try:
+        state = json.loads((state_dir / 'state.json').read_text())
+        series = SalesTimeSeries.load(state_dir)
+    except (OSError, ValueError, KeyError):
+        return None, None
+    if state.get('version') != STATE_VERSION:
+        return None, None
+    if series.dimensions != list(dimensions) or series.measures != list(measures):
+        return None, None
+    return state, series
+
+
+def _save_state(state_dir, state, series):
+    # As in superstore.incremental: drop the watermark first, so a run that
+    # stops half way leads to a full rebuild instead of double-counted rows
+    state_dir.mkdir(parents=True, exist_ok=True)
+    state_path = state_dir / 'state.json'
+    if state_path.exists():
+        state_path.unlink()
+    series.save(state_dir)
+    state_path.write_text(json.dumps(dict(state, version=STATE_VERSION), indent=2))